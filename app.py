@@ -1,35 +1,40 @@
+import os
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
-from sklearn.metrics.pairwise import euclidean_distances
+from utils.datos import obtener_catalogo, informe_memoria
+from utils.tiempos import nueva_peticion, tramo
+from utils.escudos import ResolutorEscudos
 from utils.procesado import plot_predicciones_arima
-from utils.clustering import cargar_datos_cluster, generar_clusters, recomendar
-from utils.minuto import sugerencias_por_intervalo
-from utils.prediccion_resultado import entrenar_modelo, predecir_resultado, obtener_nombre_equipo, obtener_rolling_stats_equipo, obtener_url_escudo
+from utils.clustering import recomendar, top_k_similares
+from utils.minuto import sugerencias_por_intervalo, sugerencias_por_rango, intervalos_disponibles
+from utils.entidades import IndiceEntidades, obtener_indice_entidades
+from utils.prediccion_resultado import cargar_o_entrenar_modelo, predecir_resultado, obtener_nombre_equipo, obtener_rolling_stats_equipo
 
 # Set page configuration
 st.set_page_config(page_title="Análisis de Jugadores", layout="wide")
 
-# Load data and train model once
-@st.cache_data
-def load_data_and_model():
-    clubs_df = pd.read_csv("data/clubs.csv")
-    model, matches = entrenar_modelo()
-    return clubs_df, model, matches
+# Catálogo compartido: cada CSV se lee una vez por proceso y solo se recarga si cambia
+catalogo = obtener_catalogo("data")
 
-clubs_df, model, matches = load_data_and_model()
+# Tiempos por etapa de esta ejecución del script (panel opcional en la barra lateral)
+mostrar_tiempos = st.sidebar.checkbox("⏱️ Mostrar tiempos por etapa", value=False)
+registro_tiempos = nueva_peticion(activo=mostrar_tiempos)
 
-# Navigation
-tabs = st.tabs([
-    "📈 ARIMA - Series de Tiempo",
-    "👥 Jugadores Similares",
-    "⏱️ Sugerencias por Intervalo",
-    "🔮 Predicción de Resultado"
-])
+# Modelo de predicción: se carga (o entrena) la primera vez que lo pide la pestaña de predicción,
+# una vez por versión de games.csv (cache_resource: sin copias, así el índice por equipo se reutiliza)
+@st.cache_resource
+def load_model(firma_games):
+    return cargar_o_entrenar_modelo(catalogo=catalogo)
+
+# Escudos con cache en disco; ESCUDOS_OFFLINE=1 sirve solo lo ya descargado
+@st.cache_resource
+def obtener_resolutor_escudos():
+    return ResolutorEscudos(offline=os.environ.get("ESCUDOS_OFFLINE") == "1")
 
 # --- TAB 1: ARIMA ---
-with tabs[0]:
+def pestana_arima():
     st.title("📈 Predicción de Rendimiento con ARIMA")
     st.markdown("""
     Este módulo utiliza el modelo ARIMA para predecir los **goles** y **asistencias** mensuales de un jugador en los próximos 12 meses, basado en su rendimiento histórico.  
@@ -38,9 +43,9 @@ with tabs[0]:
 
     # Cargar lista de jugadores (asumiendo que existe players.csv)
     try:
-        players_df = pd.read_csv("data/players.csv")
-        player_options = {row['name']: row['player_id'] for _, row in players_df.iterrows()}
-    except FileNotFoundError:
+        indice_jugadores = obtener_indice_entidades("players", catalogo)
+        player_options, player_names = indice_jugadores.id_por_etiqueta, indice_jugadores.etiquetas
+    except (FileNotFoundError, ValueError):
         player_options = None
         st.warning("No se encontró 'data/players.csv'. Usa el ID del jugador manualmente.")
 
@@ -48,8 +53,9 @@ with tabs[0]:
     col1, col2 = st.columns([2, 1])
     with col1:
         if player_options:
-            player_name = st.selectbox("Selecciona un jugador:", options=sorted(player_options.keys()), key="arima_player")
-            player_id = player_options[player_name]
+            player_name = st.selectbox("Selecciona un jugador:", options=player_names, index=None,
+                                       placeholder="Escribe o elige un jugador", key="arima_player")
+            player_id = player_options.get(player_name)
         else:
             player_id = st.text_input("Ingresa el ID del jugador:", "", key="arima_player_id")
     with col2:
@@ -60,7 +66,8 @@ with tabs[0]:
             # Llamar a la función ARIMA con el número de años
             result = plot_predicciones_arima(
                 int(player_id) if not player_options else player_id,
-                years_back=years_back
+                years_back=years_back,
+                catalogo=catalogo
             )
             if result:
                 player_name, stats, fig_goals, fig_assists = result
@@ -73,16 +80,18 @@ with tabs[0]:
 
                 # Mostrar gráficos
                 st.subheader("Predicción de Goles")
-                st.plotly_chart(fig_goals, use_container_width=True)
+                with tramo('app.render', grafico='goles'):
+                    st.plotly_chart(fig_goals, use_container_width=True)
                 st.subheader("Predicción de Asistencias")
-                st.plotly_chart(fig_assists, use_container_width=True)
+                with tramo('app.render', grafico='asistencias'):
+                    st.plotly_chart(fig_assists, use_container_width=True)
         except Exception as e:
             st.error(f"Error al generar predicciones: {e}")
     elif player_id and not player_id.isdigit():
         st.error("Por favor, ingresa un ID numérico válido.")
 
 # --- TAB 2: Clustering ---
-with tabs[1]:
+def pestana_similares():
     st.title("👥 Jugadores Similares")
     st.markdown("""
     Este módulo utiliza clustering para identificar jugadores con un rendimiento similar al seleccionado, 
@@ -93,10 +102,8 @@ with tabs[1]:
     # Cargar lista de jugadores
     player_options = None
     try:
-        players_df = pd.read_csv("data/players.csv")
-        if not all(col in players_df.columns for col in ['player_id', 'name']):
-            raise ValueError("El archivo players.csv debe contener las columnas: player_id, name")
-        player_options = {row['name']: row['player_id'] for _, row in players_df.iterrows()}
+        indice_jugadores = obtener_indice_entidades("players", catalogo)
+        player_options, player_names = indice_jugadores.id_por_etiqueta, indice_jugadores.etiquetas
     except FileNotFoundError:
         st.error("No se encontró 'data/players.csv'. Verifica la ruta del archivo.")
     except ValueError as e:
@@ -107,10 +114,12 @@ with tabs[1]:
     if player_options:
         player_name = st.selectbox(
             "Selecciona un jugador:",
-            options=sorted(player_options.keys()),
+            options=player_names,
+            index=None,
+            placeholder="Escribe o elige un jugador",
             key="rec_player"
         )
-        player_id = player_options[player_name]
+        player_id = player_options.get(player_name)
     else:
         player_id = st.text_input("Ingresa el ID del jugador:", "", key="rec_id")
 
@@ -121,6 +130,7 @@ with tabs[1]:
         buscar_atacantes = st.checkbox("Atacantes", value=True, key="pos_attack")
     with col2:
         buscar_centrocampistas = st.checkbox("Centrocampistas", value=False, key="pos_midfield")
+    buscar_fuera_cluster = st.checkbox("Buscar también fuera del clúster del jugador", value=False, key="rec_fuera_cluster")
 
     # Determinar las posiciones seleccionadas
     tipo_posiciones = []
@@ -142,7 +152,7 @@ with tabs[1]:
                     raise ValueError("El ID del jugador debe ser numérico")
                 player_id = int(player_id)
 
-                df_stats, recomendaciones = recomendar(player_id, tipo_posiciones)
+                df_stats, recomendaciones = recomendar(player_id, tipo_posiciones, data_path=catalogo)
                 if recomendaciones is not None and not recomendaciones.empty:
                     # Mostrar estadísticas del jugador seleccionado
                     display_name = player_name if player_options else f"ID {player_id}"
@@ -153,24 +163,12 @@ with tabs[1]:
                     col2.metric("Total Asistencias", f"{int(df_stats.loc[player_id, 'assists'])}")
                     col3.metric("Partidos Jugados", f"{int(df_stats.loc[player_id, 'appearances'])}")
 
-                    # Calcular distancia euclidiana para encontrar los 10 más cercanos
-                    features = ['goals', 'assists', 'minutes_played', 'goals_per_game', 'assists_per_game']
-                    if not all(col in recomendaciones.columns for col in features):
-                        st.error(f"Faltan columnas en recomendaciones: {', '.join(features)}")
+                    # Buscar los 10 más cercanos en el índice de similitud (features escaladas)
+                    top_10_recomendaciones = top_k_similares(player_id, 10, tipo_posiciones, data_path=catalogo,
+                                                             mismo_cluster=not buscar_fuera_cluster)
+                    if top_10_recomendaciones is None or top_10_recomendaciones.empty:
+                        st.warning("No hay otros jugadores con los que comparar.")
                     else:
-                        # Extraer características del jugador seleccionado
-                        player_features = df_stats.loc[player_id, features].values.reshape(1, -1)
-                        # Extraer características de los jugadores recomendados
-                        recomendaciones_features = recomendaciones[features].values
-                        # Calcular distancias euclidianas
-                        distances = euclidean_distances(player_features, recomendaciones_features).flatten()
-                        # Añadir distancias al DataFrame
-                        recomendaciones['distance'] = distances
-                        # Excluir al jugador seleccionado (si está en recomendaciones)
-                        recomendaciones = recomendaciones[recomendaciones.index != player_id]
-                        # Ordenar por distancia y tomar los 10 más cercanos
-                        top_10_recomendaciones = recomendaciones.sort_values(by='distance').head(10)
-
                         # Mostrar tabla de los 10 jugadores más cercanos
                         st.subheader(f"Los 10 jugadores más similares a {display_name}")
                         formatted_recommendations = top_10_recomendaciones.copy()
@@ -233,7 +231,8 @@ with tabs[1]:
                                         )
                                         fig.update_traces(marker=dict(size=10), selector=dict(name='Jugadores Similares'))
                                         fig.update_traces(marker=dict(size=15, line=dict(width=2, color='DarkSlateGrey')), selector=dict(name=f"{display_name} (Seleccionado)"))
-                                        st.plotly_chart(fig, use_container_width=True)
+                                        with tramo('app.render', grafico='similares'):
+                                            st.plotly_chart(fig, use_container_width=True)
                                     else:
                                         st.warning("No hay datos suficientes para generar el gráfico.")
                                 else:
@@ -264,14 +263,23 @@ with tabs[1]:
         st.info("Por favor, selecciona un jugador para ver las recomendaciones.")
 
 # --- TAB 3: Interval Suggestions ---
-with tabs[2]:
+def pestana_intervalos():
     st.title("⏱️ Sugerencias por Intervalo de Tiempo")
-    intervalo = st.text_input("Intervalo de minutos (ej. 61-70):", "61-70")
+    tam_intervalo = st.number_input("Tamaño del intervalo (minutos):", min_value=1, max_value=45, value=10, step=1)
+    intervalo = st.text_input("Intervalo de minutos (ej. 61-70, 76-90 o segunda parte):", f"{60 // tam_intervalo * tam_intervalo + 1}-{60 // tam_intervalo * tam_intervalo + tam_intervalo}")
     if intervalo:
         try:
-            df_intervalo, X_scaled, kmeans_model = sugerencias_por_intervalo(intervalo)
+            df_intervalo, X_scaled, kmeans_model = sugerencias_por_intervalo(intervalo, data_path=catalogo, tam_intervalo=int(tam_intervalo))
+            if df_intervalo is None:
+                # Cualquier otro rango de minutos sale del cubo jugador x minuto
+                try:
+                    df_intervalo, X_scaled, kmeans_model = sugerencias_por_rango(intervalo, data_path=catalogo)
+                except ValueError:
+                    pass
             if df_intervalo is None or df_intervalo.empty:
-                st.warning("No se encontraron datos para ese intervalo.")
+                disponibles = intervalos_disponibles(catalogo, int(tam_intervalo))
+                st.warning("No se encontraron datos para ese intervalo."
+                           + (f" Intervalos con datos: {', '.join(disponibles)}" if disponibles else ""))
             else:
                 st.write("Top jugadores por goles y tarjetas:")
                 st.dataframe(df_intervalo.sort_values(by=['goals', 'cards'], ascending=False)[
@@ -293,12 +301,13 @@ with tabs[2]:
                     yaxis_title="Tarjetas (escaladas)",
                     showlegend=False
                 )
-                st.plotly_chart(fig, use_container_width=True)
+                with tramo('app.render', grafico='intervalos'):
+                    st.plotly_chart(fig, use_container_width=True)
         except Exception as e:
             st.error(f"Error en sugerencias por intervalo: {e}")
 
 # --- TAB 4: Match Prediction ---
-with tabs[3]:
+def pestana_prediccion():
     st.title("🔮 Predicción de Resultado entre Equipos")
     st.markdown("""
     Este módulo predice el resultado probable de un partido entre dos equipos basándose en sus estadísticas recientes (últimos 5 partidos).  
@@ -307,9 +316,10 @@ with tabs[3]:
 
     # Cargar lista de equipos desde clubs.csv
     try:
-        clubs_df = pd.read_csv("data/clubs.csv")
-        team_options = {row['name']: row['club_id'] for _, row in clubs_df.iterrows()}
-    except FileNotFoundError:
+        indice_clubs = obtener_indice_entidades("clubs", catalogo)
+        team_options, team_names = indice_clubs.id_por_etiqueta, indice_clubs.etiquetas
+    except (FileNotFoundError, ValueError):
+        indice_clubs = IndiceEntidades([], [])
         team_options = None
         st.error("No se encontró 'data/clubs.csv'. Usa IDs de equipos manualmente.")
 
@@ -317,18 +327,18 @@ with tabs[3]:
     col1, col2 = st.columns(2)
     with col1:
         if team_options:
-            home_team_name = st.selectbox("Selecciona el equipo local:", options=sorted(team_options.keys()), key="home_team")
+            home_team_name = st.selectbox("Selecciona el equipo local:", options=team_names, key="home_team")
             home_id = team_options[home_team_name]
         else:
             home_id = st.number_input("ID del equipo local", min_value=0, step=1, key="home_team_id")
-            home_team_name = obtener_nombre_equipo(home_id, clubs_df) if home_id > 0 else "Equipo no seleccionado"
+            home_team_name = obtener_nombre_equipo(home_id, indice_clubs) if home_id > 0 else "Equipo no seleccionado"
     with col2:
         if team_options:
-            away_team_name = st.selectbox("Selecciona el equipo visitante:", options=sorted(team_options.keys()), key="away_team")
+            away_team_name = st.selectbox("Selecciona el equipo visitante:", options=team_names, key="away_team")
             away_id = team_options[away_team_name]
         else:
             away_id = st.number_input("ID del equipo visitante", min_value=0, step=1, key="away_team_id")
-            away_team_name = obtener_nombre_equipo(away_id, clubs_df) if away_id > 0 else "Equipo no seleccionado"
+            away_team_name = obtener_nombre_equipo(away_id, indice_clubs) if away_id > 0 else "Equipo no seleccionado"
 
     # Botón para predecir
     if st.button("Predecir Resultado", key="predict_button"):
@@ -338,6 +348,10 @@ with tabs[3]:
             st.error("Por favor, selecciona ambos equipos (IDs mayores a 0).")
         else:
             try:
+                # El modelo solo se construye la primera vez que se pide una predicción
+                with st.spinner("Cargando el modelo de predicción..."):
+                    model, matches = load_model(catalogo.firma_tabla("games"))
+
                 # Obtener datos de los equipos
                 stats_home = obtener_rolling_stats_equipo(matches, home_id)
                 stats_away = obtener_rolling_stats_equipo(matches, away_id)
@@ -348,16 +362,18 @@ with tabs[3]:
                     # Estadísticas resumidas
                     last_home_stats = stats_home.iloc[-1]
                     last_away_stats = stats_away.iloc[-1]
+                    # Obtener las URLs y descargar ambos escudos a la vez
+                    url_home = indice_clubs.dato(home_id, "url")
+                    url_away = indice_clubs.dato(away_id, "url")
+                    img_home, img_away = obtener_resolutor_escudos().imagenes([url_home, url_away])
+
                     st.subheader("Estadísticas Recientes")
                     col1, col2 = st.columns(2)
                     with col1:
                         st.markdown(f"**{home_team_name} (Local)**")
-                        # Obtener la URL del escudo para el equipo local
-                        url_home = clubs_df.loc[clubs_df["club_id"] == home_id, "url"].values[0] if home_id in clubs_df["club_id"].values else None
                         if url_home:
-                            img_url_home = obtener_url_escudo(url_home)
-                            if img_url_home:
-                                st.image(img_url_home, width=100)  # Reducir a 100 píxeles
+                            if img_home:
+                                st.image(img_home, width=100)  # Reducir a 100 píxeles
                             else:
                                 st.warning(f"No se pudo cargar el escudo de {home_team_name}.")
                         else:
@@ -365,14 +381,13 @@ with tabs[3]:
                         st.metric("Promedio Goles a Favor", f"{last_home_stats['goals_for_rolling']:.2f}")
                         st.metric("Promedio Goles en Contra", f"{last_home_stats['goals_against_rolling']:.2f}")
                         st.metric("Tasa de Victoria", f"{last_home_stats['win_rate_rolling']:.2f}")
+                        if 'elo_post' in last_home_stats:
+                            st.metric("Rating Elo", f"{last_home_stats['elo_post']:.0f}")
                     with col2:
                         st.markdown(f"**{away_team_name} (Visitante)**")
-                        # Obtener la URL del escudo para el equipo visitante
-                        url_away = clubs_df.loc[clubs_df["club_id"] == away_id, "url"].values[0] if away_id in clubs_df["club_id"].values else None
                         if url_away:
-                            img_url_away = obtener_url_escudo(url_away)
-                            if img_url_away:
-                                st.image(img_url_away, width=100)  # Reducir a 100 píxeles
+                            if img_away:
+                                st.image(img_away, width=100)  # Reducir a 100 píxeles
                             else:
                                 st.warning(f"No se pudo cargar el escudo de {away_team_name}.")
                         else:
@@ -380,6 +395,8 @@ with tabs[3]:
                         st.metric("Promedio Goles a Favor", f"{last_away_stats['goals_for_rolling']:.2f}")
                         st.metric("Promedio Goles en Contra", f"{last_away_stats['goals_against_rolling']:.2f}")
                         st.metric("Tasa de Victoria", f"{last_away_stats['win_rate_rolling']:.2f}")
+                        if 'elo_post' in last_away_stats:
+                            st.metric("Rating Elo", f"{last_away_stats['elo_post']:.0f}")
 
                     # Predicción
                     resultado, prob = predecir_resultado(model, matches, home_id, away_id)
@@ -402,7 +419,8 @@ with tabs[3]:
                             template='plotly_white',
                             showlegend=True
                         )
-                        st.plotly_chart(fig_home, use_container_width=True)
+                        with tramo('app.render', grafico='local'):
+                            st.plotly_chart(fig_home, use_container_width=True)
 
                         # Gráfico para equipo visitante
                         st.subheader(f"📉 {away_team_name}")
@@ -418,6 +436,33 @@ with tabs[3]:
                             template='plotly_white',
                             showlegend=True
                         )
-                        st.plotly_chart(fig_away, use_container_width=True)
+                        with tramo('app.render', grafico='visitante'):
+                            st.plotly_chart(fig_away, use_container_width=True)
             except Exception as e:
-                st.error(f"Error al generar la predicción: {e}")
\ No newline at end of file
+                st.error(f"Error al generar la predicción: {e}")
+
+# Navegación: solo se ejecuta la pestaña elegida
+PESTANAS = {
+    "📈 ARIMA - Series de Tiempo": ('app.arima', pestana_arima),
+    "👥 Jugadores Similares": ('app.similares', pestana_similares),
+    "⏱️ Sugerencias por Intervalo": ('app.intervalos', pestana_intervalos),
+    "🔮 Predicción de Resultado": ('app.prediccion', pestana_prediccion),
+}
+pestana = st.radio("Sección", list(PESTANAS), horizontal=True, key="pestana", label_visibility="collapsed")
+nombre_tramo, mostrar_pestana = PESTANAS[pestana]
+with tramo(nombre_tramo):
+    mostrar_pestana()
+
+# --- Panel de tiempos ---
+if registro_tiempos is not None:
+    with st.sidebar.expander("Tiempos de esta ejecución", expanded=True):
+        tiempos_df = registro_tiempos.tabla()
+        if tiempos_df.empty:
+            st.write("Sin tramos medidos (todo salió de cache).")
+        else:
+            tiempos_df['tramo'] = ['\u2003' * nivel + nombre for nivel, nombre in zip(tiempos_df['nivel'], tiempos_df['tramo'])]
+            st.dataframe(tiempos_df[['tramo', 'ms']].round(1), hide_index=True)
+        memoria_df = informe_memoria()
+        if not memoria_df.empty:
+            st.caption("Memoria de las tablas cargadas (MB)")
+            st.dataframe(memoria_df[['antes_mb', 'despues_mb']].round(1))
@@ -0,0 +1,170 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+from unittest.mock import patch
+from utils.api import RUTAS, ServicioAnalisis, ErrorApi, crear_servidor
+from utils.clustering import obtener_modelo_clusters
+from utils.datos import CatalogoDatos
+from utils.procesos import en_proceso
+from utils.sintetico import generar_dataset
+
+@pytest.fixture(scope='module')
+def api(tmp_path_factory):
+    data_path = tmp_path_factory.mktemp('api')
+    generar_dataset(str(data_path), escala=0.01, semilla=2)
+    servicio = ServicioAnalisis(CatalogoDatos(str(data_path)), trabajadores=2, cola=0, trabajadores_pesados=1)
+    servidor = crear_servidor(servicio, puerto=0)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servicio, f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+    servidor.server_close()
+    servicio.cerrar()
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url) as respuesta:
+            return respuesta.status, json.loads(respuesta.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_api_rutas(api):
+    servicio, base = api
+    estado, cuerpo = _get(f"{base}/salud")
+    assert estado == 200 and cuerpo['trabajadores'] == 2 and cuerpo['trabajadores_pesados'] == 1
+
+    clubs = servicio.catalogo.tabla('clubs')['club_id'].tolist()
+    estado, cuerpo = _get(f"{base}/prediccion?home_id={clubs[0]}&away_id={clubs[1]}")
+    assert estado == 200
+    assert abs(sum(cuerpo['probabilidades'].values()) - 1) < 1e-6
+
+    intervalos = _get(f"{base}/intervalos")[1]['intervalos']
+    estado, cuerpo = _get(f"{base}/sugerencias?intervalo={intervalos[0]}")
+    assert estado == 200 and cuerpo['jugadores']
+    estado, cuerpo = _get(f"{base}/rango?rango={urllib.parse.quote('segunda parte')}")
+    assert estado == 200 and cuerpo['jugadores'][0]['minute_interval'] == '47-90'
+
+    player_id = int(servicio.catalogo.tabla('appearances')['player_id'].value_counts().index[0])
+    estado, cuerpo = _get(f"{base}/pronostico?player_id={player_id}")
+    assert estado == 200 and len(cuerpo['pronostico']['goals']) == 12
+
+    atacante = int(obtener_modelo_clusters(['Attack'], servicio.catalogo)['stats'].index[0])
+    estado, cuerpo = _get(f"{base}/recomendar?player_id={atacante}&limite=5")
+    assert estado == 200 and len(cuerpo['recomendaciones']) <= 5
+    assert atacante not in [fila['player_id'] for fila in cuerpo['recomendaciones']]
+
+    nombre = servicio.catalogo.tabla('players')['name'].iloc[0]
+    estado, cuerpo = _get(f"{base}/buscar?q={urllib.parse.quote(nombre[:5])}")
+    assert estado == 200 and cuerpo['resultados']
+
+def test_api_errores(api):
+    _, base = api
+    assert _get(f"{base}/prediccion?home_id=1")[0] == 400
+    assert _get(f"{base}/prediccion?home_id=x&away_id=2")[0] == 400
+    assert _get(f"{base}/pronostico?player_id=-1")[0] == 404
+    assert _get(f"{base}/sugerencias?intervalo=999-1000")[0] == 404
+    assert _get(f"{base}/rango?rango=80-70")[0] == 400
+    assert _get(f"{base}/no-existe")[0] == 404
+    # ValueError envuelto por el clustering ("Error en la recomendación: ..."): 400, no 500
+    estado, cuerpo = _get(f"{base}/recomendar?player_id=1&posiciones=Portero")
+    assert estado == 400 and 'Portero' in cuerpo['error']
+
+def test_api_pool_acotado(api):
+    servicio, _ = api
+    # Con cola=0 solo caben 2 tareas a la vez: la tercera se rechaza con 503
+    liberar = threading.Event()
+    ocupadas = threading.Barrier(3)
+    def bloquear(catalogo, params):
+        ocupadas.wait()
+        liberar.wait()
+        return {}
+    from utils import api as modulo
+    modulo.RUTAS['/bloquear'] = bloquear
+    try:
+        hilos = [threading.Thread(target=servicio.ejecutar, args=('/bloquear', {})) for _ in range(2)]
+        for hilo in hilos:
+            hilo.start()
+        ocupadas.wait()
+        with pytest.raises(ErrorApi) as error:
+            servicio.ejecutar('/bloquear', {})
+        assert error.value.estado == 503
+    finally:
+        liberar.set()
+        for hilo in hilos:
+            hilo.join()
+        del modulo.RUTAS['/bloquear']
+
+def test_api_rutas_pesadas_en_su_pool(api):
+    servicio, _ = api
+    # Con la ruta pesada ocupada (1 trabajador, cola=0) las ligeras siguen respondiendo
+    liberar, ocupada = threading.Event(), threading.Event()
+    def bloquear(catalogo, params):
+        ocupada.set()
+        liberar.wait()
+        return {}
+    from utils import api as modulo
+    modulo.RUTAS['/pesada'] = bloquear
+    modulo.RUTAS_PESADAS.add('/pesada')
+    hilo = threading.Thread(target=servicio.ejecutar, args=('/pesada', {}))
+    try:
+        hilo.start()
+        ocupada.wait()
+        with pytest.raises(ErrorApi) as error:
+            servicio.ejecutar('/pesada', {})
+        assert error.value.estado == 503
+        assert servicio.ejecutar('/intervalos', {})['intervalos']
+    finally:
+        liberar.set()
+        hilo.join()
+        modulo.RUTAS_PESADAS.discard('/pesada')
+        del modulo.RUTAS['/pesada']
+
+def test_api_tiempos_opcionales(api):
+    servicio, base = api
+    activos = servicio.tiempos
+    with patch('utils.api.peticion') as mock_peticion:
+        try:
+            servicio.tiempos = False
+            assert _get(f"{base}/salud")[0] == 200
+            assert not mock_peticion.called
+            servicio.tiempos = True
+            assert _get(f"{base}/salud")[0] == 200
+            assert mock_peticion.call_count == 1
+        finally:
+            servicio.tiempos = activos
+
+# Se ejecuta en el pool de procesos: intervalo (reloj de pared) y proceso en que corrió
+def _ocupar(segundos):
+    inicio = time.time()
+    time.sleep(segundos)
+    return inicio, time.time(), os.getpid()
+
+def test_api_rutas_pesadas_en_procesos(tmp_path, monkeypatch):
+    generar_dataset(str(tmp_path), escala=0.01, semilla=2)
+    servicio = ServicioAnalisis(CatalogoDatos(str(tmp_path)), trabajadores=1, cola=0, trabajadores_pesados=2)
+    monkeypatch.setitem(RUTAS, '/pesada', lambda catalogo, params: en_proceso(_ocupar, 1.0))
+    monkeypatch.setattr('utils.api.RUTAS_PESADAS', {'/pesada'})
+    # Las rutas ligeras siguen en hilos del proceso del servidor
+    monkeypatch.setitem(RUTAS, '/ligera', lambda catalogo, params: en_proceso(_ocupar, 0))
+    try:
+        resultados = [None, None]
+        def llamar(i):
+            resultados[i] = servicio.ejecutar('/pesada', {})
+        hilos = [threading.Thread(target=llamar, args=(i,)) for i in range(2)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        (ini_a, fin_a, pid_a), (ini_b, fin_b, pid_b) = resultados
+        # Cada ajuste en su propio proceso y a la vez
+        assert len({pid_a, pid_b, os.getpid()}) == 3
+        assert max(ini_a, ini_b) < min(fin_a, fin_b)
+        assert servicio.ejecutar('/ligera', {})[2] == os.getpid()
+    finally:
+        servicio.cerrar()
@@ -0,0 +1,76 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from utils.backtest import CLASES, backtest, calibracion, definir_folds, main
+from utils.datos import CatalogoDatos
+from utils.sintetico import generar_dataset
+
+@pytest.fixture(scope='module')
+def data_path(tmp_path_factory):
+    ruta = tmp_path_factory.mktemp('backtest')
+    generar_dataset(str(ruta), escala=0.01, semilla=3)
+    return str(ruta)
+
+def test_definir_folds_walk_forward():
+    temporadas = np.array([2019, 2019, 2020, 2021, 2021, 2022])
+    folds = definir_folds(temporadas, temporadas_minimas=2)
+    assert [temporada for temporada, _, _ in folds] == [2021, 2022]
+    for temporada, entrenamiento, prueba in folds:
+        assert (temporadas[entrenamiento] < temporada).all()
+        assert (temporadas[prueba] == temporada).all()
+    assert definir_folds(temporadas, temporadas_minimas=4) == []
+
+def test_calibracion():
+    prob = np.array([[0.1, 0.2, 0.7], [0.6, 0.3, 0.1]])
+    tabla, ece = calibracion(prob, np.array([1, -1]), n_bins=2)
+    assert tabla['predicciones'].sum() == prob.size
+    # Bin [0, 0.5): 0.1, 0.2, 0.3, 0.1 sin aciertos; bin [0.5, 1]: 0.7 y 0.6 acertadas
+    np.testing.assert_allclose(tabla['frecuencia'], [0.0, 1.0])
+    assert ece == pytest.approx((4 * 0.175 + 2 * 0.35) / 6)
+
+def test_backtest_paralelo_igual_que_secuencial(data_path):
+    catalogo = CatalogoDatos(data_path)
+    games_path = catalogo.ruta('games')
+    config = {'n_estimators': 20}
+    secuencial = backtest(games_path, catalogo, trabajadores=1, config=config)
+    paralelo = backtest(games_path, catalogo, trabajadores=3, config=config)
+
+    folds = paralelo['folds']
+    assert folds.index.is_monotonic_increasing and len(folds) == paralelo['global']['folds']
+    assert (folds['segundos_entrenamiento'] > 0).all() and (folds['segundos_inferencia'] > 0).all()
+    assert folds['accuracy'].between(0, 1).all()
+    assert paralelo['global']['partidos_prueba'] == folds['partidos_prueba'].sum()
+    assert paralelo['calibracion']['predicciones'].sum() == len(CLASES) * folds['partidos_prueba'].sum()
+    metricas = ['log_loss', 'accuracy', 'ece']
+    pd.testing.assert_frame_equal(secuencial['folds'][metricas], folds[metricas])
+
+def test_backtest_cli(data_path, tmp_path, capsys):
+    salida = tmp_path / 'backtest.json'
+    main([data_path, '--n-estimators', '10', '--temporadas-minimas', '8', '--json', str(salida)])
+    assert 'log_loss' in capsys.readouterr().out
+    resultado = json.loads(salida.read_text())
+    assert resultado['folds'] and resultado['global']['folds'] == len(resultado['folds'])
+
+def test_backtest_sin_fuga_con_resultados_aleatorios(tmp_path):
+    # Resultados al azar (1/3 cada uno) sin relación con los equipos: sin fuga del
+    # resultado en las features, el acierto no puede pasar de ~1/3
+    rng = np.random.default_rng(0)
+    n = 3000
+    equipos = rng.permutation(np.tile(np.arange(1, 21), (n // 10, 1)).T.ravel()).reshape(-1, 2)[:n]
+    equipos = equipos[equipos[:, 0] != equipos[:, 1]]
+    resultado = rng.integers(0, 3, len(equipos))
+    pd.DataFrame({
+        'date': pd.date_range('2015-07-01', periods=len(equipos), freq='D'),
+        'home_club_id': equipos[:, 0],
+        'away_club_id': equipos[:, 1],
+        'home_club_goals': np.where(resultado == 0, 1, 0),
+        'away_club_goals': np.where(resultado == 2, 1, 0),
+    }).to_csv(tmp_path / 'games.csv', index=False)
+
+    res = backtest(str(tmp_path / 'games.csv'), CatalogoDatos(str(tmp_path)), config={'n_estimators': 30})
+    assert res['global']['partidos_prueba'] > 1000
+    assert 0.25 < res['global']['accuracy'] < 0.40
+    assert res['global']['log_loss'] > 1.05
@@ -0,0 +1,42 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import json
+from utils import procesado
+from utils.benchmark import ejecutar_benchmark, comparar, main, medir_pipeline
+from utils.sintetico import generar_dataset
+
+def _resultado(segundos, memoria_mb, filas=None):
+    return {'filas': filas or {'games': 10}, 'pipelines': {'entrenar_modelo': {'segundos': segundos, 'memoria_mb': memoria_mb}}}
+
+def test_comparar_detecta_regresiones():
+    base = _resultado(1.0, 10.0)
+    assert not comparar(_resultado(1.1, 10.0), base)['regresion'].any()
+    assert comparar(_resultado(1.5, 10.0), base)['regresion'].all()
+    assert comparar(_resultado(1.0, 20.0), base)['regresion'].all()
+    # Con otro tamaño de datos solo se informa, sin marcar regresión
+    assert not comparar(_resultado(5.0, 10.0, {'games': 20}), base)['regresion'].any()
+    assert not comparar(_resultado(5.0, 10.0), None)['regresion'].any()
+
+def test_ejecutar_benchmark_y_linea_base(tmp_path):
+    generar_dataset(str(tmp_path / 'data'), escala=0.01)
+    resultado = ejecutar_benchmark(str(tmp_path / 'data'), ['cargar_datos_cluster', 'entrenar_modelo'], aislar=False)
+    assert resultado['filas']['games'] == 700
+    for medida in resultado['pipelines'].values():
+        assert medida['segundos'] > 0 and medida['memoria_mb'] > 0
+
+    linea_base = tmp_path / 'linea_base.json'
+    args = [str(tmp_path / 'data'), '--pipelines', 'generar_clusters', '--linea-base', str(linea_base)]
+    assert main(args + ['--guardar-linea-base']) == 0
+    assert 'generar_clusters' in json.loads(linea_base.read_text())['pipelines']
+
+def test_pasadas_sin_caches_compartidas(tmp_path, monkeypatch):
+    generar_dataset(str(tmp_path), escala=0.01)
+    ajustes = []
+    original = procesado.ajustar_pronostico
+    monkeypatch.setattr(procesado, 'ajustar_pronostico', lambda *a, **k: ajustes.append(1) or original(*a, **k))
+    medir_pipeline(str(tmp_path), 'plot_predicciones_arima', repeticiones=1)
+    por_medicion = len(ajustes)
+    assert por_medicion > 0
+    # Dos pasadas cronometradas más la de memoria: cada una vuelve a ajustar todo
+    medir_pipeline(str(tmp_path), 'plot_predicciones_arima', repeticiones=2)
+    assert len(ajustes) == por_medicion + por_medicion * 3 // 2
@@ -3,7 +3,11 @@ sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
 import pandas as pd
 import pytest
 from unittest.mock import patch
-from utils.clustering import cargar_datos_cluster, generar_clusters, recomendar
+import os
+import numpy as np
+from sklearn.metrics.pairwise import euclidean_distances
+from utils.clustering import _construir_indice_similitud, cargar_datos_cluster, generar_clusters, recomendar, construir_agregados_jugadores, obtener_indice_similitud, obtener_modelo_clusters, top_k_similares
+from utils.datos import CatalogoDatos
 
 # Datos simulados
 MOCK_PLAYERS_DATA = {
@@ -86,4 +90,81 @@ def test_recomendar_success():
         all_stats, recommendations = recomendar(player_id_ref=1, tipo_posiciones=['Attack'], data_path='data')
         assert not recommendations.empty
         assert recommendations.iloc[0]['name'] == 'Player A'
-        assert 'minutes_per_game' in recommendations.columns
\ No newline at end of file
+        assert 'minutes_per_game' in recommendations.columns
+
+@pytest.fixture
+def data_dir(tmp_path):
+    pd.DataFrame(MOCK_PLAYERS_DATA).to_csv(tmp_path / 'players.csv', index=False)
+    pd.DataFrame(MOCK_APPEARANCES_DATA).to_csv(tmp_path / 'appearances.csv', index=False)
+    return tmp_path
+
+def test_construir_agregados_jugadores_persistente(data_dir):
+    agregados = construir_agregados_jugadores(CatalogoDatos(str(data_dir)))
+    assert len(agregados) == 10
+    assert agregados.loc[1, 'goals'] == 3
+    assert agregados.loc[1, 'appearances'] == 2
+    assert 'position' in agregados.columns
+    assert len(os.listdir(data_dir / 'cache')) == 1
+
+    # Un catálogo nuevo (p. ej. tras reiniciar) lee la tabla guardada sin reagregar
+    with patch('utils.clustering._agregar_apariciones') as mock_agregar:
+        stats = cargar_datos_cluster(tipo_posiciones=['Attack'], data_path=CatalogoDatos(str(data_dir)))
+        assert not mock_agregar.called
+    assert len(stats) == 10
+    assert 'position' not in stats.columns
+
+
+def test_obtener_modelo_clusters_reutiliza_el_modelo(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    with patch('utils.clustering.generar_clusters', wraps=generar_clusters) as mock_generar:
+        recomendar(player_id_ref=1, tipo_posiciones=['Attack'], data_path=catalogo)
+        all_stats, recommendations = recomendar(player_id_ref=2, tipo_posiciones=['Attack'], data_path=catalogo)
+        # Tras un reinicio se carga desde disco
+        registro = obtener_modelo_clusters(['Attack'], CatalogoDatos(str(data_dir)))
+        assert mock_generar.call_count == 1
+    assert not recommendations.empty
+    assert 'cluster' in registro['stats'].columns
+    labels = registro['modelo'].predict(registro['stats'][['goals', 'assists', 'minutes_played', 'goals_per_game', 'assists_per_game']])
+    assert list(labels) == list(registro['stats']['cluster'])
+
+def test_recomendar_no_expone_la_tabla_del_modelo(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    all_stats, recommendations = recomendar(player_id_ref=1, tipo_posiciones=['Attack'], data_path=catalogo)
+    all_stats['cluster'] = -1
+    recommendations['goals'] = -1
+    stats = obtener_modelo_clusters(['Attack'], catalogo)['stats']
+    assert (stats['cluster'] >= 0).all() and (stats['goals'] >= 0).all()
+
+def test_top_k_similares_coincide_con_fuerza_bruta(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    registro = obtener_modelo_clusters(['Attack'], catalogo)
+    stats = registro['stats']
+    X = registro['modelo'].named_steps['scaler'].transform(stats[['goals', 'assists', 'minutes_played', 'goals_per_game', 'assists_per_game']])
+
+    similares = top_k_similares(1, k=3, tipo_posiciones=['Attack'], data_path=catalogo, mismo_cluster=False)
+    assert len(similares) == 3
+    assert 1 not in similares.index
+    distancias = np.sort(np.delete(euclidean_distances(X[:1], X).ravel(), 0))[:3]
+    np.testing.assert_allclose(similares['distance'].to_numpy(), distancias)
+
+    en_cluster = top_k_similares(1, k=10, tipo_posiciones=['Attack'], data_path=catalogo)
+    assert (stats.loc[en_cluster.index, 'cluster'] == stats.loc[1, 'cluster']).all()
+    assert top_k_similares(999, data_path=catalogo) is None
+
+def test_indice_similitud_sigue_la_configuracion_del_registro(data_dir, monkeypatch):
+    with patch('utils.clustering._construir_indice_similitud', wraps=_construir_indice_similitud) as mock_construir:
+        obtener_indice_similitud(['Attack'], CatalogoDatos(str(data_dir)))
+        obtener_indice_similitud(['Attack'], CatalogoDatos(str(data_dir)))
+        assert mock_construir.call_count == 1
+        # Con otra configuración del clustering se rehace con el registro (también tras reiniciar)
+        monkeypatch.setattr('utils.clustering.K_CANDIDATOS', range(2, 5))
+        obtener_indice_similitud(['Attack'], CatalogoDatos(str(data_dir)))
+        assert mock_construir.call_count == 2
+
+def test_registro_reelige_k_si_cambian_los_candidatos(data_dir, monkeypatch):
+    anterior = obtener_modelo_clusters(['Attack'], CatalogoDatos(str(data_dir)))['modelo'].named_steps['kmeans']
+    assert anterior.n_clusters != 2
+    # Mismos datos, otros candidatos: el registro se rehace sin partir del k anterior
+    monkeypatch.setattr('utils.clustering.K_CANDIDATOS', range(2, 3))
+    kmeans = obtener_modelo_clusters(['Attack'], CatalogoDatos(str(data_dir)))['modelo'].named_steps['kmeans']
+    assert kmeans.n_clusters == 2 and list(kmeans.puntuaciones_k_) == [2]
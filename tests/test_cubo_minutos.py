@@ -0,0 +1,108 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from utils.cubo_minutos import CuboMinutos, obtener_cubo_minutos, parsear_rango
+from utils.datos import CatalogoDatos
+from utils.minuto import sugerencias_por_intervalo, sugerencias_por_rango
+from utils.sintetico import generar_dataset
+
+EVENTOS = pd.DataFrame({
+    'player_id': [1, 1, 1, 2, 2, 3, 3],
+    'type': ['Goals', 'Goals', 'Cards', 'Goals', 'Substitutions', 'Cards', 'Goals'],
+    # 0 cuenta como minuto 1; 95 (añadido) se pliega en el 90
+    'minute': [0, 60, 75, 95, 46, 89, None],
+})
+
+def test_parsear_rango():
+    assert parsear_rango('76-90') == (76, 90)
+    assert parsear_rango(" 76' - 90' ") == (76, 90)
+    assert parsear_rango('Segunda parte') == (47, 90)
+    assert parsear_rango('first half') == (1, 46)
+    assert parsear_rango('90') == (90, 90)
+    for texto in ['80-70', '0-10', '85-95', 'descanso']:
+        with pytest.raises(ValueError):
+            parsear_rango(texto)
+
+def test_cubo_rangos():
+    cubo = CuboMinutos.desde_eventos(EVENTOS)
+    assert list(cubo.player_ids) == [1, 2, 3]
+    assert cubo.tipos == ['Cards', 'Goals', 'Substitutions']
+
+    total = cubo.rango(1, 90, ['Goals', 'Cards'])
+    assert total.loc[1].tolist() == [2, 1]
+    assert total.loc[2].tolist() == [1, 0]
+    assert total.loc[3].tolist() == [0, 1]
+    assert cubo.rango(1, 1, ['Goals']).loc[1, 'goals'] == 1
+    assert cubo.rango(90, 90, ['Goals']).loc[2, 'goals'] == 1
+    assert cubo.rango(46, 90)['substitutions'].sum() == 1
+    # Tipos que no están en el cubo: columna a cero
+    assert cubo.rango(1, 90, ['Shootout'])['shootout'].sum() == 0
+
+    # Las sumas acumuladas no se guardan: se rehacen al cargar
+    copia = pickle.loads(pickle.dumps(cubo))
+    pd.testing.assert_frame_equal(copia.rango(30, 80), cubo.rango(30, 80))
+
+def test_partes_con_nombre_en_el_limite():
+    # Un gol en el 45 (o en el añadido de la primera parte, registrado como 45) es de la
+    # primera parte; el del 46, de la segunda; el añadido final (95) se pliega en el 90
+    eventos = pd.DataFrame({'player_id': [1] * 5, 'type': ['Goals'] * 5, 'minute': [1, 45, 46, 90, 95]})
+    cubo = CuboMinutos.desde_eventos(eventos)
+    assert cubo.rango(*parsear_rango('primera parte'), ['Goals']).loc[1, 'goals'] == 2
+    assert cubo.rango(*parsear_rango('segunda parte'), ['Goals']).loc[1, 'goals'] == 3
+    assert cubo.rango(*parsear_rango('partido'), ['Goals']).loc[1, 'goals'] == 5
+
+def test_cubo_con_eventos_igual_que_completo():
+    nuevos = pd.DataFrame({'player_id': [1, 4], 'type': ['Goals', 'Shootout'], 'minute': [10, 90]})
+    completo = CuboMinutos.desde_eventos(pd.concat([EVENTOS, nuevos]))
+    previo = CuboMinutos.desde_eventos(EVENTOS)
+    # Solo se calculan las sumas acumuladas de los tipos consultados
+    previo.rango(1, 90, ['Goals', 'Cards'])
+    assert sorted(previo._acumulados) == ['Cards', 'Goals']
+    incremental = previo.con_eventos(nuevos)
+    assert list(incremental.player_ids) == list(completo.player_ids)
+    assert incremental.tipos == completo.tipos
+    assert (incremental.conteos != completo.conteos).nnz == 0
+    # Las acumuladas heredadas (actualizadas en las filas tocadas) coinciden con las rehechas
+    assert sorted(incremental._acumulados) == ['Cards', 'Goals']
+    for desde, hasta in [(1, 90), (1, 10), (11, 90), (90, 90)]:
+        pd.testing.assert_frame_equal(incremental.rango(desde, hasta), completo.rango(desde, hasta))
+
+def test_sugerencias_por_rango(tmp_path):
+    generar_dataset(str(tmp_path), escala=0.01, semilla=4)
+    catalogo = CatalogoDatos(str(tmp_path))
+    assert obtener_cubo_minutos(catalogo) is obtener_cubo_minutos(catalogo)
+
+    # Un intervalo fijo sale igual desde el cubo
+    fijo, _, _ = sugerencias_por_intervalo('61-70', catalogo)
+    rango, X_scaled, kmeans = sugerencias_por_rango('61-70', catalogo)
+    columnas = ['goals', 'cards']
+    pd.testing.assert_frame_equal(fijo.set_index('player_id')[columnas].sort_index(),
+                                  rango.set_index('player_id')[columnas].sort_index(),
+                                  check_dtype=False, check_index_type=False)
+
+    segunda, X_scaled, kmeans = sugerencias_por_rango('segunda parte', catalogo)
+    assert (segunda['minute_interval'] == '47-90').all()
+    assert len(X_scaled) == len(segunda) and np.array_equal(segunda['cluster'], kmeans.labels_)
+    events = catalogo.tabla('game_events')
+    assert segunda['goals'].sum() == ((events['type'] == 'Goals') & (events['minute'] >= 46)).sum()
+    assert sugerencias_por_rango('90', catalogo)[0] is not None
+
+def test_sugerencias_por_rango_cache_acotada(tmp_path, monkeypatch):
+    generar_dataset(str(tmp_path), escala=0.01, semilla=4)
+    catalogo = CatalogoDatos(str(tmp_path))
+    monkeypatch.setattr('utils.minuto.MAX_RANGOS_GUARDADOS', 2)
+    # Mismo rango escrito de otra forma: misma clave
+    sugerencias_por_rango('47-90', catalogo)
+    sugerencias_por_rango("47' - 90'", catalogo)
+    sugerencias_por_rango('segunda parte', catalogo)
+    assert catalogo.claves_derivadas('sugerencias_rango_', 'joblib') == ['sugerencias_rango_47_90']
+
+    sugerencias_por_rango('1-45', catalogo)
+    sugerencias_por_rango('47-90', catalogo)
+    sugerencias_por_rango('61-70', catalogo)
+    # Se descarta el usado hace más tiempo (1-45), también de data/cache
+    assert catalogo.claves_derivadas('sugerencias_rango_', 'joblib') == ['sugerencias_rango_47_90', 'sugerencias_rango_61_70']
+    assert not list((tmp_path / 'cache').glob('sugerencias_rango_1_45-*'))
@@ -0,0 +1,176 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import os
+import time
+import pandas as pd
+import pytest
+from unittest.mock import patch
+import numpy as np
+from utils.datos import (leer_tabla, leer_tabla_por_bloques, ingestar_csv, ruta_columnar, CatalogoDatos, obtener_catalogo,
+                         aplicar_esquema, informe_memoria)
+from utils.clustering import cargar_datos_cluster, _agregar_apariciones
+from utils.minuto import estadisticas_por_intervalo, _contar_por_intervalo_por_bloques, _con_jugadores
+from utils.procesado import cargar_series_mensuales
+
+# Datos simulados
+MOCK_GAMES_DATA = {
+    'date': ['2024-01-01', '2024-02-01', '2024-03-01'],
+    'home_club_id': [1, 2, 1],
+    'away_club_id': [2, 1, 3],
+    'home_club_goals': [2, 1, 3],
+    'away_club_goals': [1, 1, 0],
+    'stadium': ['A', 'B', 'A']
+}
+
+@pytest.fixture
+def data_dir(tmp_path):
+    pd.DataFrame(MOCK_GAMES_DATA).to_csv(tmp_path / 'games.csv', index=False)
+    return tmp_path
+
+def test_leer_tabla_csv_fallback(data_dir):
+    df = leer_tabla(str(data_dir / 'games.csv'), ['date', 'home_club_id', 'no_existe'], parse_dates=['date'])
+    assert list(df.columns) == ['date', 'home_club_id']
+    assert pd.api.types.is_datetime64_any_dtype(df['date'])
+
+def test_ingestar_csv_y_leer_parquet(data_dir):
+    convertidas = ingestar_csv(str(data_dir))
+    assert convertidas == ['games']
+    assert os.path.exists(ruta_columnar(str(data_dir / 'games.csv')))
+    # Una segunda ingesta no rehace nada
+    assert ingestar_csv(str(data_dir)) == []
+
+    os.remove(data_dir / 'games.csv')
+    df = leer_tabla(str(data_dir / 'games.csv'), ['home_club_id', 'home_club_goals'])
+    assert list(df.columns) == ['home_club_id', 'home_club_goals']
+    assert df['home_club_goals'].sum() == 6
+
+def test_leer_tabla_ignora_parquet_desactualizado(data_dir):
+    ingestar_csv(str(data_dir))
+    time.sleep(0.01)
+    games = pd.DataFrame(MOCK_GAMES_DATA)
+    games.loc[0, 'home_club_goals'] = 10
+    games.to_csv(data_dir / 'games.csv', index=False)
+    os.utime(data_dir / 'games.csv', (time.time() + 5, time.time() + 5))
+    df = leer_tabla(str(data_dir / 'games.csv'), ['home_club_goals'])
+    assert df['home_club_goals'].sum() == 14
+
+def test_leer_tabla_sin_archivos(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        leer_tabla(str(tmp_path / 'games.csv'))
+
+def test_catalogo_entrega_la_misma_tabla(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    primera = catalogo.tabla('games', ['home_club_id'])
+    with patch('pandas.read_csv') as mock_read_csv:
+        segunda = catalogo.tabla('games', ['home_club_id'])
+        assert not mock_read_csv.called
+    assert segunda is primera
+
+def test_catalogo_no_modifica_la_tabla_entregada(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    sin_fechas = catalogo.tabla('games')
+    assert sin_fechas['date'].dtype == object
+    # Pedir fechas en un acierto de cache no cambia la tabla que ya se entregó
+    con_fechas = catalogo.tabla('games', parse_dates=['date'])
+    assert sin_fechas['date'].dtype == object
+    assert pd.api.types.is_datetime64_any_dtype(con_fechas['date'])
+    # La conversión se hace una vez: después se entrega la tabla ya convertida
+    assert catalogo.tabla('games', parse_dates=['date']) is con_fechas
+    assert catalogo.tabla('games') is con_fechas
+
+def test_catalogo_amplia_columnas(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    catalogo.tabla('games', ['home_club_id'])
+    df = catalogo.tabla('games', ['away_club_id'])
+    assert {'home_club_id', 'away_club_id'} <= set(df.columns)
+
+def test_catalogo_recarga_si_cambia_el_archivo(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    assert catalogo.tabla('games')['home_club_goals'].sum() == 6
+    games = pd.DataFrame(MOCK_GAMES_DATA)
+    games.loc[0, 'home_club_goals'] = 10
+    games.to_csv(data_dir / 'games.csv', index=False)
+    assert catalogo.tabla('games')['home_club_goals'].sum() == 14
+
+def test_obtener_catalogo_compartido(tmp_path):
+    catalogo = obtener_catalogo(str(tmp_path))
+    assert obtener_catalogo(str(tmp_path)) is catalogo
+    assert obtener_catalogo(catalogo) is catalogo
+
+def test_cargar_datos_cluster_con_catalogo(tmp_path):
+    pd.DataFrame({'player_id': [1, 2], 'name': ['Player A', 'Player B'], 'position': ['Attack', 'Defense']}).to_csv(tmp_path / 'players.csv', index=False)
+    pd.DataFrame({
+        'player_id': [1, 1, 2], 'player_name': ['Player A', 'Player A', 'Player B'],
+        'goals': [1, 2, 0], 'assists': [0, 1, 1], 'minutes_played': [90, 90, 45],
+        'game_id': [100, 101, 100], 'date': ['2024-01-01', '2024-01-08', '2024-01-01']
+    }).to_csv(tmp_path / 'appearances.csv', index=False)
+    stats = cargar_datos_cluster(tipo_posiciones=['Attack'], data_path=CatalogoDatos(str(tmp_path)))
+    assert list(stats.index) == [1]
+    assert stats.loc[1, 'goals'] == 3
+    assert stats.loc[1, 'appearances'] == 2
+
+@pytest.fixture
+def data_grande(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 5000
+    # Como en appearances real: una fila por (jugador, partido)
+    pares = rng.choice(40 * 300, n, replace=False)
+    player_id, game_id = pares // 300, pares % 300
+    pd.DataFrame({'player_id': np.arange(40), 'name': [f'Player {i}' for i in range(40)],
+                  'position': ['Attack', 'Midfield'] * 20}).to_csv(tmp_path / 'players.csv', index=False)
+    pd.DataFrame({'player_id': player_id, 'player_name': [f'Player {i}' for i in player_id],
+                  'game_id': game_id, 'goals': rng.poisson(0.3, n), 'assists': rng.poisson(0.2, n),
+                  'minutes_played': rng.integers(1, 91, n),
+                  'date': pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 700, n), unit='D')}
+                 ).to_csv(tmp_path / 'appearances.csv', index=False)
+    pd.DataFrame({'type': rng.choice(['Goals', 'Cards', 'Substitutions'], n), 'player_id': player_id,
+                  'minute': rng.integers(0, 100, n)}).to_csv(tmp_path / 'game_events.csv', index=False)
+    return tmp_path
+
+def test_leer_tabla_por_bloques(data_grande):
+    bloques = list(leer_tabla_por_bloques(str(data_grande / 'appearances.csv'), ['player_id', 'goals'], filas_bloque=1200))
+    assert [len(b) for b in bloques] == [1200, 1200, 1200, 1200, 200]
+    assert list(bloques[0].columns) == ['player_id', 'goals']
+
+    ingestar_csv(str(data_grande), ['appearances'])
+    os.remove(data_grande / 'appearances.csv')
+    bloques = list(leer_tabla_por_bloques(str(data_grande / 'appearances.csv'), ['date'], ['date'], filas_bloque=2000))
+    assert sum(len(b) for b in bloques) == 5000
+    assert pd.api.types.is_datetime64_any_dtype(bloques[0]['date'])
+
+def test_agregacion_por_bloques_igual_que_en_memoria(data_grande):
+    en_memoria = CatalogoDatos(str(data_grande))
+    por_bloques = CatalogoDatos(str(data_grande), memoria_maxima=1)  # Bloques mínimos: 5 bloques
+    assert por_bloques.por_bloques and not en_memoria.por_bloques
+
+    with patch('utils.clustering._MAX_PARCIALES', 2), patch('utils.minuto._MAX_PARCIALES', 2):
+        pd.testing.assert_frame_equal(_agregar_apariciones(en_memoria), _agregar_apariciones(por_bloques))
+        pd.testing.assert_frame_equal(estadisticas_por_intervalo(en_memoria.tabla('players'), en_memoria.tabla('game_events')),
+                                      _con_jugadores(_contar_por_intervalo_por_bloques(por_bloques), por_bloques.tabla('players')))
+    pd.testing.assert_frame_equal(cargar_series_mensuales(en_memoria), cargar_series_mensuales(por_bloques))
+    pd.testing.assert_frame_equal(en_memoria.filas('appearances', 'player_id', 7).reset_index(drop=True),
+                                  por_bloques.filas('appearances', 'player_id', 7).reset_index(drop=True))
+
+def test_obtener_catalogo_memoria_desde_entorno(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATOS_MEMORIA_MAXIMA_MB', '64')
+    assert obtener_catalogo(str(tmp_path / 'otro')).memoria_maxima == 64 * 2 ** 20
+
+def test_esquema_compacto(tmp_path):
+    pd.DataFrame({'player_id': [1, 2, 3], 'game_id': [10, 11, 3_000_000_000], 'goals': [0, 1, 2],
+                  'assists': [0.0, None, 1.0], 'minutes_played': [90.0, 45.0, 1.0],
+                  'player_name': ['Player A', 'Player A', 'Player B'], 'date': ['2024-01-01'] * 3}).to_csv(tmp_path / 'appearances.csv', index=False)
+    df = leer_tabla(str(tmp_path / 'appearances.csv'), parse_dates=['date'])
+    assert df['player_id'].dtype == 'int32' and df['goals'].dtype == 'int8' and df['minutes_played'].dtype == 'int16'
+    assert isinstance(df['player_name'].dtype, pd.CategoricalDtype)
+    # Valores que no caben o con nulos se quedan como se leyeron
+    assert df['game_id'].dtype == 'int64' and df['assists'].dtype == 'float64'
+
+    assert informe_memoria().loc['appearances', 'filas'] == 3
+    pd.concat([pd.read_csv(tmp_path / 'appearances.csv')] * 100).to_csv(tmp_path / 'appearances.csv', index=False)
+    leer_tabla(str(tmp_path / 'appearances.csv'))
+    informe = informe_memoria().loc['appearances']
+    assert informe['filas'] == 300 and informe['despues_mb'] < informe['antes_mb']
+
+def test_aplicar_esquema_tabla_desconocida():
+    df = pd.DataFrame({'player_id': [1, 2]})
+    assert aplicar_esquema(df, 'otra')['player_id'].dtype == 'int64'
@@ -0,0 +1,46 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import pandas as pd
+import pytest
+from utils.datos import CatalogoDatos
+from utils.entidades import IndiceEntidades, obtener_indice_entidades, normalizar
+from utils.prediccion_resultado import obtener_nombre_equipo
+
+MOCK_PLAYERS_DATA = {
+    'player_id': [1, 2, 3, 4],
+    'name': ['Kylian Mbappé', 'Danilo', 'Danilo', 'Lionel Messi'],
+}
+
+def test_indice_nombres_repetidos():
+    indice = IndiceEntidades(MOCK_PLAYERS_DATA['player_id'], MOCK_PLAYERS_DATA['name'])
+    assert indice.nombre(4) == 'Lionel Messi'
+    assert indice.nombre(99, 'Desconocido') == 'Desconocido'
+    assert indice.ids('Danilo') == [2, 3]
+    # Las etiquetas de los selectores son únicas y están ordenadas
+    assert indice.etiquetas == ['Danilo (2)', 'Danilo (3)', 'Kylian Mbappé', 'Lionel Messi']
+    assert indice.id_por_etiqueta['Danilo (3)'] == 3
+
+def test_indice_busqueda():
+    indice = IndiceEntidades(MOCK_PLAYERS_DATA['player_id'], MOCK_PLAYERS_DATA['name'])
+    assert normalizar('  Kylian   MBAPPÉ ') == 'kylian mbappe'
+    # Prefijo del nombre o de cualquier palabra, sin tildes ni mayúsculas
+    assert indice.buscar_prefijo('dan') == [2, 3]
+    assert indice.buscar_prefijo('MBAP') == [1]
+    assert indice.buscar_prefijo('zz') == []
+    # Aproximada: con una errata
+    assert indice.buscar('Lionel Mesi')[0] == 4
+    assert indice.buscar('Mbape', limite=1) == [1]
+
+def test_obtener_indice_entidades_cache(tmp_path):
+    pd.DataFrame({'club_id': [10, 20], 'name': ['Club A', 'Club B'], 'url': ['http://a', None]}).to_csv(tmp_path / 'clubs.csv', index=False)
+    catalogo = CatalogoDatos(str(tmp_path))
+    indice = obtener_indice_entidades('clubs', catalogo)
+    assert obtener_indice_entidades('clubs', catalogo) is indice
+    assert indice.dato(10, 'url') == 'http://a'
+    assert indice.dato(20, 'url') is None
+    assert obtener_nombre_equipo(20, indice) == 'Club B'
+    assert obtener_nombre_equipo(30, indice) == 'Equipo 30'
+    # Un catálogo nuevo lee el índice guardado en data/cache
+    assert list(tmp_path.joinpath('cache').glob('indice_clubs-*.joblib'))
+    with pytest.raises(ValueError):
+        obtener_indice_entidades('games', catalogo)
@@ -0,0 +1,75 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from utils.escudos import ResolutorEscudos
+
+# Servidor HTTP local que imita las páginas de club y las imágenes de escudos
+class StubTransfermarkt(BaseHTTPRequestHandler):
+    peticiones = []
+
+    def do_GET(self):
+        StubTransfermarkt.peticiones.append(self.path)
+        host = f"http://127.0.0.1:{self.server.server_address[1]}"
+        if self.path.startswith('/club/'):
+            club = self.path.rsplit('/', 1)[-1]
+            cuerpo = f'<html><img class="tiny_wappen" src="{host}/images/head/{club}.png"></html>'.encode()
+            tipo = 'text/html'
+        elif self.path.startswith('/images/big/'):
+            cuerpo = b'PNG-' + self.path.encode()
+            tipo = 'image/png'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def servidor():
+    StubTransfermarkt.peticiones = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubTransfermarkt)
+    hilo = threading.Thread(target=httpd.serve_forever, daemon=True)
+    hilo.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_imagenes_concurrentes_y_cache(servidor, tmp_path):
+    resolutor = ResolutorEscudos(cache_path=str(tmp_path), timeout=2)
+    home, away = resolutor.imagenes([f"{servidor}/club/1", f"{servidor}/club/2"])
+    assert home == b'PNG-/images/big/1.png'
+    assert away == b'PNG-/images/big/2.png'
+    assert len(StubTransfermarkt.peticiones) == 4
+
+    # Segunda consulta: todo sale de la cache
+    assert resolutor.imagen(f"{servidor}/club/1") == home
+    assert len(StubTransfermarkt.peticiones) == 4
+    resolutor.cerrar()
+
+def test_cache_persistente_y_offline(servidor, tmp_path):
+    ResolutorEscudos(cache_path=str(tmp_path), timeout=2).imagen(f"{servidor}/club/7")
+    peticiones = len(StubTransfermarkt.peticiones)
+
+    offline = ResolutorEscudos(cache_path=str(tmp_path), ttl=0, offline=True)
+    assert offline.imagen(f"{servidor}/club/7") == b'PNG-/images/big/7.png'
+    assert offline.imagen(f"{servidor}/club/8") is None
+    assert len(StubTransfermarkt.peticiones) == peticiones
+
+def test_ttl_caducado_vuelve_a_descargar(servidor, tmp_path):
+    resolutor = ResolutorEscudos(cache_path=str(tmp_path), ttl=0, timeout=2)
+    resolutor.imagen(f"{servidor}/club/3")
+    resolutor.imagen(f"{servidor}/club/3")
+    assert StubTransfermarkt.peticiones.count('/club/3') == 2
+
+def test_error_http_devuelve_none(servidor, tmp_path):
+    resolutor = ResolutorEscudos(cache_path=str(tmp_path), timeout=2)
+    assert resolutor.imagen(f"{servidor}/otra/1") is None
+    assert resolutor.imagen(None) is None
@@ -0,0 +1,143 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from utils.clustering import construir_agregados_jugadores
+from utils.cubo_minutos import obtener_cubo_minutos
+from utils.datos import CatalogoDatos, ingestar_csv, partes_columnar, MAX_PARTES_COLUMNAR
+from utils.incremental import aplicar_delta
+from utils.minuto import obtener_sugerencias
+from utils.prediccion_resultado import cargar_o_entrenar_modelo, leer_artefacto_modelo
+from utils.sintetico import generar_dataset
+
+TABLAS = ['appearances', 'game_events', 'games']
+
+# Dataset completo y copia sin los partidos más recientes (que forman el delta)
+@pytest.fixture
+def datos(tmp_path):
+    completo, base = tmp_path / 'completo', tmp_path / 'base'
+    generar_dataset(str(completo), escala=0.01, semilla=5)
+    shutil.copytree(completo, base)
+    games = pd.read_csv(completo / 'games.csv', parse_dates=['date'])
+    nuevos = games.loc[games['date'] > games['date'].quantile(0.95), 'game_id']
+    deltas = {}
+    for tabla in TABLAS:
+        df = pd.read_csv(completo / f'{tabla}.csv', low_memory=False)
+        es_nuevo = df['game_id'].isin(nuevos)
+        df[~es_nuevo].to_csv(base / f'{tabla}.csv', index=False)
+        deltas[tabla] = df[es_nuevo]
+    return str(completo), str(base), deltas
+
+def test_anexar_actualiza_csv_y_memoria(tmp_path):
+    generar_dataset(str(tmp_path), escala=0.01, semilla=1)
+    catalogo = CatalogoDatos(str(tmp_path))
+    games = catalogo.tabla('games')
+    nuevas = games.tail(3).assign(game_id=games['game_id'].max() + np.arange(1, 4))
+
+    assert catalogo.anexar('games', nuevas) == 3
+    assert catalogo.anexar('games', nuevas.iloc[:0]) == 0
+    en_memoria = catalogo.tabla('games')
+    assert len(en_memoria) == len(games) + 3
+    assert en_memoria['date'].dtype == games['date'].dtype
+    releida = CatalogoDatos(str(tmp_path)).tabla('games')
+    pd.testing.assert_frame_equal(en_memoria, releida, check_dtype=False)
+
+def test_anexar_mantiene_parquet_al_dia(tmp_path):
+    generar_dataset(str(tmp_path), escala=0.01, semilla=1)
+    ingestar_csv(str(tmp_path), ['games'])
+    catalogo = CatalogoDatos(str(tmp_path))
+    games = catalogo.tabla('games')
+    assert isinstance(games['competition_id'].dtype, pd.CategoricalDtype)
+    nuevas = games.tail(2).assign(game_id=games['game_id'].max() + np.arange(1, 3), competition_id=['NUEVA', 'NUEVA'])
+    catalogo.anexar('games', nuevas)
+    assert len(partes_columnar(str(tmp_path / 'games.parquet'))) == 2
+    # Un valor que no cabe en el esquema del .parquet (int8): se regenera desde el .csv
+    catalogo.anexar('games', nuevas.tail(1).assign(game_id=games['game_id'].max() + 3, home_club_goals=300))
+
+    assert os.path.isfile(tmp_path / 'games.parquet')
+    assert os.path.getmtime(tmp_path / 'games.parquet') >= os.path.getmtime(tmp_path / 'games.csv')
+    en_memoria = catalogo.tabla('games')
+    assert len(en_memoria) == len(games) + 3 and en_memoria['home_club_goals'].iloc[-1] == 300
+    # Las filas nuevas no pasan las columnas category a object
+    assert isinstance(en_memoria['competition_id'].dtype, pd.CategoricalDtype)
+    desde_parquet = pd.read_parquet(tmp_path / 'games.parquet')
+    pd.testing.assert_frame_equal(en_memoria, desde_parquet[en_memoria.columns], check_dtype=False, check_categorical=False)
+
+def test_anexar_escribe_partes_sin_reescribir_y_compacta(tmp_path):
+    generar_dataset(str(tmp_path), escala=0.01, semilla=1)
+    ingestar_csv(str(tmp_path), ['games'])
+    parquet_path = str(tmp_path / 'games.parquet')
+    catalogo = CatalogoDatos(str(tmp_path))
+    games = catalogo.tabla('games')
+    siguiente = games['game_id'].max() + 1
+
+    for i in range(MAX_PARTES_COLUMNAR - 2):
+        catalogo.anexar('games', games.tail(1).assign(game_id=siguiente + i))
+    partes = partes_columnar(parquet_path)
+    assert len(partes) == MAX_PARTES_COLUMNAR - 1
+    estados = {parte: os.stat(parte).st_mtime_ns for parte in partes}
+    catalogo.anexar('games', games.tail(1).assign(game_id=siguiente + MAX_PARTES_COLUMNAR - 2))
+    # Las partes anteriores no se tocan, solo se añade la del delta
+    assert all(os.stat(parte).st_mtime_ns == mtime for parte, mtime in estados.items())
+    assert len(partes_columnar(parquet_path)) == MAX_PARTES_COLUMNAR
+
+    # Pasado el máximo, la anexión compacta todo en una parte
+    catalogo.anexar('games', games.tail(1).assign(game_id=siguiente + MAX_PARTES_COLUMNAR - 1))
+    assert len(partes_columnar(parquet_path)) == 1
+    releida = CatalogoDatos(str(tmp_path)).tabla('games')
+    assert len(releida) == len(games) + MAX_PARTES_COLUMNAR
+    assert releida['game_id'].is_monotonic_increasing
+    pd.testing.assert_frame_equal(catalogo.tabla('games'), releida, check_dtype=False)
+
+def test_aplicar_delta_igual_que_reconstruir(datos):
+    completo, base, deltas = datos
+    catalogo = CatalogoDatos(base)
+    construir_agregados_jugadores(catalogo)
+    obtener_sugerencias(catalogo)
+    obtener_cubo_minutos(catalogo)
+    cargar_o_entrenar_modelo(catalogo.ruta('games'), catalogo=catalogo)
+
+    resumen = aplicar_delta(catalogo, **deltas)
+    assert resumen['agregados_jugadores'] == 'actualizado'
+    assert resumen['sugerencias_intervalo_10'] == 'actualizado'
+    assert resumen['modelo_games'] == 'actualizado'
+    assert resumen['cubo_minutos'] == 'actualizado'
+    assert resumen['pronosticos'] == 'sin calcular'
+
+    referencia = CatalogoDatos(completo)
+    pd.testing.assert_frame_equal(construir_agregados_jugadores(catalogo).sort_index(),
+                                  construir_agregados_jugadores(referencia).sort_index(),
+                                  check_dtype=False, check_index_type=False)
+
+    sugerencias, esperadas = obtener_sugerencias(catalogo), obtener_sugerencias(referencia)
+    assert set(sugerencias) == set(esperadas)
+    for intervalo, (stats, _, _) in esperadas.items():
+        pd.testing.assert_frame_equal(
+            sugerencias[intervalo][0].set_index('player_id')[['goals', 'cards']].sort_index(),
+            stats.set_index('player_id')[['goals', 'cards']].sort_index(),
+            check_dtype=False, check_index_type=False)
+
+    cubo, cubo_esperado = obtener_cubo_minutos(catalogo), obtener_cubo_minutos(referencia)
+    np.testing.assert_array_equal(cubo.player_ids, cubo_esperado.player_ids)
+    assert (cubo.conteos != cubo_esperado.conteos).nnz == 0
+
+    cargar_o_entrenar_modelo(referencia.ruta('games'), catalogo=referencia)
+    indice = leer_artefacto_modelo(catalogo.ruta('games'), catalogo)['indice']
+    indice_esperado = leer_artefacto_modelo(referencia.ruta('games'), referencia)['indice']
+    assert set(indice.fila) == set(indice_esperado.fila)
+    for equipo, fila in indice_esperado.fila.items():
+        np.testing.assert_allclose(indice.ultimos[indice.fila[equipo]], indice_esperado.ultimos[fila])
+
+def test_aplicar_delta_partidos_repetidos(datos):
+    _, base, deltas = datos
+    catalogo = CatalogoDatos(base)
+    construir_agregados_jugadores(catalogo)
+    repetidas = pd.read_csv(os.path.join(base, 'appearances.csv')).head(5)
+
+    resumen = aplicar_delta(catalogo, appearances=repetidas)
+    assert resumen['appearances'] == 5
+    assert resumen['agregados_jugadores'] == 'se reconstruirá'
+    assert catalogo.leer_derivado('agregados_jugadores', ['players', 'appearances']) is None
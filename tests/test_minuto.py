@@ -3,7 +3,8 @@ sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
 import pandas as pd
 import pytest
 from unittest.mock import patch
-from utils.minuto import sugerencias_por_intervalo
+from utils.datos import CatalogoDatos
+from utils.minuto import sugerencias_por_intervalo, crear_intervalos, intervalos_disponibles
 
 # Datos simulados
 MOCK_PLAYERS_DATA = {
@@ -48,3 +49,37 @@ def test_sugerencias_por_intervalo_empty(mock_read_csv):
     assert X_scaled is None
     assert kmeans is None
 
+
+def test_crear_intervalos():
+    etiquetas = crear_intervalos(pd.Series([0, 9, 10, 61.0, 89, 90]))
+    assert list(etiquetas) == ['1-10', '1-10', '11-20', '61-70', '81-90', '91-100']
+    assert list(crear_intervalos([0, 14, 15, 44], tam_intervalo=15)) == ['1-15', '1-15', '16-30', '31-45']
+
+@pytest.fixture
+def data_dir(tmp_path):
+    pd.DataFrame(MOCK_PLAYERS_DATA).to_csv(tmp_path / 'players.csv', index=False)
+    eventos = pd.DataFrame(MOCK_EVENTS_DATA)
+    eventos = pd.concat([eventos, pd.DataFrame({'type': ['Goals', 'Substitutions'], 'player_id': [2, 1],
+                                                'minute': [75, 80], 'game_id': [104, 104]})])
+    eventos.to_csv(tmp_path / 'game_events.csv', index=False)
+    return tmp_path
+
+def test_sugerencias_todos_los_intervalos_una_lectura(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    stats, X_scaled, kmeans = sugerencias_por_intervalo("1-10", data_path=catalogo)
+    assert stats['goals'].sum() == 4 and stats['cards'].sum() == 3
+
+    # Cambiar de intervalo no vuelve a leer ni a agrupar
+    with patch('pandas.read_csv') as mock_read_csv:
+        stats_71, X_71, kmeans_71 = sugerencias_por_intervalo("71-80", data_path=catalogo)
+        assert not mock_read_csv.called
+    # Un solo jugador con datos en el intervalo: un solo cluster
+    assert stats_71['player_id'].tolist() == [2] and kmeans_71.n_clusters == 1
+    assert intervalos_disponibles(catalogo) == ['1-10', '71-80']
+    assert sugerencias_por_intervalo("11-20", data_path=catalogo) == (None, None, None)
+
+def test_sugerencias_tam_intervalo(data_dir):
+    catalogo = CatalogoDatos(str(data_dir))
+    assert intervalos_disponibles(catalogo, tam_intervalo=5) == ['1-5', '6-10', '76-80']
+    stats, X_scaled, kmeans = sugerencias_por_intervalo("6-10", data_path=catalogo, tam_intervalo=5)
+    assert set(stats['minute_interval']) == {'6-10'} and len(stats) == 3
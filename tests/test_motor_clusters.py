@@ -0,0 +1,64 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.datasets import make_blobs
+from utils.datos import CatalogoDatos
+from utils.motor_clusters import ajustar_clusters, elegir_k
+
+def _grupos(n=600, semilla=0):
+    X, _ = make_blobs(n_samples=n, centers=4, cluster_std=0.5, random_state=semilla)
+    return X
+
+def test_elegir_k_grupos_separados():
+    k, puntuaciones = elegir_k(_grupos(), range(2, 8), tam_muestra=300)
+    assert k == 4
+    assert set(puntuaciones) == set(range(2, 8))
+
+def test_ajustar_clusters_modos():
+    X = _grupos()
+    completo = ajustar_clusters(X, 'auto', range(2, 8))
+    assert isinstance(completo, KMeans) and completo.n_clusters == 4
+    assert completo.puntuaciones_k_
+    minibatch = ajustar_clusters(X, 5, minibatch=True)
+    assert isinstance(minibatch, MiniBatchKMeans) and minibatch.n_clusters == 5
+    assert len(minibatch.labels_) == len(X)
+    # Menos filas que clusters
+    assert ajustar_clusters(X[:1], 'auto').n_clusters == 1
+    assert ajustar_clusters(X[:2], 10).n_clusters == 2
+
+def test_ajustar_clusters_parte_del_modelo_anterior():
+    X = _grupos()
+    anterior = ajustar_clusters(X, 'auto', range(2, 8))
+    # Pocas filas nuevas: mismo k, sin volver a elegirlo, y las mismas etiquetas
+    nuevo = ajustar_clusters(np.vstack([X, _grupos(20, semilla=0)[:20]]), 'auto', range(2, 8), anterior=anterior)
+    assert nuevo.n_clusters == anterior.n_clusters
+    assert nuevo.puntuaciones_k_ == {}
+    assert (nuevo.labels_[:len(X)] == anterior.labels_).all()
+    # Con muchos datos nuevos se vuelve a elegir k
+    otro = ajustar_clusters(np.vstack([X, X]), 'auto', range(2, 8), anterior=anterior)
+    assert otro.puntuaciones_k_
+
+def test_ajustar_clusters_no_reutiliza_con_otra_configuracion():
+    X = _grupos()
+    anterior = ajustar_clusters(X, 'auto', range(4, 8))
+    # Otros candidatos: se vuelve a elegir k entre ellos aunque los datos no cambien
+    nuevo = ajustar_clusters(X, 'auto', range(2, 4), anterior=anterior)
+    assert nuevo.puntuaciones_k_ and set(nuevo.puntuaciones_k_) <= {2, 3}
+    assert nuevo.n_clusters in (2, 3) and nuevo.config_k_ == ('auto', (2, 3))
+    # De 'auto' a un k fijo (aunque coincida con el anterior): sin warm start
+    fijo = ajustar_clusters(X, anterior.n_clusters, anterior=anterior)
+    assert fijo.config_k_ == (anterior.n_clusters, tuple(range(2, 11))) and isinstance(fijo.init, str)
+    # Un modelo sin config_k_ (guardado antes) no se reutiliza
+    del anterior.config_k_
+    assert ajustar_clusters(X, 'auto', range(4, 8), anterior=anterior).puntuaciones_k_
+
+def test_ultimo_derivado(tmp_path):
+    pd.DataFrame({'club_id': [1], 'name': ['A']}).to_csv(tmp_path / 'clubs.csv', index=False)
+    catalogo = CatalogoDatos(str(tmp_path))
+    assert catalogo.ultimo_derivado('prueba', formato='joblib') is None
+    catalogo.materializar('prueba', ['clubs'], lambda: {'v': 1}, formato='joblib')
+    # Otro catálogo (tras un reinicio) lo encuentra en disco aunque las fuentes hayan cambiado
+    pd.DataFrame({'club_id': [1, 2], 'name': ['A', 'B']}).to_csv(tmp_path / 'clubs.csv', index=False)
+    assert CatalogoDatos(str(tmp_path)).ultimo_derivado('prueba', formato='joblib') == {'v': 1}
@@ -4,7 +4,8 @@ import pandas as pd
 import pytest
 from unittest.mock import patch, Mock
 import numpy as np
-from utils.prediccion_resultado import entrenar_modelo, predecir_resultado, obtener_rolling_stats_equipo, obtener_nombre_equipo, obtener_url_escudo
+from utils.prediccion_resultado import entrenar_modelo, predecir_resultado, obtener_rolling_stats_equipo, obtener_nombre_equipo, obtener_url_escudo, construir_partidos, obtener_indice_equipos, predecir_lote, main, cargar_o_entrenar_modelo, MotorElo, CONFIG_ELO
+from utils.datos import CatalogoDatos
 
 # Datos simulados
 MOCK_GAMES_DATA = {
@@ -96,4 +97,142 @@ def test_obtener_url_escudo_success(mock_get):
     mock_response.text = '<html><img class="tiny_wappen" src="/images/head/1.png"></html>'
     mock_get.return_value = mock_response
     url = obtener_url_escudo('http://example.com/1')
-    assert url == 'https://www.transfermarkt.co.uk/images/big/1.png'
\ No newline at end of file
+    assert url == 'https://www.transfermarkt.co.uk/images/big/1.png'
+
+def test_construir_partidos_coincide_con_rolling():
+    games = pd.DataFrame(MOCK_GAMES_DATA)
+    games['date'] = pd.to_datetime(games['date'])
+    games.loc[2, 'home_club_goals'] = np.nan
+    matches, partido = construir_partidos(games, ventanas=(2, 5))
+    assert len(matches) == 2 * len(games)
+    assert sorted(partido) == sorted(list(range(len(games))) * 2)
+    for ventana, sufijo in [(2, '_2'), (5, '')]:
+        esperado = matches.groupby('team_id')['goals_for'].transform(lambda x: x.rolling(window=ventana, min_periods=1).mean())
+        np.testing.assert_allclose(matches[f'goals_for_rolling{sufijo}'], esperado)
+    assert set(matches['result']) <= {'W', 'D', 'L'}
+    # Features de entrenamiento: solo partidos anteriores (rolling desplazado un partido)
+    previas = matches.groupby('team_id')['goals_for'].transform(lambda x: x.shift(1).rolling(window=5, min_periods=1).mean())
+    np.testing.assert_allclose(matches['goals_for_rolling_pre'], previas)
+
+@patch('pandas.read_csv')
+def test_entrenar_modelo_varias_ventanas(mock_read_csv):
+    mock_read_csv.return_value = pd.DataFrame(MOCK_GAMES_DATA)
+    model, matches = entrenar_modelo(games_path="data/games.csv", ventanas=(5, 10))
+    assert 'goals_for_rolling_10' in matches.columns
+    assert len(model.feature_names_in_) == 18
+    resultado, prob = predecir_resultado(model, matches, home_id=1, away_id=2)
+    assert resultado in ['Gana el local', 'Empate', 'Gana el visitante']
+
+
+@patch('pandas.read_csv')
+def test_indice_equipos(mock_read_csv):
+    mock_read_csv.return_value = pd.DataFrame(MOCK_GAMES_DATA)
+    model, matches = entrenar_modelo(games_path="data/games.csv")
+    indice = obtener_indice_equipos(matches)
+    assert obtener_indice_equipos(matches) is indice
+
+    ultimo = matches[matches['team_id'] == 1].sort_values('date').iloc[-1]
+    assert indice.ultimo(1)['goals_for_rolling'] == ultimo['goals_for_rolling']
+    assert len(obtener_rolling_stats_equipo(matches, team_id=1)) == (matches['team_id'] == 1).sum()
+    assert obtener_rolling_stats_equipo(matches, team_id=99).empty
+
+    with patch.object(model, 'predict_proba', wraps=model.predict_proba) as mock_proba:
+        primero = predecir_resultado(model, matches, home_id=1, away_id=2)
+        segundo = predecir_resultado(model, matches, home_id=1, away_id=2)
+        assert mock_proba.call_count == 1
+    assert primero is segundo
+    with pytest.raises(KeyError):
+        predecir_resultado(model, matches, home_id=1, away_id=99)
+
+@patch('pandas.read_csv')
+def test_predecir_lote(mock_read_csv):
+    mock_read_csv.return_value = pd.DataFrame(MOCK_GAMES_DATA)
+    model, matches = entrenar_modelo(games_path="data/games.csv")
+    fixtures = pd.DataFrame({
+        'home_id': [1, 2, 1, 99],
+        'away_id': [2, 3, 3, 1],
+        'date': pd.to_datetime(['2025-01-01', '2025-01-01', '2024-01-01', '2025-01-01'])
+    })
+    salida = predecir_lote(model, matches, fixtures)
+    assert list(salida.columns[-4:]) == ['prob_local', 'prob_empate', 'prob_visitante', 'prediccion']
+    resultado, prob = predecir_resultado(model, matches, home_id=1, away_id=2)
+    assert salida.loc[0, 'prediccion'] == resultado
+    por_clase = dict(zip(model.classes_, prob))
+    esperado = [por_clase.get(1, 0.0), por_clase.get(0, 0.0), por_clase.get(-1, 0.0)]
+    np.testing.assert_allclose(salida.loc[0, ['prob_local', 'prob_empate', 'prob_visitante']].astype(float), esperado)
+    # Sin partidos previos a la fecha o equipo desconocido: sin predicción
+    assert salida.loc[2, 'prediccion'] is None
+    assert salida.loc[3, 'prediccion'] is None
+    assert np.isnan(salida.loc[3, 'prob_local'])
+
+def test_main_predice_fixtures(tmp_path, capsys):
+    pd.DataFrame(MOCK_GAMES_DATA).to_csv(tmp_path / 'games.csv', index=False)
+    pd.DataFrame({'home_id': [1, 3], 'away_id': [2, 1]}).to_csv(tmp_path / 'fixtures.csv', index=False)
+    main([str(tmp_path / 'fixtures.csv'), '-o', str(tmp_path / 'salida.csv'), '--games', str(tmp_path / 'games.csv')])
+    salida = pd.read_csv(tmp_path / 'salida.csv')
+    assert len(salida) == 2
+    assert salida['prediccion'].notna().all()
+    assert '2 partidos predichos' in capsys.readouterr().out
+    assert len(list((tmp_path / 'cache').glob('modelo_games-*.joblib'))) == 1
+
+    # Segunda ejecución: usa el modelo guardado sin reentrenar
+    with patch('utils.prediccion_resultado.entrenar_modelo') as mock_entrenar:
+        main([str(tmp_path / 'fixtures.csv'), '-o', str(tmp_path / 'salida.csv'), '--games', str(tmp_path / 'games.csv')])
+        assert not mock_entrenar.called
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'salida.csv'), salida)
+
+def test_cargar_o_entrenar_modelo_reutiliza_artefacto(tmp_path):
+    pd.DataFrame(MOCK_GAMES_DATA).to_csv(tmp_path / 'games.csv', index=False)
+    games_path = str(tmp_path / 'games.csv')
+    model, matches = cargar_o_entrenar_modelo(games_path, catalogo=CatalogoDatos(str(tmp_path)))
+    assert len(list((tmp_path / 'cache').glob('modelo_games-*.joblib'))) == 1
+
+    # Tras un reinicio se carga el artefacto sin reentrenar, con su índice por equipo
+    with patch('utils.prediccion_resultado.entrenar_modelo') as mock_entrenar:
+        model2, matches2 = cargar_o_entrenar_modelo(games_path, catalogo=CatalogoDatos(str(tmp_path)))
+        assert not mock_entrenar.called
+    resultado, prob = predecir_resultado(model2, matches2, home_id=1, away_id=2)
+    resultado_original, prob_original = predecir_resultado(model, matches, home_id=1, away_id=2)
+    assert resultado == resultado_original
+    np.testing.assert_allclose(prob, prob_original)
+
+    # Cambia la configuración de entrenamiento: se reentrena
+    model3, _ = cargar_o_entrenar_modelo(games_path, catalogo=CatalogoDatos(str(tmp_path)), ventanas=(5, 10))
+    assert len(model3.feature_names_in_) == 18
+
+    # Cambia el contenido de games.csv: se reentrena
+    games = pd.DataFrame(MOCK_GAMES_DATA)
+    games.loc[0, 'home_club_goals'] = 5
+    games.to_csv(games_path, index=False)
+    with patch('utils.prediccion_resultado.entrenar_modelo', wraps=entrenar_modelo) as mock_entrenar:
+        cargar_o_entrenar_modelo(games_path, catalogo=CatalogoDatos(str(tmp_path)))
+        assert mock_entrenar.called
+
+def test_elo_una_pasada_e_incremental():
+    games = pd.DataFrame(MOCK_GAMES_DATA)
+    games['date'] = pd.to_datetime(games['date'])
+    # Desordenado: el Elo sigue el orden cronológico
+    matches, _ = construir_partidos(games.iloc[::-1])
+
+    # Primer partido: 1 gana 2-1 en casa con los dos equipos en el rating inicial
+    esperado = 1 / (1 + 10 ** (-CONFIG_ELO['ventaja_local'] / 400))
+    cambio = CONFIG_ELO['k'] * (1 - esperado)
+    equipo_1 = matches[matches['team_id'] == 1]
+    assert equipo_1['elo_pre'].iloc[0] == CONFIG_ELO['inicial']
+    assert equipo_1['elo_post'].iloc[0] == pytest.approx(CONFIG_ELO['inicial'] + cambio)
+    assert equipo_1['elo_pre'].iloc[1] == pytest.approx(CONFIG_ELO['inicial'] + cambio)
+    # Los puntos se transfieren: la suma de ratings no cambia
+    assert matches.groupby('team_id')['elo_post'].last().sum() == pytest.approx(3 * CONFIG_ELO['inicial'])
+
+    # Por tramos con el mismo motor = de una vez
+    motor = MotorElo(**CONFIG_ELO)
+    construir_partidos(games.iloc[:4], motor=motor)
+    por_tramos, _ = construir_partidos(games.iloc[4:], motor=motor)
+    completo = matches.sort_values('date').drop_duplicates('team_id', keep='last').set_index('team_id')
+    for equipo, rating in motor.ratings.items():
+        assert rating == pytest.approx(completo.loc[equipo, 'elo_post'])
+    assert len(por_tramos) == 4
+
+    indice = obtener_indice_equipos(matches)
+    assert indice.ultimo(1)['elo_post'] == pytest.approx(motor.rating(1))
+    assert indice.ratings_elo() == pytest.approx(motor.ratings)
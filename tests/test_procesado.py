@@ -1,9 +1,13 @@
 import sys
 sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import os
+import subprocess
 import pandas as pd
 import pytest
 from unittest.mock import patch
-from utils.procesado import plot_predicciones_arima
+import numpy as np
+from utils import procesado
+from utils.procesado import plot_predicciones_arima, ajustar_pronostico, pronosticar_serie, limpiar_cache_pronosticos
 
 # Mock para streamlit
 try:
@@ -11,6 +15,13 @@ try:
 except ImportError:
     st = None
 
+# Cada test parte sin pronósticos cacheados por otros
+@pytest.fixture(autouse=True)
+def cache_vacia():
+    limpiar_cache_pronosticos()
+    yield
+    limpiar_cache_pronosticos()
+
 # Datos simulados
 MOCK_PLAYERS_DATA = {
     'player_id': [1, 2],
@@ -75,4 +86,47 @@ def test_plot_predicciones_arima_file_not_found(mock_warning, mock_error, mock_r
     mock_read_csv.side_effect = FileNotFoundError
     result = plot_predicciones_arima(player_id=1, years_back=2, appearances_path="data/appearances.csv")
     assert result is None
-    assert mock_error.called
\ No newline at end of file
+    assert mock_error.called
+
+def test_ajustar_pronostico_elige_orden_barato():
+    serie = pd.Series(np.tile([0.0, 1.0, 2.0, 1.0], 6), index=pd.date_range('2022-01-31', periods=24, freq='ME'))
+    orden, pronostico = ajustar_pronostico(serie, pasos=12)
+    assert orden in procesado.ORDENES_CANDIDATOS
+    assert len(pronostico) == 12
+    assert np.isfinite(pronostico).all()
+
+def test_pronosticar_serie_cacheado():
+    serie = pd.Series([1.0, 0.0, 2.0, 1.0, 0.0, 1.0], index=pd.date_range('2024-01-31', periods=6, freq='ME'))
+    with patch('utils.procesado.ajustar_pronostico', wraps=ajustar_pronostico) as mock_ajustar:
+        primero = pronosticar_serie(12345, 'goals', serie)
+        segundo = pronosticar_serie(12345, 'goals', serie)
+        assert mock_ajustar.call_count == 1
+        # Un dato nuevo invalida la entrada
+        serie_nueva = pd.concat([serie, pd.Series([3.0], index=[pd.Timestamp('2024-07-31')])])
+        pronosticar_serie(12345, 'goals', serie_nueva)
+        assert mock_ajustar.call_count == 2
+    assert primero is segundo
+
+@patch('pandas.read_csv')
+@patch('streamlit.error')
+@patch('streamlit.warning')
+def test_plot_predicciones_arima_years_back_no_reajusta(mock_warning, mock_error, mock_read_csv):
+    mock_appearances = pd.DataFrame(MOCK_APPEARANCES_DATA)
+    mock_read_csv.side_effect = [mock_appearances, pd.DataFrame(MOCK_PLAYERS_DATA)] * 2
+    with patch('utils.procesado.ajustar_pronostico', wraps=ajustar_pronostico) as mock_ajustar:
+        # Fallo de cache: un ajuste por serie (goles y asistencias)
+        primero = plot_predicciones_arima(player_id=1, years_back=2, appearances_path="data/appearances.csv")
+        assert mock_ajustar.call_count == 2
+        # Otro years_back solo cambia el gráfico: ningún ajuste nuevo
+        segundo = plot_predicciones_arima(player_id=1, years_back=1, appearances_path="data/appearances.csv")
+        assert mock_ajustar.call_count == 2
+    assert primero is not None and segundo is not None
+    assert not mock_error.called
+
+
+def test_pool_arima_se_crea_al_usarlo():
+    # Importar el módulo no arranca hilos
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', "import utils.procesado as p; assert p._pool_arima is None"], cwd=raiz, check=True)
+    pool = procesado._obtener_pool_arima()
+    assert pool is procesado._obtener_pool_arima()
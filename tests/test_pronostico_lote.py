@@ -0,0 +1,58 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from unittest.mock import patch
+from utils.datos import CatalogoDatos
+from utils.procesado import plot_predicciones_arima
+from utils.pronostico_lote import ejecutar_lote, _pronosticar_bloque
+
+@pytest.fixture
+def data_dir(tmp_path):
+    fechas = pd.date_range('2023-01-15', periods=18, freq='MS') + pd.Timedelta(days=14)
+    filas = []
+    for player_id in (1, 2):
+        for i, fecha in enumerate(fechas):
+            filas.append({'player_id': player_id, 'date': fecha, 'goals': (i + player_id) % 3, 'assists': i % 2})
+    # Jugador con un solo mes: no se puede ajustar y debe quedar aislado como error
+    filas.append({'player_id': 3, 'date': fechas[0], 'goals': 1, 'assists': 0})
+    pd.DataFrame(filas).to_csv(tmp_path / 'appearances.csv', index=False)
+    pd.DataFrame({'player_id': [1, 2, 3], 'name': ['Player A', 'Player B', 'Player C']}).to_csv(tmp_path / 'players.csv', index=False)
+    return tmp_path
+
+def test_ejecutar_lote_y_uso_en_plot(data_dir):
+    tabla = ejecutar_lote(str(data_dir), procesos=1)
+    assert len(tabla.loc[[1]]) == 12
+    assert tabla.loc[[1], 'error'].isna().all()
+    assert tabla.loc[[3], 'error'].notna().all()
+
+    with patch('utils.procesado.ajustar_pronostico') as mock_ajustar:
+        resultado = plot_predicciones_arima(player_id=2, years_back=1, appearances_path=str(data_dir / 'appearances.csv'),
+                                            catalogo=CatalogoDatos(str(data_dir)))
+        assert not mock_ajustar.called
+    name, stats, fig_goals, fig_assists = resultado
+    np.testing.assert_allclose(fig_goals.data[1].y, tabla.loc[[2], 'goals'].to_numpy())
+
+def test_tabla_desactualizada_no_se_usa(data_dir):
+    ejecutar_lote(str(data_dir), procesos=1)
+    apariciones = pd.read_csv(data_dir / 'appearances.csv')
+    pd.concat([apariciones, apariciones.tail(1)]).to_csv(data_dir / 'appearances.csv', index=False)
+    with patch('utils.procesado.ajustar_pronostico', return_value=((0, 0, 0), np.zeros(12))) as mock_ajustar:
+        plot_predicciones_arima(player_id=1, years_back=1, appearances_path=str(data_dir / 'appearances.csv'),
+                                catalogo=CatalogoDatos(str(data_dir)))
+        assert mock_ajustar.called
+
+def test_pronosticar_bloque_timeout_por_jugador():
+    def ajustar(serie):
+        if len(serie) == 6:  # Jugador 1: ajuste que no termina a tiempo
+            time.sleep(1)
+        return (0, 0, 0), np.zeros(12)
+    bloque = [(1, pd.Timestamp('2024-01-31'), np.ones(6), np.ones(6)),
+              (2, pd.Timestamp('2024-01-31'), np.arange(12.0), np.ones(12))]
+    with patch('utils.pronostico_lote.ajustar_pronostico', side_effect=ajustar):
+        filas = _pronosticar_bloque(bloque, timeout_jugador=0.1)
+    errores = [fila for fila in filas if fila[-1] is not None]
+    assert len(errores) == 1 and errores[0][0] == 1 and 'Tiempo agotado' in errores[0][-1]
+    assert sum(1 for fila in filas if fila[0] == 2) == 12
@@ -0,0 +1,32 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import pandas as pd
+from utils.sintetico import generar_dataset, tamanos
+
+def test_generar_dataset_coherente(tmp_path):
+    filas = generar_dataset(str(tmp_path), escala=0.01, semilla=1)
+    n = tamanos(0.01)
+    assert filas['players'] == n['players'] and filas['games'] == n['games']
+
+    players = pd.read_csv(tmp_path / 'players.csv')
+    clubs = pd.read_csv(tmp_path / 'clubs.csv')
+    games = pd.read_csv(tmp_path / 'games.csv')
+    appearances = pd.read_csv(tmp_path / 'appearances.csv')
+    events = pd.read_csv(tmp_path / 'game_events.csv')
+    assert len(appearances) == filas['appearances'] and len(events) == filas['game_events']
+
+    # Claves coherentes entre tablas
+    assert appearances['player_id'].isin(players['player_id']).all()
+    assert appearances['game_id'].isin(games['game_id']).all()
+    assert games[['home_club_id', 'away_club_id']].stack().isin(clubs['club_id']).all()
+    assert (games['home_club_id'] != games['away_club_id']).all()
+    assert not appearances.duplicated(['game_id', 'player_id']).any()
+
+    # Un evento de gol por cada gol de las alineaciones
+    assert (events['type'] == 'Goals').sum() == appearances['goals'].sum()
+    assert events['minute'].between(1, 120).all()
+
+def test_generar_dataset_reproducible(tmp_path):
+    generar_dataset(str(tmp_path / 'a'), escala=0.01, semilla=3)
+    generar_dataset(str(tmp_path / 'b'), escala=0.01, semilla=3)
+    assert (tmp_path / 'a' / 'appearances.csv').read_bytes() == (tmp_path / 'b' / 'appearances.csv').read_bytes()
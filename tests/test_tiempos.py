@@ -0,0 +1,64 @@
+import sys
+sys.path.append('C:/Users/Usuario/Documents/GitHub/Analisis-Jugadores-App')
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+from utils import tiempos
+from utils.tiempos import tramo, peticion
+from utils.minuto import estadisticas_por_intervalo
+
+def test_sin_registro_no_mide():
+    assert tramo('x') is tramo('y')  # Contexto vacío compartido
+    inicio = time.perf_counter()
+    for _ in range(100000):
+        with tramo('x', filas=1):
+            pass
+    assert time.perf_counter() - inicio < 1.0
+
+def test_peticion_registra_tramos_anidados(caplog):
+    with caplog.at_level(logging.INFO, logger='utils.tiempos'):
+        with peticion() as registro:
+            with tramo('externo'):
+                with tramo('interno', filas=3):
+                    pass
+            with pytest.raises(ValueError):
+                with tramo('falla'):
+                    raise ValueError()
+    tabla = registro.tabla()
+    assert tabla['tramo'].tolist() == ['externo', 'interno', 'falla']
+    assert tabla['nivel'].tolist() == [0, 1, 0]
+    assert tabla.loc[1, 'padre'] == 'externo' and tabla.loc[1, 'filas'] == 3
+    assert tabla.loc[2, 'error'] == 'ValueError'
+    assert (tabla['ms'] >= 0).all()
+    assert f"peticion={registro.id} tramo=interno padre=externo nivel=1" in caplog.text
+    # Fuera de la petición se deja de medir
+    assert tramo('x') is tramo('y')
+
+def test_tramos_en_hilos_con_contexto():
+    with peticion() as registro, ThreadPoolExecutor(2) as pool:
+        with tramo('padre'):
+            tareas = [pool.submit(contextvars.copy_context().run, tramo_en_hilo) for _ in range(2)]
+            [tarea.result() for tarea in tareas]
+    tabla = registro.tabla()
+    assert (tabla['tramo'] == 'hilo').sum() == 2
+    assert set(tabla.loc[tabla['tramo'] == 'hilo', 'padre']) == {'padre'}
+
+def tramo_en_hilo():
+    with tramo('hilo'):
+        pass
+
+def test_activar_global_y_tramos_de_utils():
+    players = pd.DataFrame({'player_id': [1], 'name': ['A'], 'position': ['Attack']})
+    events = pd.DataFrame({'type': ['Goals'], 'player_id': [1], 'minute': [5]})
+    with peticion() as registro:
+        estadisticas_por_intervalo(players, events)
+    assert 'minuto.contar' in registro.tabla()['tramo'].tolist()
+
+    tiempos.activar(True)
+    try:
+        assert tramo('x') is not tramo('x')
+    finally:
+        tiempos.activar(False)
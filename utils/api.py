@@ -0,0 +1,300 @@
+# utils/api.py
+
+import argparse
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from utils.clustering import obtener_modelo_clusters, recomendar
+from utils.datos import obtener_catalogo
+from utils.entidades import COLUMNAS_ENTIDADES, obtener_indice_entidades
+from utils.minuto import TAM_INTERVALO, intervalos_disponibles, sugerencias_por_intervalo, sugerencias_por_rango
+from utils.prediccion_resultado import cargar_o_entrenar_modelo, predecir_resultado
+from utils.procesado import ErrorPronostico, SinDatosJugador, predicciones_arima
+from utils.procesos import crear_pool_procesos, usar_procesos
+from utils.tiempos import peticion
+
+logger = logging.getLogger(__name__)
+
+TRABAJADORES = max(2, min(8, os.cpu_count() or 2))
+# Rutas pesadas (clustering por intervalo o rango, ajustes ARIMA) en un pool de hilos propio
+# y pequeño, para no dejar sin trabajadores a las rutas ligeras (predicción, búsqueda...).
+# Los hilos comparten el catálogo en memoria; la parte de CPU (ajustes de clusters y ARIMA),
+# que en hilos tendría el GIL, se envía a un pool de procesos del mismo tamaño (utils/procesos.py).
+RUTAS_PESADAS = {'/sugerencias', '/rango', '/pronostico'}
+TRABAJADORES_PESADOS = 2
+# Peticiones que pueden esperar a un trabajador libre (en cada pool); con más, se responde 503
+COLA_MAXIMA = 32
+LIMITE_POR_DEFECTO = 50
+# Registro de tiempos por petición (tramos con su id en el log): solo con --tiempos o
+# TIEMPOS_ACTIVOS=1, como en la app (casilla de la barra lateral) y la línea de comandos
+TIEMPOS_POR_DEFECTO = os.environ.get('TIEMPOS_ACTIVOS') == '1'
+
+
+# Error con código HTTP (400 parámetro inválido, 404 sin datos, 503 servidor ocupado)
+class ErrorApi(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+# Errores de los datos pedidos que otras capas envuelven en un Exception genérico
+# (p. ej. clustering: "Error al cargar datos: ..."): se busca el original en la cadena
+def _error_original(error):
+    vistos = set()
+    while error is not None and id(error) not in vistos:
+        if isinstance(error, (FileNotFoundError, ValueError)):
+            return error
+        vistos.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def _parametro(params, nombre, tipo=str, por_defecto=None):
+    valores = params.get(nombre)
+    if not valores or valores[0] == '':
+        if por_defecto is None:
+            raise ErrorApi(400, f"Falta el parámetro '{nombre}'")
+        return por_defecto
+    try:
+        return tipo(valores[0])
+    except ValueError:
+        raise ErrorApi(400, f"Parámetro '{nombre}' inválido: {valores[0]}")
+
+
+def _registros(df):
+    return json.loads(df.to_json(orient='records', date_format='iso'))
+
+
+def _serie(serie):
+    return [{'date': fecha.strftime('%Y-%m-%d'), 'value': float(valor)} for fecha, valor in serie.items()]
+
+
+# Funciones de cada ruta: reciben el catálogo y los parámetros de la URL y devuelven
+# algo serializable a JSON. Se ejecutan en el pool de trabajadores.
+def _recomendar(catalogo, params):
+    player_id = _parametro(params, 'player_id', int)
+    posiciones = _parametro(params, 'posiciones', por_defecto='Attack').split(',')
+    limite = _parametro(params, 'limite', int, LIMITE_POR_DEFECTO)
+    _, recomendaciones = recomendar(player_id, posiciones, catalogo)
+    if recomendaciones is None:
+        raise ErrorApi(404, f"Jugador {player_id} sin datos para las posiciones {', '.join(posiciones)}")
+    recomendaciones = recomendaciones[recomendaciones.index != player_id].head(limite)
+    return {'player_id': player_id, 'posiciones': posiciones,
+            'recomendaciones': _registros(recomendaciones.rename_axis('player_id').reset_index())}
+
+
+def _intervalos(catalogo, params):
+    return {'intervalos': intervalos_disponibles(catalogo, _parametro(params, 'tam_intervalo', int, TAM_INTERVALO))}
+
+
+def _sugerencias(catalogo, params):
+    intervalo = _parametro(params, 'intervalo')
+    tam_intervalo = _parametro(params, 'tam_intervalo', int, TAM_INTERVALO)
+    stats, _, kmeans = sugerencias_por_intervalo(intervalo, catalogo, tam_intervalo)
+    if stats is None:
+        raise ErrorApi(404, f"No hay datos para el intervalo {intervalo}")
+    return {'intervalo': intervalo, 'n_clusters': int(kmeans.n_clusters), 'jugadores': _registros(stats)}
+
+
+# Cualquier rango de minutos (rango=76-90, rango=segunda parte) desde el cubo jugador x minuto
+def _rango(catalogo, params):
+    rango = _parametro(params, 'rango')
+    stats, _, kmeans = sugerencias_por_rango(rango, catalogo)
+    if stats is None:
+        raise ErrorApi(404, f"No hay datos para el rango {rango}")
+    return {'rango': rango, 'n_clusters': int(kmeans.n_clusters), 'jugadores': _registros(stats)}
+
+
+def _pronostico(catalogo, params):
+    player_id = _parametro(params, 'player_id', int)
+    years_back = _parametro(params, 'years_back', int, 2)
+    try:
+        datos = predicciones_arima(player_id, years_back, catalogo.ruta('appearances'), catalogo)
+    except SinDatosJugador as e:
+        raise ErrorApi(404, str(e))
+    except ErrorPronostico as e:
+        raise ErrorApi(500, str(e))
+    return {
+        'player_id': player_id,
+        'player_name': datos['player_name'],
+        'stats': {clave: float(valor) if isinstance(valor, float) else int(valor) for clave, valor in datos['stats'].items()},
+        'historico': {'goals': _serie(datos['goals']), 'assists': _serie(datos['assists'])},
+        'pronostico': {'goals': _serie(datos['forecast_goals']), 'assists': _serie(datos['forecast_assists'])},
+    }
+
+
+def _prediccion(catalogo, params):
+    home_id = _parametro(params, 'home_id', int)
+    away_id = _parametro(params, 'away_id', int)
+    if home_id == away_id:
+        raise ErrorApi(400, "Los equipos no pueden ser iguales")
+    # En memoria tras la primera llamada (y en data/cache entre reinicios)
+    model, matches = cargar_o_entrenar_modelo(catalogo.ruta('games'), catalogo=catalogo)
+    try:
+        resultado, prob = predecir_resultado(model, matches, home_id, away_id)
+    except KeyError as e:
+        raise ErrorApi(404, str(e.args[0]))
+    return {'home_id': home_id, 'away_id': away_id, 'prediccion': resultado,
+            'probabilidades': {str(clase): float(p) for clase, p in zip(model.classes_, prob)}}
+
+
+def _buscar(catalogo, params):
+    tabla = _parametro(params, 'tabla', por_defecto='players')
+    if tabla not in COLUMNAS_ENTIDADES:
+        raise ErrorApi(400, f"Tabla sin entidades: {tabla}")
+    indice = obtener_indice_entidades(tabla, catalogo)
+    ids = indice.buscar(_parametro(params, 'q'), _parametro(params, 'limite', int, 10))
+    return {'resultados': [{'id': id_, 'name': indice.nombre(id_)} for id_ in ids]}
+
+
+RUTAS = {
+    '/recomendar': _recomendar,
+    '/intervalos': _intervalos,
+    '/sugerencias': _sugerencias,
+    '/rango': _rango,
+    '/pronostico': _pronostico,
+    '/prediccion': _prediccion,
+    '/buscar': _buscar,
+}
+
+
+# Estado compartido del servicio: el catálogo (tablas, modelos e índices en memoria)
+# y dos pools acotados de trabajadores, uno para RUTAS_PESADAS y otro para el resto.
+# Cada conexión HTTP tiene su hilo, pero el trabajo pasa por el pool de su ruta: como
+# mucho `trabajadores` (o `trabajadores_pesados`) tareas a la vez y `cola` esperando.
+class ServicioAnalisis:
+    def __init__(self, data_path='data', trabajadores=TRABAJADORES, cola=COLA_MAXIMA,
+                 trabajadores_pesados=TRABAJADORES_PESADOS, tiempos=TIEMPOS_POR_DEFECTO):
+        self.catalogo = obtener_catalogo(data_path)
+        self.tiempos = tiempos
+        self.trabajadores = trabajadores
+        self.trabajadores_pesados = trabajadores_pesados
+        self._pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix='api')
+        self._plazas = threading.BoundedSemaphore(trabajadores + cola)
+        self._pool_pesado = ThreadPoolExecutor(max_workers=trabajadores_pesados, thread_name_prefix='api-pesado')
+        self._plazas_pesadas = threading.BoundedSemaphore(trabajadores_pesados + cola)
+        self._procesos = crear_pool_procesos(trabajadores_pesados)
+
+    def ejecutar(self, ruta, params):
+        funcion = RUTAS.get(ruta)
+        if funcion is None:
+            raise ErrorApi(404, f"Ruta desconocida: {ruta}. Opciones: {', '.join(RUTAS)}")
+        if ruta in RUTAS_PESADAS:
+            pool, plazas, funcion = self._pool_pesado, self._plazas_pesadas, self._con_procesos(funcion)
+        else:
+            pool, plazas = self._pool, self._plazas
+        if not plazas.acquire(blocking=False):
+            raise ErrorApi(503, "Servidor ocupado, inténtalo más tarde")
+        try:
+            # Con copia del contexto para que los tiempos de la tarea cuenten en la petición
+            tarea = pool.submit(contextvars.copy_context().run, funcion, self.catalogo, params)
+            return tarea.result()
+        finally:
+            plazas.release()
+
+    def _con_procesos(self, funcion):
+        def ejecutar(catalogo, params):
+            with usar_procesos(self._procesos):
+                return funcion(catalogo, params)
+        return ejecutar
+
+    # Carga por adelantado lo que usan todas las rutas (el modelo y los índices)
+    def precalentar(self):
+        tareas = [
+            self._pool.submit(cargar_o_entrenar_modelo, self.catalogo.ruta('games'), catalogo=self.catalogo),
+            self._pool.submit(intervalos_disponibles, self.catalogo),
+            self._pool.submit(obtener_modelo_clusters, ['Attack'], self.catalogo),
+        ] + [self._pool.submit(obtener_indice_entidades, tabla, self.catalogo) for tabla in COLUMNAS_ENTIDADES]
+        for tarea in tareas:
+            try:
+                tarea.result()
+            except Exception as e:
+                logger.warning(f"No se pudo precalentar: {e}")
+
+    def cerrar(self):
+        self._pool.shutdown(wait=True)
+        self._pool_pesado.shutdown(wait=True)
+        self._procesos.shutdown(wait=True)
+
+
+class ManejadorApi(BaseHTTPRequestHandler):
+    servicio = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        inicio = time.perf_counter()
+        with peticion() if self.servicio.tiempos else contextlib.nullcontext():
+            try:
+                if url.path == '/salud':
+                    estado, cuerpo = 200, {'estado': 'ok', 'trabajadores': self.servicio.trabajadores,
+                                           'trabajadores_pesados': self.servicio.trabajadores_pesados}
+                else:
+                    estado, cuerpo = 200, self.servicio.ejecutar(url.path, parse_qs(url.query))
+            except ErrorApi as e:
+                estado, cuerpo = e.estado, {'error': str(e)}
+            except Exception as e:
+                original = _error_original(e)
+                if original is None:
+                    logger.exception(f"Error en {url.path}")
+                    estado = 500
+                else:
+                    estado = 400 if isinstance(original, ValueError) else 404
+                cuerpo = {'error': str(e)}
+        ms = (time.perf_counter() - inicio) * 1000
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        self.send_header('X-Tiempo-ms', f"{ms:.1f}")
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, formato, *args):
+        logger.info(f"{self.address_string()} {formato % args}")
+
+
+def crear_servidor(servicio, host='127.0.0.1', puerto=8502):
+    manejador = type('Manejador', (ManejadorApi,), {'servicio': servicio})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP (JSON) sobre las funciones de análisis")
+    parser.add_argument('data_path', nargs='?', default='data')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8502)
+    parser.add_argument('--trabajadores', type=int, default=TRABAJADORES, help="Tareas a la vez de las rutas ligeras")
+    parser.add_argument('--trabajadores-pesados', type=int, default=TRABAJADORES_PESADOS,
+                        help=f"Tareas (y procesos) a la vez de {', '.join(sorted(RUTAS_PESADAS))}")
+    parser.add_argument('--cola', type=int, default=COLA_MAXIMA, help="Peticiones en espera antes de responder 503")
+    parser.add_argument('--tiempos', action='store_true', default=TIEMPOS_POR_DEFECTO,
+                        help="Registrar los tiempos por etapa de cada petición en el log")
+    parser.add_argument('--sin-precalentar', action='store_true', help="No cargar modelos e índices al arrancar")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    servicio = ServicioAnalisis(args.data_path, args.trabajadores, args.cola, args.trabajadores_pesados, args.tiempos)
+    if not args.sin_precalentar:
+        servicio.precalentar()
+    servidor = crear_servidor(servicio, args.host, args.puerto)
+    print(f"API en http://{args.host}:{args.puerto} (rutas: /salud, {', '.join(RUTAS)})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servicio.cerrar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# utils/backtest.py
+
+import argparse
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import log_loss
+from utils.datos import tabla_desde_ruta
+from utils.prediccion_resultado import COLUMNAS_PARTIDOS, CONFIG_MODELO, VENTANAS, construir_features
+from utils.tiempos import tramo
+
+# Clases del modelo en el orden de las columnas de probabilidad
+CLASES = [-1, 0, 1]
+# Temporadas de entrenamiento antes del primer fold
+TEMPORADAS_MINIMAS = 2
+N_BINS_CALIBRACION = 10
+
+
+# Temporada de cada partido: la columna season o, si no está, la que empieza en julio
+def temporadas_partidos(games):
+    if 'season' in games.columns and games['season'].notna().all():
+        return games['season'].to_numpy(dtype='int64')
+    fechas = pd.to_datetime(games['date'])
+    return np.where(fechas.dt.month >= 7, fechas.dt.year, fechas.dt.year - 1).astype('int64')
+
+
+# Folds walk-forward: cada temporada (a partir de la que tiene `temporadas_minimas`
+# anteriores) se evalúa con un modelo entrenado con todas las temporadas previas
+def definir_folds(temporadas, temporadas_minimas=TEMPORADAS_MINIMAS):
+    unicas = np.unique(temporadas)
+    return [(int(temporada), temporadas < temporada, temporadas == temporada)
+            for temporada in unicas[max(temporadas_minimas, 1):]]
+
+
+# Probabilidades con una columna por clase de CLASES (0 para las que el modelo no vio)
+def _probabilidades(model, X):
+    prob = np.zeros((len(X), len(CLASES)))
+    proba = model.predict_proba(X)
+    for j, clase in enumerate(model.classes_):
+        prob[:, CLASES.index(clase)] = proba[:, j]
+    return prob
+
+
+# Calibración uno-contra-resto de todas las clases: por bin de probabilidad predicha,
+# la media predicha y la frecuencia observada. ECE: diferencia media ponderada por partidos.
+def calibracion(prob, y, n_bins=N_BINS_CALIBRACION):
+    predicha = prob.ravel()
+    observada = (np.asarray(y)[:, None] == np.array(CLASES)[None, :]).ravel().astype(float)
+    bins = np.minimum((predicha * n_bins).astype(int), n_bins - 1)
+    partidos = np.bincount(bins, minlength=n_bins)
+    con_datos = partidos > 0
+    media = np.divide(np.bincount(bins, predicha, n_bins), partidos, out=np.full(n_bins, np.nan), where=con_datos)
+    frecuencia = np.divide(np.bincount(bins, observada, n_bins), partidos, out=np.full(n_bins, np.nan), where=con_datos)
+    tabla = pd.DataFrame({
+        'desde': np.arange(n_bins) / n_bins,
+        'hasta': np.arange(1, n_bins + 1) / n_bins,
+        'prob_media': media,
+        'frecuencia': frecuencia,
+        'predicciones': partidos,
+    })
+    ece = float(np.nansum(partidos * np.abs(media - frecuencia)) / max(partidos.sum(), 1))
+    return tabla, ece
+
+
+def _metricas(prob, y):
+    y = np.asarray(y)
+    return {
+        'log_loss': float(log_loss(y, prob, labels=CLASES)),
+        'accuracy': float(np.mean(np.array(CLASES)[prob.argmax(axis=1)] == y)),
+        'ece': calibracion(prob, y)[1],
+    }
+
+
+def _evaluar_fold(X, y, temporada, entrenamiento, prueba, config):
+    with tramo('backtest.fold', temporada=temporada, filas=int(entrenamiento.sum())):
+        model = RandomForestClassifier(**config)
+        inicio = time.perf_counter()
+        model.fit(X[entrenamiento], y[entrenamiento])
+        segundos_entrenamiento = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        prob = _probabilidades(model, X[prueba])
+        segundos_inferencia = time.perf_counter() - inicio
+
+    fila = {'temporada': temporada, 'partidos_entrenamiento': int(entrenamiento.sum()), 'partidos_prueba': int(prueba.sum())}
+    fila.update(_metricas(prob, y[prueba]))
+    fila.update({'segundos_entrenamiento': segundos_entrenamiento, 'segundos_inferencia': segundos_inferencia})
+    return fila, prob
+
+
+# Backtest walk-forward por temporadas del modelo de predicción de resultados. La tabla de
+# features se calcula una vez para todo el histórico y los folds se evalúan en paralelo
+# sobre ella (hilos: el ajuste de los árboles libera el GIL y no se copia X). Con varios
+# trabajadores, los tiempos de cada fold incluyen la competencia por los núcleos.
+# Devuelve {'folds': métricas y tiempos por temporada, 'global': métricas de todas las
+# predicciones juntas, 'calibracion': tabla de calibración global}.
+def backtest(games_path="data/games.csv", catalogo=None, ventanas=VENTANAS, temporadas_minimas=TEMPORADAS_MINIMAS,
+             trabajadores=None, config=None):
+    config = {**CONFIG_MODELO, **(config or {})}
+    games = tabla_desde_ruta(games_path, COLUMNAS_PARTIDOS + ['season'], parse_dates=["date"], catalogo=catalogo)
+    if not all(col in games.columns for col in COLUMNAS_PARTIDOS):
+        raise ValueError("Missing required columns in games.csv")
+
+    inicio = time.perf_counter()
+    X, y, _, partidos = construir_features(games, ventanas)
+    segundos_features = time.perf_counter() - inicio
+    X, y = X.to_numpy(), y.to_numpy()
+    folds = definir_folds(temporadas_partidos(games)[partidos], temporadas_minimas)
+    if not folds:
+        raise ValueError(f"Hacen falta más de {temporadas_minimas} temporadas para el backtest")
+
+    trabajadores = trabajadores or min(len(folds), os.cpu_count() or 1)
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=trabajadores) as pool:
+        tareas = [pool.submit(contextvars.copy_context().run, _evaluar_fold, X, y, temporada, entrenamiento, prueba, config)
+                  for temporada, entrenamiento, prueba in folds]
+        resultados = [tarea.result() for tarea in tareas]
+    segundos_folds = time.perf_counter() - inicio
+
+    prob = np.vstack([prob for _, prob in resultados])
+    y_prueba = np.concatenate([y[prueba] for _, _, prueba in folds])
+    tabla_calibracion, _ = calibracion(prob, y_prueba)
+    total = {'folds': len(folds), 'partidos_prueba': len(y_prueba), **_metricas(prob, y_prueba),
+             'segundos_features': segundos_features, 'segundos_folds': segundos_folds, 'trabajadores': trabajadores}
+    return {
+        'folds': pd.DataFrame([fila for fila, _ in resultados]).set_index('temporada'),
+        'global': total,
+        'calibracion': tabla_calibracion,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest walk-forward por temporadas del modelo de predicción")
+    parser.add_argument('data_path', nargs='?', default='data')
+    parser.add_argument('--temporadas-minimas', type=int, default=TEMPORADAS_MINIMAS,
+                        help="Temporadas de entrenamiento antes del primer fold")
+    parser.add_argument('--trabajadores', type=int, help="Folds evaluados a la vez (por defecto, uno por núcleo)")
+    parser.add_argument('--ventanas', default=','.join(map(str, VENTANAS)), help="Ventanas rolling, p. ej. 5,10")
+    parser.add_argument('--n-estimators', type=int, default=CONFIG_MODELO['n_estimators'])
+    parser.add_argument('--json', metavar='RUTA', help="Guardar el resultado en un .json")
+    args = parser.parse_args(argv)
+
+    ventanas = tuple(int(v) for v in args.ventanas.split(','))
+    resultado = backtest(os.path.join(args.data_path, 'games.csv'), ventanas=ventanas,
+                         temporadas_minimas=args.temporadas_minimas, trabajadores=args.trabajadores,
+                         config={'n_estimators': args.n_estimators})
+    print(resultado['folds'].round(4).to_string())
+    print()
+    print(pd.Series(resultado['global']).round(4).to_string())
+    print()
+    print(resultado['calibracion'].round(3).to_string(index=False))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'folds': json.loads(resultado['folds'].reset_index().to_json(orient='records')),
+                'global': resultado['global'],
+                'calibracion': json.loads(resultado['calibracion'].to_json(orient='records')),
+            }, f, indent=2)
+        print(f"Resultado guardado en {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# utils/benchmark.py
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from utils.clustering import cargar_datos_cluster, generar_clusters
+from utils.datos import CatalogoDatos, TABLAS, limpiar_catalogos
+from utils.minuto import sugerencias_por_intervalo
+from utils.prediccion_resultado import entrenar_modelo, limpiar_indices_equipos, predecir_resultado
+from utils.procesado import limpiar_cache_pronosticos, plot_predicciones_arima
+from utils.sintetico import generar_dataset
+
+LINEA_BASE = os.path.join('benchmarks', 'linea_base.json')
+TOLERANCIA = 0.25
+N_PREDICCIONES = 200
+N_JUGADORES_ARIMA = 3
+
+# Cada pipeline: preparar(catalogo) -> contexto (no se mide) y ejecutar(catalogo, contexto) (se mide).
+# El catálogo es nuevo en cada pasada y guarda su cache en un directorio temporal, así que
+# cada medición parte de los CSV/Parquet sin resultados derivados.
+def _sin_contexto(catalogo):
+    return None
+
+def _preparar_clusters(catalogo):
+    return cargar_datos_cluster(['Attack'], catalogo)
+
+def _preparar_prediccion(catalogo):
+    model, matches = entrenar_modelo(catalogo.ruta('games'), catalogo=catalogo)
+    rng = np.random.default_rng(0)
+    equipos = matches['team_id'].unique()
+    return model, matches, rng.choice(equipos, (N_PREDICCIONES, 2))
+
+def _preparar_arima(catalogo):
+    apariciones = catalogo.tabla('appearances', ['player_id'])
+    return apariciones['player_id'].value_counts().index[:N_JUGADORES_ARIMA].tolist()
+
+def _cargar_datos_cluster(catalogo, contexto):
+    cargar_datos_cluster(['Attack'], catalogo)
+
+def _generar_clusters(catalogo, stats):
+    generar_clusters(stats.copy())
+
+def _sugerencias_por_intervalo(catalogo, contexto):
+    sugerencias_por_intervalo('61-70', data_path=catalogo)
+
+def _entrenar_modelo(catalogo, contexto):
+    entrenar_modelo(catalogo.ruta('games'), catalogo=catalogo)
+
+def _predecir_resultado(catalogo, contexto):
+    model, matches, pares = contexto
+    for home_id, away_id in pares:
+        predecir_resultado(model, matches, home_id, away_id)
+
+def _plot_predicciones_arima(catalogo, jugadores):
+    for player_id in jugadores:
+        plot_predicciones_arima(player_id, years_back=2, appearances_path=catalogo.ruta('appearances'), catalogo=catalogo)
+
+PIPELINES = {
+    'cargar_datos_cluster': (_sin_contexto, _cargar_datos_cluster),
+    'generar_clusters': (_preparar_clusters, _generar_clusters),
+    'sugerencias_por_intervalo': (_sin_contexto, _sugerencias_por_intervalo),
+    'entrenar_modelo': (_sin_contexto, _entrenar_modelo),
+    'predecir_resultado': (_preparar_prediccion, _predecir_resultado),
+    'plot_predicciones_arima': (_preparar_arima, _plot_predicciones_arima),
+}
+
+# Caches globales del proceso (catálogos compartidos, pronósticos ARIMA, índices de
+# equipos): se vacían antes de cada pasada para que las repeticiones no midan aciertos
+def limpiar_caches():
+    limpiar_catalogos()
+    limpiar_cache_pronosticos()
+    limpiar_indices_equipos()
+
+def _pasada(data_path, nombre, con_memoria):
+    preparar, ejecutar = PIPELINES[nombre]
+    limpiar_caches()
+    with tempfile.TemporaryDirectory() as cache_path:
+        catalogo = CatalogoDatos(data_path)
+        catalogo.cache_path = cache_path
+        contexto = preparar(catalogo)
+        gc.collect()
+        if con_memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        ejecutar(catalogo, contexto)
+        segundos = time.perf_counter() - inicio
+        pico = tracemalloc.get_traced_memory()[1] if con_memoria else None
+        if con_memoria:
+            tracemalloc.stop()
+    return segundos, pico
+
+# Mejor tiempo de `repeticiones` pasadas y pico de memoria (tracemalloc: memoria reservada
+# por Python/NumPy/pandas durante la ejecución) de una pasada aparte, ya que medir memoria
+# ralentiza la ejecución
+def medir_pipeline(data_path, nombre, repeticiones=1):
+    warnings.simplefilter('ignore', FutureWarning)
+    tiempos = [_pasada(data_path, nombre, False)[0] for _ in range(repeticiones)]
+    _, pico = _pasada(data_path, nombre, True)
+    return {'segundos': min(tiempos), 'memoria_mb': pico / 2 ** 20}
+
+def filas_dataset(data_path):
+    filas = {}
+    for nombre in TABLAS:
+        ruta = os.path.join(data_path, f"{nombre}.csv")
+        if os.path.exists(ruta):
+            with open(ruta, 'rb') as f:
+                filas[nombre] = sum(bloque.count(b'\n') for bloque in iter(lambda: f.read(1 << 20), b'')) - 1
+    return filas
+
+# Ejecuta cada pipeline en un proceso nuevo para que no compartan caches ni memoria
+def ejecutar_benchmark(data_path, pipelines=None, repeticiones=1, aislar=True):
+    resultados = {}
+    for nombre in pipelines or list(PIPELINES):
+        if nombre not in PIPELINES:
+            raise ValueError(f"Pipeline desconocido: {nombre}. Opciones: {', '.join(PIPELINES)}")
+        if aislar:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                resultados[nombre] = pool.submit(medir_pipeline, data_path, nombre, repeticiones).result()
+        else:
+            resultados[nombre] = medir_pipeline(data_path, nombre, repeticiones)
+    return {'filas': filas_dataset(data_path), 'pipelines': resultados}
+
+# Compara con la línea base: una regresión es un pipeline más lento o con más memoria
+# que la línea base por encima de la tolerancia. Solo se marcan regresiones si la
+# línea base se midió con el mismo tamaño de datos.
+def comparar(resultado, linea_base, tolerancia=TOLERANCIA):
+    mismo_dataset = linea_base is not None and linea_base.get('filas') == resultado['filas']
+    base = (linea_base or {}).get('pipelines', {})
+    filas = []
+    for nombre, medida in resultado['pipelines'].items():
+        referencia = base.get(nombre, {})
+        fila = {'pipeline': nombre, 'segundos': medida['segundos'], 'memoria_mb': medida['memoria_mb'],
+                'base_segundos': referencia.get('segundos', np.nan), 'base_memoria_mb': referencia.get('memoria_mb', np.nan)}
+        fila['ratio_tiempo'] = fila['segundos'] / fila['base_segundos']
+        fila['ratio_memoria'] = fila['memoria_mb'] / fila['base_memoria_mb']
+        fila['regresion'] = bool(mismo_dataset and (fila['ratio_tiempo'] > 1 + tolerancia or fila['ratio_memoria'] > 1 + tolerancia))
+        filas.append(fila)
+    return pd.DataFrame(filas).set_index('pipeline')
+
+def cargar_linea_base(ruta):
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+def guardar_linea_base(resultado, ruta):
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, sort_keys=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide tiempo y memoria de los pipelines sobre un dataset")
+    parser.add_argument('data_path', help="Carpeta con los .csv (p. ej. generada con python -m utils.sintetico)")
+    parser.add_argument('--generar', type=float, metavar='ESCALA', help="Generar antes un dataset sintético a esta escala")
+    parser.add_argument('--pipelines', help=f"Lista separada por comas (por defecto todos: {','.join(PIPELINES)})")
+    parser.add_argument('--repeticiones', type=int, default=1)
+    parser.add_argument('--linea-base', default=LINEA_BASE)
+    parser.add_argument('--guardar-linea-base', action='store_true', help="Guardar este resultado como nueva línea base")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    args = parser.parse_args(argv)
+
+    if args.generar is not None:
+        generar_dataset(args.data_path, args.generar)
+
+    resultado = ejecutar_benchmark(args.data_path, args.pipelines.split(',') if args.pipelines else None, args.repeticiones)
+    linea_base = cargar_linea_base(args.linea_base)
+    tabla = comparar(resultado, linea_base, args.tolerancia)
+    print(f"Filas: {resultado['filas']}")
+    print(tabla.round(3).to_string())
+    if linea_base is not None and linea_base.get('filas') != resultado['filas']:
+        print(f"La línea base {args.linea_base} se midió con otro tamaño de datos: no se marcan regresiones")
+
+    if args.guardar_linea_base:
+        guardar_linea_base(resultado, args.linea_base)
+        print(f"Línea base guardada en {args.linea_base}")
+    return 1 if tabla['regresion'].any() else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
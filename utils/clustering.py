@@ -1,62 +1,153 @@
+import numpy as np
 import pandas as pd
+from sklearn.neighbors import KDTree
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.pipeline import Pipeline
+from utils.datos import obtener_catalogo, sumar_parciales
+from utils.motor_clusters import ajustar_clusters
+from utils.procesos import en_proceso
+from utils.tiempos import tramo
 
-def cargar_datos_cluster(tipo_posiciones=['Attack'], data_path='data'):
-    try:
-        # Cargar archivos
-        df_players = pd.read_csv(f"{data_path}/players.csv")
-        df_appearances = pd.read_csv(f"{data_path}/appearances.csv", parse_dates=["date"])
-
-        # Validar columnas requeridas
-        required_players = ['player_id', 'name', 'position']
-        required_appearances = ['player_id', 'player_name', 'goals', 'assists', 'minutes_played', 'game_id', 'date']
-        if not all(col in df_players.columns for col in required_players):
-            raise ValueError(f"El archivo players.csv debe contener las columnas: {', '.join(required_players)}")
+FEATURES_CLUSTER = ['goals', 'assists', 'minutes_played', 'goals_per_game', 'assists_per_game']
+# Número de clusters: 'auto' (el mejor k de K_CANDIDATOS) o un entero fijo
+N_CLUSTERS = 'auto'
+# k pequeños dan clusters demasiado amplios para buscar similares
+K_CANDIDATOS = range(6, 15)
+COLUMNAS_AGREGADOS = ['player_name', 'goals', 'assists', 'minutes_played', 'appearances',
+                      'goals_per_game', 'assists_per_game', 'minutes_per_game', 'name']
+
+# Parciales acumulados antes de combinarlos (acota la memoria del modo por bloques)
+_MAX_PARCIALES = 16
+
+def _sumar_apariciones(df_appearances):
+    # Agregación: Contar apariciones únicas por player_id basado en game_id
+    return df_appearances.groupby('player_id').agg({
+        'player_name': 'first',
+        'goals': 'sum',
+        'assists': 'sum',
+        'minutes_played': 'sum',
+        'game_id': 'nunique'  # Contar juegos únicos
+    }).rename(columns={'game_id': 'appearances'})
+
+# Misma agregación leyendo appearances por bloques: sumas parciales por jugador, primer
+# nombre no nulo y partidos por jugador. appearances tiene una fila por jugador y partido,
+# así que basta quitar los pares (jugador, partido) repetidos dentro de cada bloque y
+# contar: el estado es proporcional al número de jugadores, no al de filas
+def _sumar_apariciones_por_bloques(catalogo, columnas):
+    nombres, sumas = None, []
+    for bloque in catalogo.bloques('appearances', columnas):
+        if not all(col in bloque.columns for col in columnas):
+            raise ValueError(f"El archivo appearances.csv debe contener las columnas: {', '.join(columnas)}")
+        grupos = bloque.groupby('player_id')
+        primeros = grupos['player_name'].first()
+        nombres = primeros if nombres is None else nombres.combine_first(primeros)
+        parcial = grupos[['goals', 'assists', 'minutes_played']].sum()
+        partidos = bloque[['player_id', 'game_id']].dropna().drop_duplicates()
+        parcial['appearances'] = partidos.groupby('player_id').size().reindex(parcial.index, fill_value=0)
+        sumas.append(parcial)
+        if len(sumas) >= _MAX_PARCIALES:
+            sumas = [sumar_parciales(sumas)]
+    if not sumas:
+        return _sumar_apariciones(pd.DataFrame(columns=columnas))
+
+    stats = sumar_parciales(sumas)
+    stats.insert(0, 'player_name', nombres.reindex(stats.index))
+    return stats
+
+COLUMNAS_APARICIONES = ['player_id', 'player_name', 'goals', 'assists', 'minutes_played', 'game_id']
+
+def _calcular_ratios(stats):
+    # Evitar división por cero
+    stats['goals_per_game'] = stats['goals'] / stats['appearances'].replace(0, 1)
+    stats['assists_per_game'] = stats['assists'] / stats['appearances'].replace(0, 1)
+    stats['minutes_per_game'] = stats['minutes_played'] / stats['appearances'].replace(0, 1)
+    return stats
+
+def _agregar_apariciones(catalogo):
+    # Cargar solo las columnas necesarias
+    required_players = ['player_id', 'name', 'position']
+    required_appearances = COLUMNAS_APARICIONES
+    df_players = catalogo.tabla('players', required_players)
+
+    # Validar columnas requeridas
+    if not all(col in df_players.columns for col in required_players):
+        raise ValueError(f"El archivo players.csv debe contener las columnas: {', '.join(required_players)}")
+    if catalogo.por_bloques:
+        stats = _sumar_apariciones_por_bloques(catalogo, required_appearances)
+    else:
+        df_appearances = catalogo.tabla('appearances', required_appearances)
         if not all(col in df_appearances.columns for col in required_appearances):
             raise ValueError(f"El archivo appearances.csv debe contener las columnas: {', '.join(required_appearances)}")
+        with tramo('clustering.agregar', filas=len(df_appearances)):
+            stats = _sumar_apariciones(df_appearances)
+
+    # player_name se lee como categoría; por jugador basta un texto normal
+    stats['player_name'] = stats['player_name'].astype(object)
+
+    # Una fila por jugador de players.csv (con 0 apariciones si no jugó)
+    jugadores = df_players[required_players].drop_duplicates('player_id').set_index('player_id')
+    stats = jugadores.join(stats, how='left').sort_index()
+    for col in ['goals', 'assists', 'minutes_played', 'appearances']:
+        stats[col] = stats[col].fillna(0).astype('int64')
+
+    stats = _calcular_ratios(stats)
+
+    # Manejar nombres nulos
+    if stats['name'].isna().any():
+        stats['name'] = stats['name'].fillna(stats['player_name'])
+
+    return stats[COLUMNAS_AGREGADOS + ['position']]
+
+# Tabla por jugador (goles, asistencias, minutos, partidos, ratios, nombre y posición)
+# calculada una vez y guardada en data/cache hasta que cambien players/appearances
+def construir_agregados_jugadores(data_path='data'):
+    catalogo = obtener_catalogo(data_path)
+    return catalogo.materializar('agregados_jugadores', ['players', 'appearances'],
+                                 lambda: _agregar_apariciones(catalogo))
+
+# Suma al agregado por jugador solo las apariciones nuevas (de partidos que no estaban en
+# appearances; si no, el recuento de partidos únicos no sería correcto). Coste proporcional
+# a las filas nuevas: solo se tocan los jugadores que aparecen en ellas.
+def actualizar_agregados(agregados, apariciones):
+    if not all(col in apariciones.columns for col in COLUMNAS_APARICIONES):
+        raise ValueError(f"Las apariciones nuevas deben contener las columnas: {', '.join(COLUMNAS_APARICIONES)}")
+    nuevas = _sumar_apariciones(apariciones[COLUMNAS_APARICIONES])
+    nuevas = nuevas[nuevas.index.isin(agregados.index)]
+    stats = agregados.copy()
+    jugadores = nuevas.index
+    for col in ['goals', 'assists', 'minutes_played', 'appearances']:
+        stats.loc[jugadores, col] = stats.loc[jugadores, col].to_numpy() + nuevas[col].to_numpy(dtype='int64')
+    stats.loc[jugadores, 'player_name'] = stats.loc[jugadores, 'player_name'].fillna(nuevas['player_name'].astype(object))
+    stats.loc[jugadores, 'name'] = stats.loc[jugadores, 'name'].fillna(stats.loc[jugadores, 'player_name'])
+    ratios = ['goals_per_game', 'assists_per_game', 'minutes_per_game']
+    stats.loc[jugadores, ratios] = _calcular_ratios(stats.loc[jugadores, ['goals', 'assists', 'minutes_played', 'appearances']].copy())[ratios]
+    return stats
+
+def cargar_datos_cluster(tipo_posiciones=['Attack'], data_path='data'):
+    catalogo = obtener_catalogo(data_path)
+    try:
+        agregados = construir_agregados_jugadores(catalogo)
 
         # Filtrar jugadores por las posiciones seleccionadas
-        jugadores = df_players[df_players['position'].str.contains('|'.join(tipo_posiciones), case=False, na=False)]
+        jugadores = agregados[agregados['position'].str.contains('|'.join(tipo_posiciones), case=False, na=False)]
         if jugadores.empty:
             raise ValueError(f"No se encontraron jugadores con posiciones {', '.join(tipo_posiciones)}")
-        df_apariciones = df_appearances[df_appearances['player_id'].isin(jugadores['player_id'])]
 
-        if df_apariciones.empty:
+        stats = jugadores[jugadores['appearances'] > 0]
+        if stats.empty:
             raise ValueError(f"No hay datos de apariciones para jugadores con posiciones {', '.join(tipo_posiciones)}")
 
-        # Agregación: Contar apariciones únicas por player_id basado en game_id
-        stats = df_apariciones.groupby('player_id').agg({
-            'player_name': 'first',
-            'goals': 'sum',
-            'assists': 'sum',
-            'minutes_played': 'sum',
-            'game_id': 'nunique'  # Contar juegos únicos
-        }).rename(columns={'game_id': 'appearances'})
-
-        # Evitar división por cero
-        stats['goals_per_game'] = stats['goals'] / stats['appearances'].replace(0, 1)
-        stats['assists_per_game'] = stats['assists'] / stats['appearances'].replace(0, 1)
-        stats['minutes_per_game'] = stats['minutes_played'] / stats['appearances'].replace(0, 1)
-
-        # Añadir nombre desde players.csv
-        stats = stats.reset_index().merge(
-            df_players[['player_id', 'name']], on='player_id', how='left'
-        ).set_index('player_id')
-
-        # Manejar nombres nulos
-        if stats['name'].isna().any():
-            stats['name'] = stats['name'].fillna(stats['player_name'])
-
-        return stats
+        return stats[COLUMNAS_AGREGADOS].copy()
     except FileNotFoundError:
-        raise FileNotFoundError(f"No se encontraron los archivos en {data_path}. Verifica 'players.csv' y 'appearances.csv'.")
+        raise FileNotFoundError(f"No se encontraron los archivos en {catalogo.data_path}. Verifica 'players.csv' y 'appearances.csv'.")
     except Exception as e:
         raise Exception(f"Error al cargar datos: {str(e)}")
 
-def generar_clusters(stats):
+# Devuelve las estadísticas con su cluster y el modelo ajustado (Pipeline scaler + KMeans).
+# Con `anterior` (el Pipeline de una versión previa de los datos) se parte de sus centroides.
+def generar_clusters(stats, n_clusters=N_CLUSTERS, anterior=None):
     try:
-        features = ['goals', 'assists', 'minutes_played', 'goals_per_game', 'assists_per_game']
+        features = FEATURES_CLUSTER
         if not all(col in stats.columns for col in features):
             raise ValueError(f"Faltan columnas en los datos: {', '.join(features)}")
         X = stats[features].fillna(0)
@@ -64,25 +155,109 @@ def generar_clusters(stats):
         scaler = StandardScaler()
         X_scaled = scaler.fit_transform(X)
 
-        kmeans = KMeans(n_clusters=10, random_state=42)
-        stats['cluster'] = kmeans.fit_predict(X_scaled)
+        with tramo('clustering.kmeans', filas=len(X_scaled)):
+            kmeans = en_proceso(ajustar_clusters, X_scaled, n_clusters, K_CANDIDATOS,
+                                anterior=anterior.named_steps['kmeans'] if anterior is not None else None)
+        stats['cluster'] = kmeans.labels_
 
-        return stats, kmeans
+        return stats, Pipeline([('scaler', scaler), ('kmeans', kmeans)])
     except Exception as e:
         raise Exception(f"Error al generar clusters: {str(e)}")
 
+def clave_posiciones(tipo_posiciones):
+    return '-'.join(sorted(set(tipo_posiciones)))
+
+# Configuración que forma parte de la firma del registro y de los índices construidos con él
+def config_clusters():
+    return (N_CLUSTERS, tuple(K_CANDIDATOS))
+
+# Registro de modelos de clustering ajustados: uno por conjunto de posiciones y versión
+# de los datos, guardado en data/cache para reutilizarlo entre peticiones y reinicios
+def obtener_modelo_clusters(tipo_posiciones=['Attack'], data_path='data'):
+    catalogo = obtener_catalogo(data_path)
+
+    clave = f"clusters_{clave_posiciones(tipo_posiciones)}"
+
+    def construir():
+        stats = cargar_datos_cluster(tipo_posiciones, catalogo)
+        # Si los datos cambiaron poco se parte del modelo anterior (mismo k, centroides como inicio)
+        previo = catalogo.ultimo_derivado(clave, formato='joblib')
+        stats, modelo = generar_clusters(stats, N_CLUSTERS, anterior=previo.get('modelo') if isinstance(previo, dict) else None)
+        return {'stats': stats, 'modelo': modelo}
+
+    return catalogo.materializar(clave, ['players', 'appearances'], construir, formato='joblib',
+                                 extra=config_clusters())
+
+COLUMNAS_RECOMENDACION = ['name', 'goals', 'assists', 'minutes_played', 'goals_per_game', 'assists_per_game', 'minutes_per_game']
+
+def _construir_indice_similitud(registro):
+    stats, modelo = registro['stats'], registro['modelo']
+    X = stats[FEATURES_CLUSTER].fillna(0)
+    X_scaled = modelo.named_steps['scaler'].transform(X) if modelo is not None else StandardScaler().fit_transform(X)
+
+    # Un KD-tree global y uno por cluster sobre las features escaladas
+    clusters = stats['cluster'].to_numpy()
+    por_cluster = {}
+    for cluster in np.unique(clusters):
+        filas = np.flatnonzero(clusters == cluster)
+        por_cluster[cluster] = (KDTree(X_scaled[filas]), filas)
+    return {
+        'X': X_scaled,
+        'arbol': KDTree(X_scaled),
+        'por_cluster': por_cluster,
+        'fila': {player_id: i for i, player_id in enumerate(stats.index)},
+    }
+
+# Índice de vecinos más cercanos por conjunto de posiciones, construido una vez por
+# versión del registro (misma firma: si cambia la configuración del clustering, se rehace)
+def obtener_indice_similitud(tipo_posiciones=['Attack'], data_path='data'):
+    catalogo = obtener_catalogo(data_path)
+    return catalogo.materializar(
+        f"indice_{clave_posiciones(tipo_posiciones)}", ['players', 'appearances'],
+        lambda: _construir_indice_similitud(obtener_modelo_clusters(tipo_posiciones, catalogo)),
+        formato='joblib', extra=config_clusters())
+
+# Los k jugadores más parecidos (distancia euclídea sobre features escaladas).
+# Con mismo_cluster=False se busca entre todos los jugadores de esas posiciones.
+def top_k_similares(player_id, k=10, tipo_posiciones=['Attack'], data_path='data', mismo_cluster=True):
+    try:
+        stats = obtener_modelo_clusters(tipo_posiciones, data_path)['stats']
+        indice = obtener_indice_similitud(tipo_posiciones, data_path)
+
+        fila = indice['fila'].get(player_id)
+        if fila is None:
+            return None
+
+        if mismo_cluster:
+            arbol, filas = indice['por_cluster'][stats['cluster'].iat[fila]]
+        else:
+            arbol, filas = indice['arbol'], np.arange(len(stats))
+
+        # Pedir uno más para poder descartar al propio jugador
+        n = min(k + 1, len(filas))
+        with tramo('clustering.vecinos', k=k):
+            distancias, posiciones = arbol.query(indice['X'][fila:fila + 1], k=n)
+        vecinos = filas[posiciones[0]]
+        distancias = distancias[0][vecinos != fila][:k]
+        vecinos = vecinos[vecinos != fila][:k]
+
+        similares = stats.iloc[vecinos][COLUMNAS_RECOMENDACION].copy()
+        similares['distance'] = distancias
+        return similares
+    except Exception as e:
+        raise Exception(f"Error en la búsqueda de similares: {str(e)}")
+
 def recomendar(player_id_ref, tipo_posiciones=['Attack'], data_path='data'):
     try:
-        stats = cargar_datos_cluster(tipo_posiciones, data_path)
-        stats, _ = generar_clusters(stats)
+        stats = obtener_modelo_clusters(tipo_posiciones, data_path)['stats']
 
         if player_id_ref not in stats.index:
             return None, None
 
         cluster_objetivo = stats.loc[player_id_ref, 'cluster']
-        recomendaciones = stats[stats['cluster'] == cluster_objetivo].sort_values(by='goals', ascending=False)
+        recomendaciones = stats.loc[stats['cluster'] == cluster_objetivo, COLUMNAS_RECOMENDACION].sort_values(by='goals', ascending=False)
 
-        # Incluir todas las columnas relevantes
-        return stats, recomendaciones[['name', 'goals', 'assists', 'minutes_played', 'goals_per_game', 'assists_per_game', 'minutes_per_game']]
+        # Copias: `stats` es la tabla del modelo en memoria, compartida con otras llamadas
+        return stats.copy(), recomendaciones.copy()
     except Exception as e:
         raise Exception(f"Error en la recomendación: {str(e)}")
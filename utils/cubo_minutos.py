@@ -0,0 +1,196 @@
+# utils/cubo_minutos.py
+
+import re
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from utils.datos import obtener_catalogo, sumar_parciales
+from utils.tiempos import tramo
+
+# Minutos del eje: 1..90, con el mismo criterio que crear_intervalos (el minuto registrado
+# m cuenta en el m + 1: 0-9 -> 1-10); el añadido y la prórroga se pliegan en el 90
+MINUTO_MAXIMO = 90
+CLAVE_CUBO = 'cubo_minutos'
+
+
+# Minuto del eje de un minuto registrado (m -> m + 1, plegado a 1..90)
+def minuto_eje(minuto):
+    return min(max(int(minuto) + 1, 1), MINUTO_MAXIMO)
+
+
+# Partes con nombre en minutos registrados: la primera llega hasta el 45 (su añadido se
+# registra como 45) y la segunda empieza en el 46 (su añadido, 90+x, se pliega en el 90)
+_PARTES_REGISTRADAS = {
+    'primera parte': (0, 45),
+    'segunda parte': (46, 90),
+    'partido': (0, 90),
+    'first half': (0, 45),
+    'second half': (46, 90),
+}
+# Rangos con nombre además de "desde-hasta" (o un solo minuto), ya en minutos del eje:
+# primera parte 1-46, segunda parte 47-90
+RANGOS_NOMBRADOS = {nombre: (minuto_eje(desde), minuto_eje(hasta)) for nombre, (desde, hasta) in _PARTES_REGISTRADAS.items()}
+# Parciales acumulados antes de combinarlos (acota la memoria del modo por bloques)
+_MAX_PARCIALES = 16
+
+
+# "76-90" -> (76, 90), "segunda parte" -> (47, 90), "90" -> (90, 90)
+def parsear_rango(texto):
+    texto = re.sub(r'\s+', ' ', str(texto).strip().casefold())
+    if texto in RANGOS_NOMBRADOS:
+        return RANGOS_NOMBRADOS[texto]
+    m = re.fullmatch(r"(\d+)'?(?:\s*-\s*(\d+)'?)?", texto)
+    if not m:
+        raise ValueError(f"Rango de minutos inválido: '{texto}' (usa p. ej. 76-90 o {', '.join(RANGOS_NOMBRADOS)})")
+    desde = int(m.group(1))
+    hasta = int(m.group(2)) if m.group(2) else desde
+    if not 1 <= desde <= hasta <= MINUTO_MAXIMO:
+        raise ValueError(f"Rango de minutos fuera de 1-{MINUTO_MAXIMO}: {desde}-{hasta}")
+    return desde, hasta
+
+
+# Eventos por (jugador, tipo, minuto del eje 1..90)
+def contar_por_minuto(events):
+    minutos = pd.to_numeric(events['minute'], errors='coerce')
+    validos = (minutos.notna() & events['player_id'].notna() & events['type'].notna()).to_numpy()
+    conteos = pd.DataFrame({
+        'player_id': events['player_id'].to_numpy()[validos].astype('int64'),
+        'type': np.asarray(events['type'].to_numpy()[validos], dtype=object),
+        'minute': np.clip(np.floor(minutos.to_numpy()[validos]) + 1, 1, MINUTO_MAXIMO).astype('int64'),
+        'n': np.ones(int(validos.sum()), dtype='int64'),
+    })
+    return conteos.groupby(['player_id', 'type', 'minute'])[['n']].sum()
+
+
+# Cubo jugador x tipo de evento x minuto. Se guarda como matriz dispersa (una fila por
+# jugador con eventos, una columna por tipo y minuto) y en memoria se añaden, por tipo y
+# solo para los tipos consultados, las sumas acumuladas por minuto, con las que cualquier
+# rango sale con una resta por jugador: eventos en [desde, hasta] = acumulado[hasta] - acumulado[desde - 1].
+class CuboMinutos:
+    def __init__(self, player_ids, tipos, conteos):
+        self.player_ids = np.asarray(player_ids, dtype=np.int64)
+        self.tipos = list(tipos)
+        self.conteos = sparse.csr_matrix(conteos, shape=(len(self.player_ids), len(self.tipos) * MINUTO_MAXIMO))
+        self._acumulados = {}
+
+    @classmethod
+    def desde_conteos(cls, conteos):
+        player_ids = conteos.index.get_level_values('player_id').to_numpy()
+        tipos = conteos.index.get_level_values('type').to_numpy()
+        minutos = conteos.index.get_level_values('minute').to_numpy()
+        ids, filas = np.unique(player_ids, return_inverse=True)
+        nombres, columnas = np.unique(tipos.astype(str), return_inverse=True)
+        matriz = sparse.coo_matrix((conteos['n'].to_numpy(), (filas, columnas * MINUTO_MAXIMO + minutos - 1)),
+                                   shape=(len(ids), len(nombres) * MINUTO_MAXIMO))
+        return cls(ids, nombres.tolist(), matriz)
+
+    @classmethod
+    def desde_eventos(cls, events):
+        return cls.desde_conteos(contar_por_minuto(events))
+
+    # Sumas acumuladas (jugadores x 91) de un tipo: solo se densifica su bloque de columnas
+    def _acumular_tipo(self, tipo):
+        j = self.tipos.index(tipo)
+        bloque = self.conteos[:, j * MINUTO_MAXIMO:(j + 1) * MINUTO_MAXIMO].toarray()
+        acumulado = np.zeros((len(self.player_ids), MINUTO_MAXIMO + 1), dtype=_tipo_acumulado(bloque.sum(axis=1)))
+        acumulado[:, 1:] = np.cumsum(bloque, axis=1)
+        return acumulado
+
+    # Se calculan la primera vez que se consulta el tipo (entre hilos, como mucho se repite el cálculo)
+    def _acumulado(self, tipo):
+        acumulado = self._acumulados.get(tipo)
+        if acumulado is None:
+            acumulado = self._acumulados[tipo] = self._acumular_tipo(tipo)
+        return acumulado
+
+    # En disco solo la matriz dispersa; las sumas acumuladas se rehacen al consultar
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado.pop('_acumulados')
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._acumulados = {}
+
+    def __len__(self):
+        return len(self.player_ids)
+
+    # Eventos de cada jugador entre los minutos desde y hasta (incluidos), una columna por
+    # tipo en minúsculas ('Goals' -> 'goals'). Coste proporcional al número de jugadores.
+    def rango(self, desde, hasta, tipos=None):
+        if not 1 <= desde <= hasta <= MINUTO_MAXIMO:
+            raise ValueError(f"Rango de minutos fuera de 1-{MINUTO_MAXIMO}: {desde}-{hasta}")
+        tipos = self.tipos if tipos is None else list(tipos)
+        suma = np.zeros((len(self.player_ids), len(tipos)), dtype=np.int64)
+        for j, tipo in enumerate(tipos):
+            if tipo in self.tipos:
+                acumulado = self._acumulado(tipo)
+                suma[:, j] = acumulado[:, hasta].astype(np.int64) - acumulado[:, desde - 1]
+        return pd.DataFrame(suma, index=pd.Index(self.player_ids, name='player_id'), columns=[t.lower() for t in tipos])
+
+    # La matriz dispersa llevada a otros jugadores y tipos (que incluyen los propios)
+    def _reindexar(self, player_ids, tipos):
+        coo = self.conteos.tocoo()
+        filas = np.searchsorted(player_ids, self.player_ids)[coo.row]
+        posicion_tipo = np.array([tipos.index(t) for t in self.tipos], dtype=np.int64)
+        columnas = posicion_tipo[coo.col // MINUTO_MAXIMO] * MINUTO_MAXIMO + coo.col % MINUTO_MAXIMO
+        return sparse.csr_matrix((coo.data, (filas, columnas)), shape=(len(player_ids), len(tipos) * MINUTO_MAXIMO))
+
+    # Cubo con eventos nuevos sumados (jugadores o tipos nuevos incluidos), sin releer
+    # game_events: se cuentan solo los eventos nuevos y se suman las matrices dispersas.
+    # Las sumas acumuladas ya calculadas se conservan y solo cambian las filas de los
+    # jugadores con eventos nuevos (la suma acumulada de una suma es la suma de las acumuladas).
+    def con_eventos(self, events):
+        nuevo = CuboMinutos.desde_eventos(events)
+        player_ids = np.union1d(self.player_ids, nuevo.player_ids)
+        tipos = sorted(set(self.tipos) | set(nuevo.tipos))
+        cubo = CuboMinutos(player_ids, tipos, self._reindexar(player_ids, tipos) + nuevo._reindexar(player_ids, tipos))
+
+        filas_previas = np.searchsorted(player_ids, self.player_ids)
+        filas_nuevas = np.searchsorted(player_ids, nuevo.player_ids)
+        for tipo, previo in self._acumulados.items():
+            anadido = nuevo._acumular_tipo(tipo) if tipo in nuevo.tipos else None
+            totales = np.zeros(len(player_ids), dtype=np.int64)
+            totales[filas_previas] = previo[:, -1]
+            if anadido is not None:
+                totales[filas_nuevas] += anadido[:, -1]
+            acumulado = np.zeros((len(player_ids), MINUTO_MAXIMO + 1), dtype=_tipo_acumulado(totales))
+            acumulado[filas_previas] = previo
+            if anadido is not None:
+                acumulado[filas_nuevas] += anadido
+            cubo._acumulados[tipo] = acumulado
+        return cubo
+
+
+# uint16 mientras ningún jugador pase de 65535 eventos de un tipo (la mitad de memoria que int32)
+def _tipo_acumulado(totales):
+    maximo = int(np.max(totales)) if len(totales) else 0
+    return np.uint16 if maximo <= np.iinfo(np.uint16).max else np.int64
+
+
+def _contar_por_minuto_por_bloques(catalogo):
+    parciales = []
+    for bloque in catalogo.bloques('game_events', ['type', 'player_id', 'minute']):
+        parciales.append(contar_por_minuto(bloque))
+        if len(parciales) >= _MAX_PARCIALES:
+            parciales = [sumar_parciales(parciales)]
+    if not parciales:
+        return contar_por_minuto(pd.DataFrame(columns=['type', 'player_id', 'minute']))
+    return sumar_parciales(parciales)
+
+
+# Cubo de game_events, guardado en data/cache hasta que cambie el CSV
+def obtener_cubo_minutos(data_path='data'):
+    catalogo = obtener_catalogo(data_path)
+
+    def construir():
+        if catalogo.por_bloques:
+            conteos = _contar_por_minuto_por_bloques(catalogo)
+        else:
+            events = catalogo.tabla('game_events', ['type', 'player_id', 'minute'])
+            with tramo('cubo.contar', filas=len(events)):
+                conteos = contar_por_minuto(events)
+        return CuboMinutos.desde_conteos(conteos)
+
+    return catalogo.materializar(CLAVE_CUBO, ['game_events'], construir, formato='joblib')
@@ -0,0 +1,674 @@
+# utils/datos.py
+
+import glob
+import hashlib
+import io
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from utils.tiempos import tramo
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Sin pyarrow se trabaja solo con CSV
+    pa = pq = None
+
+TABLAS = ['players', 'appearances', 'game_events', 'games', 'clubs']
+COLUMNAS_FECHA = {
+    'appearances': ['date'],
+    'game_events': ['date'],
+    'games': ['date'],
+}
+
+# Tipos compactos de cada tabla: ids int32, conteos en enteros pequeños y categorías
+# para textos muy repetidos. Una columna solo se convierte si todos sus valores caben
+# (sin nulos ni decimales); si no, se deja con el tipo que dio la lectura.
+ESQUEMA = {
+    'players': {
+        'player_id': 'int32', 'current_club_id': 'int32', 'position': 'category', 'sub_position': 'category',
+        'foot': 'category', 'country_of_citizenship': 'category', 'current_club_name': 'category',
+    },
+    'appearances': {
+        'player_id': 'int32', 'game_id': 'int32', 'player_club_id': 'int32', 'player_current_club_id': 'int32',
+        'goals': 'int8', 'assists': 'int8', 'yellow_cards': 'int8', 'red_cards': 'int8',
+        'minutes_played': 'int16', 'competition_id': 'category', 'player_name': 'category',
+    },
+    'game_events': {
+        'game_id': 'int32', 'player_id': 'int32', 'club_id': 'int32', 'minute': 'int16', 'type': 'category',
+    },
+    'games': {
+        'game_id': 'int32', 'home_club_id': 'int32', 'away_club_id': 'int32', 'season': 'int16',
+        'home_club_goals': 'int8', 'away_club_goals': 'int8', 'competition_id': 'category',
+        'home_club_name': 'category', 'away_club_name': 'category',
+    },
+    'clubs': {
+        'club_id': 'int32', 'domestic_competition_id': 'category',
+    },
+}
+
+logger = logging.getLogger(__name__)
+_memoria_tablas = {}
+_memoria_lock = threading.Lock()
+
+
+def _ajustar_tipo(serie, tipo):
+    if tipo == 'category':
+        return serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype('category')
+    if serie.dtype == tipo or not (pd.api.types.is_integer_dtype(serie) or pd.api.types.is_float_dtype(serie)):
+        return serie
+    valores = serie.to_numpy()
+    if pd.api.types.is_float_dtype(serie) and not (np.isfinite(valores).all() and (valores == np.round(valores)).all()):
+        return serie
+    limites = np.iinfo(tipo)
+    if len(valores) and (valores.min() < limites.min or valores.max() > limites.max):
+        return serie
+    return serie.astype(tipo)
+
+
+def aplicar_esquema(df, nombre):
+    for col, tipo in ESQUEMA.get(nombre, {}).items():
+        if col in df.columns:
+            df[col] = _ajustar_tipo(df[col], tipo)
+    return df
+
+
+def _memoria_mb(df):
+    return df.memory_usage(index=True, deep=True).sum() / 2 ** 20
+
+
+# Aplica el esquema y registra la memoria de la tabla antes y después
+def _compactar(df, nombre):
+    if nombre not in ESQUEMA:
+        return df
+    antes = _memoria_mb(df)
+    df = aplicar_esquema(df, nombre)
+    despues = _memoria_mb(df)
+    with _memoria_lock:
+        _memoria_tablas[nombre] = {'filas': len(df), 'columnas': len(df.columns), 'antes_mb': antes, 'despues_mb': despues}
+    logger.info("tabla=%s filas=%d memoria_antes_mb=%.1f memoria_despues_mb=%.1f", nombre, len(df), antes, despues)
+    return df
+
+
+# Memoria de la última carga de cada tabla en este proceso (MB, antes y después del esquema)
+def informe_memoria():
+    with _memoria_lock:
+        informe = pd.DataFrame.from_dict(_memoria_tablas, orient='index')
+    if informe.empty:
+        return pd.DataFrame(columns=['filas', 'columnas', 'antes_mb', 'despues_mb', 'ahorro'])
+    informe['ahorro'] = 1 - informe['despues_mb'] / informe['antes_mb']
+    return informe
+
+
+# Partes de la carpeta columnar a partir de las cuales se compactan en una sola
+MAX_PARTES_COLUMNAR = 16
+
+
+def ruta_columnar(csv_path):
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+
+# La copia columnar es un archivo .parquet (ingestar_csv) o, tras anexar filas, una carpeta
+# .parquet con una parte por delta (parte-00000.parquet, parte-00001.parquet...) que pandas
+# y pyarrow leen como una sola tabla, en orden. Los temporales empiezan por '.' y no se leen.
+def partes_columnar(parquet_path):
+    if os.path.isdir(parquet_path):
+        return sorted(glob.glob(os.path.join(glob.escape(parquet_path), 'parte-*.parquet')))
+    return [parquet_path] if os.path.exists(parquet_path) else []
+
+
+def _estado_columnar(parquet_path):
+    estados = [_estado_archivo(parte) for parte in partes_columnar(parquet_path)]
+    if not estados or None in estados:
+        return None
+    return (max(mtime for mtime, _ in estados), sum(tam for _, tam in estados), len(estados))
+
+
+# Sustituye la copia columnar (archivo o carpeta) por `nueva` (ya escrita al lado). Mientras
+# se cambia no hay copia y se lee el .csv, que siempre está al día.
+def _reemplazar_columnar(nueva, parquet_path):
+    vieja = None
+    if os.path.isdir(parquet_path):
+        vieja = f"{parquet_path}.{os.getpid()}.viejo"
+        os.replace(parquet_path, vieja)
+    os.replace(nueva, parquet_path)
+    if vieja is not None:
+        shutil.rmtree(vieja, ignore_errors=True)
+
+
+def nombre_tabla(csv_path):
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def _columnar_vigente(csv_path, parquet_path):
+    # El .parquet solo vale si existe y su parte más reciente no es más antigua que el .csv
+    estado = _estado_columnar(parquet_path) if pq is not None else None
+    if estado is None:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return estado[0] >= os.stat(csv_path).st_mtime_ns
+
+
+def _convertir_fechas(df, parse_dates):
+    for col in parse_dates or []:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
+# Como _convertir_fechas, pero sin tocar df (compartido): si falta convertir alguna
+# columna se devuelve un DataFrame nuevo con ellas convertidas
+def _con_fechas(df, parse_dates):
+    pendientes = [col for col in parse_dates or [] if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col])]
+    if not pendientes:
+        return df
+    return df.assign(**{col: pd.to_datetime(df[col], errors='coerce') for col in pendientes})
+
+
+# Lee la copia columnar (.parquet) si está al día; si no, el CSV.
+# Solo se cargan las columnas pedidas que existan: la validación queda en cada módulo.
+def leer_tabla(csv_path, columnas=None, parse_dates=None):
+    parquet_path = ruta_columnar(csv_path)
+    if _columnar_vigente(csv_path, parquet_path):
+        with tramo('datos.leer_parquet', tabla=nombre_tabla(csv_path)):
+            disponibles = pq.read_schema(partes_columnar(parquet_path)[0]).names
+            cols = [c for c in columnas if c in disponibles] if columnas else None
+            df = pd.read_parquet(parquet_path, columns=cols)
+    else:
+        with tramo('datos.leer_csv', tabla=nombre_tabla(csv_path)):
+            usecols = (lambda c: c in columnas) if columnas else None
+            df = pd.read_csv(csv_path, usecols=usecols, low_memory=False)
+    with tramo('datos.tipos', tabla=nombre_tabla(csv_path)):
+        return _compactar(_convertir_fechas(df, parse_dates), nombre_tabla(csv_path))
+
+
+# Convierte los CSV de data_path a Parquet; solo rehace los que cambiaron
+def ingestar_csv(data_path='data', tablas=None):
+    if pq is None:
+        raise ImportError("Se necesita pyarrow para generar los archivos .parquet")
+
+    convertidas = []
+    for nombre in tablas or TABLAS:
+        csv_path = os.path.join(data_path, f"{nombre}.csv")
+        if not os.path.exists(csv_path):
+            continue
+        parquet_path = ruta_columnar(csv_path)
+        if _columnar_vigente(csv_path, parquet_path):
+            continue
+
+        df = pd.read_csv(csv_path, low_memory=False)
+        df = _compactar(_convertir_fechas(df, COLUMNAS_FECHA.get(nombre)), nombre)
+        # Escribir en un temporal para no dejar un .parquet a medias
+        tmp_path = parquet_path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        _reemplazar_columnar(tmp_path, parquet_path)
+        convertidas.append(nombre)
+    return convertidas
+
+
+# Añade las filas ya escritas en el .csv (texto) como una parte nueva de la carpeta
+# columnar, con el esquema de la primera parte: el coste es el del delta, no el de la tabla.
+# Un .parquet de un solo archivo pasa a ser la parte 0. Con más de MAX_PARTES_COLUMNAR
+# partes se compactan en una. Si las filas no encajan en el esquema (p. ej. un entero
+# que ya no cabe en int8), se regenera todo desde el .csv.
+def _anexar_columnar(csv_path, nombre, texto, columnas):
+    parquet_path = ruta_columnar(csv_path)
+    try:
+        esquema = pq.read_schema(partes_columnar(parquet_path)[0])
+        nuevas = pd.read_csv(io.StringIO(texto), names=list(columnas), low_memory=False)
+        nuevas = aplicar_esquema(_convertir_fechas(nuevas, COLUMNAS_FECHA.get(nombre)), nombre)
+        delta = pa.Table.from_pandas(nuevas[esquema.names], schema=esquema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, KeyError, ValueError):
+        ingestar_csv(os.path.dirname(csv_path) or '.', [nombre])
+        return
+
+    if not os.path.isdir(parquet_path):
+        carpeta = f"{parquet_path}.{os.getpid()}.tmp"
+        os.makedirs(carpeta)
+        os.replace(parquet_path, os.path.join(carpeta, 'parte-00000.parquet'))
+        os.replace(carpeta, parquet_path)
+    ultima = os.path.basename(partes_columnar(parquet_path)[-1])
+    parte = os.path.join(parquet_path, f"parte-{int(ultima[6:11]) + 1:05d}.parquet")
+    tmp_path = os.path.join(parquet_path, f".{os.path.basename(parte)}.tmp")
+    pq.write_table(delta, tmp_path)
+    os.replace(tmp_path, parte)
+    if len(partes_columnar(parquet_path)) > MAX_PARTES_COLUMNAR:
+        compactar_columnar(parquet_path)
+
+
+# Reescribe la carpeta columnar como una sola parte (el coste de la tabla entera, una vez
+# cada MAX_PARTES_COLUMNAR deltas)
+def compactar_columnar(parquet_path):
+    partes = partes_columnar(parquet_path)
+    if len(partes) <= 1:
+        return
+    carpeta = f"{parquet_path}.{os.getpid()}.tmp"
+    os.makedirs(carpeta, exist_ok=True)
+    pq.write_table(pq.ParquetDataset(partes).read(), os.path.join(carpeta, 'parte-00000.parquet'))
+    _reemplazar_columnar(carpeta, parquet_path)
+
+
+# Filas anexadas unidas a la tabla en memoria. Las columnas category se amplían con las
+# categorías nuevas (sin recodificar las filas previas) para que el concat no las pase a object.
+def _unir_filas(df, pendientes, nombre):
+    nuevas = pd.concat(pendientes, ignore_index=True) if len(pendientes) > 1 else pendientes[0]
+    nuevas = aplicar_esquema(nuevas.copy(), nombre)
+    previas = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            faltan = pd.Index(nuevas[col].dropna().unique()).difference(df[col].cat.categories)
+            previas[col] = df[col].cat.add_categories(faltan) if len(faltan) else df[col]
+            nuevas[col] = pd.Categorical(nuevas[col], categories=previas[col].cat.categories)
+    if previas:
+        df = df.assign(**previas)
+    return aplicar_esquema(pd.concat([df, nuevas], ignore_index=True), nombre)
+
+
+# Filas de muestra para estimar cuántos bytes ocupa una fila en memoria
+_FILAS_MUESTRA = 1000
+# Margen sobre el bloque leído: conversiones y temporales del groupby
+_FACTOR_TEMPORALES = 4
+_MIN_FILAS_BLOQUE = 1000
+
+
+def _muestra(csv_path, columnas):
+    parquet_path = ruta_columnar(csv_path)
+    if _columnar_vigente(csv_path, parquet_path):
+        archivo = pq.ParquetFile(partes_columnar(parquet_path)[0])
+        cols = [c for c in columnas if c in archivo.schema_arrow.names] if columnas else None
+        lote = next(archivo.iter_batches(batch_size=_FILAS_MUESTRA, columns=cols), None)
+        return None if lote is None else lote.to_pandas()
+    usecols = (lambda c: c in columnas) if columnas else None
+    return pd.read_csv(csv_path, usecols=usecols, nrows=_FILAS_MUESTRA, low_memory=False)
+
+
+# Filas por bloque para que leer y agregar un bloque quepa en memoria_maxima (bytes)
+def filas_por_bloque(csv_path, columnas, memoria_maxima):
+    muestra = _muestra(csv_path, columnas)
+    if muestra is None or muestra.empty:
+        return _MIN_FILAS_BLOQUE
+    bytes_fila = max(1, muestra.memory_usage(index=False, deep=True).sum() / len(muestra))
+    return max(_MIN_FILAS_BLOQUE, int(memoria_maxima // (bytes_fila * _FACTOR_TEMPORALES)))
+
+
+# Recorre la tabla en bloques de filas_bloque filas, solo con las columnas pedidas
+def leer_tabla_por_bloques(csv_path, columnas=None, parse_dates=None, filas_bloque=100000):
+    nombre = nombre_tabla(csv_path)
+    parquet_path = ruta_columnar(csv_path)
+    if _columnar_vigente(csv_path, parquet_path):
+        for parte in partes_columnar(parquet_path):
+            archivo = pq.ParquetFile(parte)
+            cols = [c for c in columnas if c in archivo.schema_arrow.names] if columnas else None
+            for lote in archivo.iter_batches(batch_size=filas_bloque, columns=cols):
+                yield _convertir_fechas(aplicar_esquema(lote.to_pandas(), nombre), parse_dates)
+    else:
+        usecols = (lambda c: c in columnas) if columnas else None
+        with pd.read_csv(csv_path, usecols=usecols, chunksize=filas_bloque, low_memory=False) as lector:
+            for bloque in lector:
+                yield _convertir_fechas(aplicar_esquema(bloque, nombre), parse_dates)
+
+
+# Suma parciales agrupados (mismo índice y columnas) en uno solo
+def sumar_parciales(parciales):
+    if len(parciales) == 1:
+        return parciales[0]
+    return pd.concat(parciales).groupby(level=list(range(parciales[0].index.nlevels))).sum()
+
+
+def _estado_archivo(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# Catálogo compartido: entrega cada tabla una sola vez por proceso y solo la
+# vuelve a leer cuando cambia el archivo (mtime/tamaño del .csv o del .parquet).
+# Los DataFrames devueltos son compartidos: no modificarlos, usar .copy().
+#
+# Con memoria_maxima (bytes) las agregaciones sobre las tablas grandes (appearances,
+# game_events) se hacen por bloques en lugar de cargar la tabla entera.
+class CatalogoDatos:
+    def __init__(self, data_path='data', memoria_maxima=None):
+        self.data_path = data_path
+        self.memoria_maxima = memoria_maxima
+        self.cache_path = os.path.join(data_path, 'cache')
+        self._tablas = {}
+        self._derivados = {}
+        self._hashes = {}
+        self._locks_derivados = {}
+        # Último uso de cada derivado (time.time()), para recortar_derivados
+        self._usos = {}
+        self._ultimo_uso = 0.0
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"CatalogoDatos({self.data_path!r})"
+
+    def ruta(self, nombre):
+        return os.path.join(self.data_path, f"{nombre}.csv")
+
+    def firma_tabla(self, nombre):
+        csv_path = self.ruta(nombre)
+        estado = (_estado_archivo(csv_path), _estado_columnar(ruta_columnar(csv_path)))
+        return None if estado == (None, None) else estado
+
+    def tabla(self, nombre, columnas=None, parse_dates=None):
+        csv_path = self.ruta(nombre)
+        firma = self.firma_tabla(nombre)
+        if firma is None:
+            # Sin archivo no hay nada que cachear: leer_tabla decide (y lanza FileNotFoundError)
+            return leer_tabla(csv_path, columnas, parse_dates)
+
+        with self._lock:
+            entrada = self._tablas.get(nombre)
+            if entrada is not None and entrada['firma'] == firma:
+                cargadas = entrada['columnas']
+                if cargadas is None or (columnas is not None and set(columnas) <= cargadas):
+                    if entrada.get('pendientes'):
+                        entrada['df'] = _unir_filas(entrada['df'], entrada.pop('pendientes'), nombre)
+                    # Las fechas se convierten una vez en una tabla nueva que sustituye a la
+                    # cacheada: quien ya tenga la anterior no la ve cambiar
+                    entrada['df'] = _con_fechas(entrada['df'], parse_dates)
+                    return entrada['df']
+                # Faltan columnas: recargar con la unión de lo ya pedido
+                columnas = None if columnas is None else sorted(cargadas | set(columnas))
+
+            df = leer_tabla(csv_path, columnas, parse_dates)
+            self._tablas[nombre] = {
+                'firma': firma,
+                'columnas': None if columnas is None else set(columnas),
+                'df': df,
+            }
+            return df
+
+    # Añade filas al final del .csv (p. ej. una jornada nueva) sin reescribirlo y, si el
+    # .parquet estaba al día, también a él (si no, queda como estaba: desfasado). Si la tabla
+    # estaba en memoria, las filas nuevas se guardan aparte y se unen a ella en la próxima
+    # lectura (una sola copia aunque se anexe varias veces), sin volver a leer el archivo.
+    # Las columnas se ordenan como en el .csv (las que falten quedan vacías).
+    def anexar(self, nombre, filas):
+        csv_path = self.ruta(nombre)
+        if self.firma_tabla(nombre) is None or not os.path.exists(csv_path):
+            raise FileNotFoundError(f"No se encontró el archivo '{csv_path}'")
+        if filas.empty:
+            return 0
+        columnas = pd.read_csv(csv_path, nrows=0).columns
+        texto = filas.reindex(columns=columnas).to_csv(header=False, index=False)
+        with self._lock:
+            columnar = _columnar_vigente(csv_path, ruta_columnar(csv_path))
+            with tramo('datos.anexar', tabla=nombre, filas=len(filas)):
+                with open(csv_path, 'ab+') as f:
+                    f.seek(0, os.SEEK_END)
+                    if f.tell() > 0:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b'\n':
+                            f.write(b'\n')
+                    f.write(texto.encode('utf-8'))
+                if columnar:
+                    _anexar_columnar(csv_path, nombre, texto, columnas)
+
+            entrada = self._tablas.pop(nombre, None)
+            if entrada is not None:
+                # Las filas nuevas se leen del mismo texto escrito, como las leería leer_tabla
+                previo = entrada['df']
+                nuevas = pd.read_csv(io.StringIO(texto), names=list(columnas), usecols=list(previo.columns), low_memory=False)
+                _convertir_fechas(nuevas, [c for c in COLUMNAS_FECHA.get(nombre, []) if c in previo.columns
+                                           and pd.api.types.is_datetime64_any_dtype(previo[c])])
+                entrada['pendientes'] = entrada.get('pendientes', []) + [nuevas[previo.columns]]
+                entrada['firma'] = self.firma_tabla(nombre)
+                self._tablas[nombre] = entrada
+        return len(filas)
+
+    @property
+    def por_bloques(self):
+        return self.memoria_maxima is not None
+
+    # Bloques de la tabla dimensionados según memoria_maxima; no se guardan en el catálogo
+    def bloques(self, nombre, columnas=None, parse_dates=None):
+        csv_path = self.ruta(nombre)
+        if self.firma_tabla(nombre) is None:
+            raise FileNotFoundError(f"No se encontró el archivo '{csv_path}'")
+        filas = filas_por_bloque(csv_path, columnas, self.memoria_maxima or 256 * 2 ** 20)
+        return leer_tabla_por_bloques(csv_path, columnas, parse_dates, filas)
+
+    # Filas con columna == valor; por bloques solo se conservan las filas que cumplen
+    def filas(self, nombre, columna, valor, columnas=None, parse_dates=None):
+        if not self.por_bloques or self.firma_tabla(nombre) is None:
+            df = self.tabla(nombre, columnas, parse_dates)
+            return df[df[columna] == valor]
+        partes = [bloque[bloque[columna] == valor] for bloque in self.bloques(nombre, columnas, parse_dates)]
+        return pd.concat(partes) if partes else pd.DataFrame(columns=columnas)
+
+    # Hash del contenido del archivo que se leería (.parquet vigente o .csv);
+    # se recalcula solo si cambia su mtime/tamaño
+    def hash_contenido(self, nombre):
+        csv_path = self.ruta(nombre)
+        parquet_path = ruta_columnar(csv_path)
+        if _columnar_vigente(csv_path, parquet_path):
+            path, archivos, estado = parquet_path, partes_columnar(parquet_path), _estado_columnar(parquet_path)
+        else:
+            path, archivos, estado = csv_path, [csv_path], _estado_archivo(csv_path)
+        if estado is None:
+            return None
+        with self._lock:
+            memo = self._hashes.get(path)
+            if memo is not None and memo[0] == estado:
+                return memo[1]
+        sha = hashlib.sha1()
+        for archivo in archivos:
+            with open(archivo, 'rb') as f:
+                for bloque in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(bloque)
+        with self._lock:
+            self._hashes[path] = (estado, sha.hexdigest())
+        return sha.hexdigest()
+
+    def firma(self, fuentes, *extra):
+        firmas = [self.firma_tabla(nombre) for nombre in fuentes]
+        if any(f is None for f in firmas):
+            return None
+        return hashlib.sha1(repr((firmas, extra)).encode()).hexdigest()[:16]
+
+    # Resultado derivado de unas tablas fuente (agregados, modelos...): se guarda en
+    # memoria y en data/cache/<clave>-<firma>.<formato>, y se reconstruye solo cuando
+    # cambia alguna fuente o `extra` (p. ej. la configuración usada para construirlo).
+    def materializar(self, clave, fuentes, construir, formato='parquet', extra=()):
+        firma = self.firma(fuentes, *extra)
+        if firma is None:
+            return construir()
+        formato = self._formato(formato)
+
+        valor = self._leer_derivado(clave, firma, formato)
+        if valor is not None:
+            return valor
+        with self._lock:
+            lock = self._locks_derivados.setdefault(clave, threading.Lock())
+        with lock:
+            valor = self._leer_derivado(clave, firma, formato)
+            if valor is None:
+                with tramo('datos.construir', clave=clave):
+                    valor = construir()
+                self._guardar_derivado(clave, firma, valor, formato)
+            return valor
+
+    # Para resultados que produce un proceso aparte (p. ej. un trabajo por lotes):
+    # devuelve el derivado solo si está al día con las fuentes, sin construirlo
+    def leer_derivado(self, clave, fuentes, formato='parquet', extra=()):
+        firma = self.firma(fuentes, *extra)
+        if firma is None:
+            return None
+        return self._leer_derivado(clave, firma, self._formato(formato))
+
+    def guardar_derivado(self, clave, fuentes, valor, formato='parquet', extra=()):
+        firma = self.firma(fuentes, *extra)
+        if firma is None:
+            raise FileNotFoundError(f"Faltan tablas fuente para guardar '{clave}': {', '.join(fuentes)}")
+        self._guardar_derivado(clave, firma, valor, self._formato(formato))
+
+    # Última versión guardada de un derivado, sea cual sea su firma (p. ej. el modelo de
+    # antes de un cambio en los datos, para partir de él); None si no hay ninguna
+    def ultimo_derivado(self, clave, formato='parquet'):
+        formato = self._formato(formato)
+        with self._lock:
+            entrada = self._derivados.get(clave)
+        if entrada is not None:
+            return entrada[1]
+        rutas = glob.glob(os.path.join(glob.escape(self.cache_path), f"{glob.escape(clave)}-{'[0-9a-f]' * 16}.{formato}"))
+        if not rutas:
+            return None
+        try:
+            ruta = max(rutas, key=os.path.getmtime)
+            return pd.read_parquet(ruta) if formato == 'parquet' else joblib.load(ruta)
+        except Exception:
+            return None
+
+    # Claves con alguna versión guardada (en memoria o en data/cache) que empiezan por `prefijo`
+    def claves_derivadas(self, prefijo, formato='parquet'):
+        formato = self._formato(formato)
+        with self._lock:
+            claves = {clave for clave in self._derivados if clave.startswith(prefijo)}
+        patron = os.path.join(glob.escape(self.cache_path), f"{glob.escape(prefijo)}*-{'[0-9a-f]' * 16}.{formato}")
+        claves.update(os.path.basename(ruta)[:-len(formato) - 18] for ruta in glob.glob(patron))
+        return sorted(claves)
+
+    # Deja como mucho `maximo` claves que empiezan por `prefijo` (p. ej. una por rango de
+    # minutos consultado) y descarta de memoria y de data/cache las usadas hace más tiempo.
+    # Las que no se han usado en este proceso cuentan desde que se guardaron.
+    def recortar_derivados(self, prefijo, maximo, formato='parquet'):
+        formato = self._formato(formato)
+        claves = self.claves_derivadas(prefijo, formato)
+        if len(claves) <= maximo:
+            return []
+
+        def ultimo_uso(clave):
+            with self._lock:
+                uso = self._usos.get(clave)
+            if uso is not None:
+                return uso
+            return max((os.path.getmtime(ruta) for ruta in self._rutas_derivado(clave, formato)), default=0.0)
+
+        descartadas = sorted(claves, key=ultimo_uso)[:len(claves) - maximo]
+        for clave in descartadas:
+            with self._lock:
+                self._derivados.pop(clave, None)
+                self._usos.pop(clave, None)
+            for ruta in self._rutas_derivado(clave, formato):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+        return descartadas
+
+    # Llamar con self._lock; estrictamente creciente aunque el reloj tenga poca resolución
+    def _marcar_uso(self, clave):
+        self._ultimo_uso = self._usos[clave] = max(time.time(), self._ultimo_uso + 1e-6)
+
+    def _rutas_derivado(self, clave, formato):
+        return glob.glob(os.path.join(glob.escape(self.cache_path), f"{glob.escape(clave)}-{'[0-9a-f]' * 16}.{formato}"))
+
+    def _formato(self, formato):
+        return 'joblib' if formato == 'parquet' and pq is None else formato
+
+    def _ruta_derivado(self, clave, firma, formato):
+        return os.path.join(self.cache_path, f"{clave}-{firma}.{formato}")
+
+    def _leer_derivado(self, clave, firma, formato):
+        with self._lock:
+            entrada = self._derivados.get(clave)
+            if entrada is not None and entrada[0] == firma:
+                self._marcar_uso(clave)
+                return entrada[1]
+
+        ruta = self._ruta_derivado(clave, firma, formato)
+        if not os.path.exists(ruta):
+            return None
+        try:
+            with tramo('datos.leer_cache', clave=clave):
+                valor = pd.read_parquet(ruta) if formato == 'parquet' else joblib.load(ruta)
+        except Exception:
+            return None  # Cache corrupta: se reconstruye
+        with self._lock:
+            self._derivados[clave] = (firma, valor)
+            self._marcar_uso(clave)
+        return valor
+
+    def _guardar_derivado(self, clave, firma, valor, formato):
+        with self._lock:
+            self._derivados[clave] = (firma, valor)
+            self._marcar_uso(clave)
+        ruta = self._ruta_derivado(clave, firma, formato)
+        try:
+            os.makedirs(self.cache_path, exist_ok=True)
+            tmp_path = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if formato == 'parquet':
+                valor.to_parquet(tmp_path)
+            else:
+                joblib.dump(valor, tmp_path)
+            os.replace(tmp_path, ruta)
+            # Borrar versiones anteriores de la misma clave
+            for viejo in glob.glob(os.path.join(glob.escape(self.cache_path), f"{glob.escape(clave)}-{'[0-9a-f]' * 16}.{formato}")):
+                if viejo != ruta:
+                    os.remove(viejo)
+        except OSError as e:
+            print(f"No se pudo guardar la cache '{clave}': {e}")
+
+    def limpiar(self):
+        with self._lock:
+            self._tablas.clear()
+            self._derivados.clear()
+            self._usos.clear()
+
+
+_catalogos = {}
+_catalogos_lock = threading.Lock()
+
+
+# Presupuesto de memoria por defecto de los catálogos compartidos (variable de entorno, en MB)
+def memoria_maxima_entorno():
+    valor = os.environ.get('DATOS_MEMORIA_MAXIMA_MB')
+    return int(float(valor) * 2 ** 20) if valor else None
+
+
+# Acepta una ruta o un CatalogoDatos y devuelve siempre el catálogo compartido
+def obtener_catalogo(data_path='data'):
+    if isinstance(data_path, CatalogoDatos):
+        return data_path
+    clave = os.path.abspath(data_path)
+    with _catalogos_lock:
+        if clave not in _catalogos:
+            _catalogos[clave] = CatalogoDatos(data_path, memoria_maxima_entorno())
+        return _catalogos[clave]
+
+
+# Vacía y olvida los catálogos compartidos (la siguiente llamada relee los CSV)
+def limpiar_catalogos():
+    with _catalogos_lock:
+        for catalogo in _catalogos.values():
+            catalogo.limpiar()
+        _catalogos.clear()
+
+
+# Para las funciones que reciben la ruta de un CSV concreto (p. ej. "data/games.csv")
+def catalogo_desde_ruta(csv_path, catalogo=None):
+    return catalogo if catalogo is not None else obtener_catalogo(os.path.dirname(csv_path) or '.')
+
+
+def tabla_desde_ruta(csv_path, columnas=None, parse_dates=None, catalogo=None):
+    return catalogo_desde_ruta(csv_path, catalogo).tabla(nombre_tabla(csv_path), columnas, parse_dates)
+
+
+if __name__ == '__main__':
+    ruta = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    hechas = ingestar_csv(ruta)
+    print(f"Tablas convertidas a Parquet: {', '.join(hechas) if hechas else 'ninguna (ya estaban al día)'}")
+    if hechas:
+        print(informe_memoria().round(2).to_string())
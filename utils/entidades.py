@@ -0,0 +1,156 @@
+# utils/entidades.py
+
+import bisect
+import re
+import unicodedata
+import numpy as np
+from utils.datos import obtener_catalogo
+
+# Columna id de cada tabla con entidades y columnas extra que se guardan en el índice
+COLUMNAS_ENTIDADES = {
+    'players': ('player_id', ()),
+    'clubs': ('club_id', ('url',)),
+}
+_TAM_NGRAMA = 3
+_MIN_SIMILITUD = 0.5
+
+
+# "Kylian Mbappé" -> "kylian mbappe": sin tildes, minúsculas y espacios simples
+def normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', texto.casefold()).strip()
+
+
+def _ngramas(texto):
+    texto = f" {texto} "
+    return {texto[i:i + _TAM_NGRAMA] for i in range(max(len(texto) - _TAM_NGRAMA + 1, 1))}
+
+
+# Índice de entidades (jugadores o clubes) construido una vez por versión del CSV:
+# - id -> nombre y nombre -> ids (los nombres repetidos no se pisan)
+# - etiquetas únicas y ordenadas para los selectores ("Nombre (id)" si el nombre se repite)
+# - búsqueda por prefijo (de cualquier palabra del nombre) con bisect sobre claves ordenadas
+#   y, si no basta, búsqueda aproximada por trigramas
+class IndiceEntidades:
+    def __init__(self, ids, nombres, datos=None):
+        ids = [int(i) for i in ids]
+        nombres = [str(n) for n in nombres]
+        self.nombre_por_id = dict(zip(ids, nombres))
+        self.ids_por_nombre = {}
+        for id_, nombre in self.nombre_por_id.items():
+            self.ids_por_nombre.setdefault(nombre, []).append(id_)
+        self.datos = {columna: dict(zip(ids, valores)) for columna, valores in (datos or {}).items()}
+
+        self.id_por_etiqueta = {}
+        for nombre, ids_nombre in self.ids_por_nombre.items():
+            if len(ids_nombre) == 1:
+                self.id_por_etiqueta[nombre] = ids_nombre[0]
+            else:
+                for id_ in ids_nombre:
+                    self.id_por_etiqueta[f"{nombre} ({id_})"] = id_
+        self.etiquetas = sorted(self.id_por_etiqueta)
+        self.etiqueta_por_id = {id_: etiqueta for etiqueta, id_ in self.id_por_etiqueta.items()}
+
+        # Claves de búsqueda: el nombre normalizado desde el inicio de cada palabra
+        self._ids = np.array(list(self.nombre_por_id), dtype=np.int64)
+        normalizados = [normalizar(nombre) for nombre in self.nombre_por_id.values()]
+        claves = []
+        for pos, texto in enumerate(normalizados):
+            for m in re.finditer(r'(?:^|\s)(\S)', texto):
+                claves.append((texto[m.start(1):], pos))
+        claves.sort()
+        self._claves = [clave for clave, _ in claves]
+        self._posiciones_clave = np.array([pos for _, pos in claves], dtype=np.int64)
+
+        ngramas = {}
+        self._n_ngramas = np.empty(len(normalizados), dtype=np.int32)
+        for pos, texto in enumerate(normalizados):
+            propios = _ngramas(texto)
+            self._n_ngramas[pos] = len(propios)
+            for ngrama in propios:
+                ngramas.setdefault(ngrama, []).append(pos)
+        self._ngramas = {ngrama: np.array(pos, dtype=np.int64) for ngrama, pos in ngramas.items()}
+
+    def __len__(self):
+        return len(self.nombre_por_id)
+
+    def __contains__(self, id_):
+        return id_ in self.nombre_por_id
+
+    def nombre(self, id_, por_defecto=None):
+        return self.nombre_por_id.get(id_, por_defecto)
+
+    def ids(self, nombre):
+        return list(self.ids_por_nombre.get(nombre, []))
+
+    def dato(self, id_, columna, por_defecto=None):
+        return self.datos.get(columna, {}).get(id_, por_defecto)
+
+    def etiqueta(self, id_):
+        return self.etiqueta_por_id.get(id_)
+
+    # Ids cuyo nombre (o alguna de sus palabras) empieza por `texto`, en orden alfabético
+    def buscar_prefijo(self, texto, limite=10):
+        texto = normalizar(texto)
+        if not texto:
+            return []
+        inicio = bisect.bisect_left(self._claves, texto)
+        fin = bisect.bisect_left(self._claves, texto + '\U0010ffff')
+        vistos = []
+        for pos in self._posiciones_clave[inicio:fin]:
+            id_ = int(self._ids[pos])
+            if id_ not in vistos:
+                vistos.append(id_)
+                if len(vistos) == limite:
+                    break
+        return vistos
+
+    # Ids con nombres parecidos, de más a menos parecido: fracción de los trigramas del texto
+    # que aparecen en el nombre (así "mbape" encuentra "Kylian Mbappé") y, a igualdad,
+    # similitud de Jaccard (prefiere los nombres más cortos)
+    def buscar_aproximado(self, texto, limite=10, min_similitud=_MIN_SIMILITUD):
+        propios = _ngramas(normalizar(texto))
+        listas = [self._ngramas[n] for n in propios if n in self._ngramas]
+        if not listas:
+            return []
+        posiciones, comunes = np.unique(np.concatenate(listas), return_counts=True)
+        cobertura = comunes / len(propios)
+        jaccard = comunes / (len(propios) + self._n_ngramas[posiciones] - comunes)
+        orden = np.lexsort((posiciones, -jaccard, -cobertura))[:limite]
+        return [int(self._ids[posiciones[i]]) for i in orden if cobertura[i] >= min_similitud]
+
+    # Primero coincidencias por prefijo y, si faltan, las aproximadas
+    def buscar(self, texto, limite=10):
+        resultado = self.buscar_prefijo(texto, limite)
+        if len(resultado) < limite:
+            for id_ in self.buscar_aproximado(texto, limite):
+                if id_ not in resultado:
+                    resultado.append(id_)
+                    if len(resultado) == limite:
+                        break
+        return resultado
+
+
+def construir_indice(df, tabla):
+    columna_id, extra = COLUMNAS_ENTIDADES[tabla]
+    if not all(col in df.columns for col in [columna_id, 'name']):
+        raise ValueError(f"El archivo {tabla}.csv debe contener las columnas: {columna_id}, name")
+    df = df.dropna(subset=[columna_id, 'name'])
+    datos = {col: df[col].where(df[col].notna(), None).tolist() for col in extra if col in df.columns}
+    return IndiceEntidades(df[columna_id].tolist(), df['name'].tolist(), datos)
+
+
+# Índice de una tabla (players o clubs) del catálogo; se guarda en data/cache y se
+# reconstruye solo cuando cambia el CSV
+def obtener_indice_entidades(tabla, data_path='data'):
+    if tabla not in COLUMNAS_ENTIDADES:
+        raise ValueError(f"Tabla sin entidades: {tabla}. Opciones: {', '.join(COLUMNAS_ENTIDADES)}")
+    catalogo = obtener_catalogo(data_path)
+    columna_id, extra = COLUMNAS_ENTIDADES[tabla]
+
+    def construir():
+        df = catalogo.tabla(tabla)
+        return construir_indice(df[[c for c in [columna_id, 'name', *extra] if c in df.columns]], tabla)
+
+    return catalogo.materializar(f"indice_{tabla}", [tabla], construir, formato='joblib')
@@ -0,0 +1,121 @@
+# utils/escudos.py
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from utils.prediccion_resultado import HEADERS_HTTP, obtener_url_escudo
+from utils.tiempos import tramo
+
+# Resuelve y descarga escudos de clubes con:
+# - una sesión HTTP compartida (pool de conexiones) y timeouts,
+# - cache en disco de URLs e imágenes con caducidad (ttl, en segundos),
+# - descarga concurrente de varios escudos,
+# - modo offline que solo sirve lo que ya está en cache.
+class ResolutorEscudos:
+    def __init__(self, cache_path='data/cache/escudos', ttl=7 * 24 * 3600, timeout=5, offline=False, max_workers=4):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.offline = offline
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS_HTTP)
+        adaptador = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=1)
+        self.session.mount('http://', adaptador)
+        self.session.mount('https://', adaptador)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+        self._lock = threading.Lock()
+        self._indice_path = os.path.join(cache_path, 'urls.json')
+        self._urls = self._leer_indice()
+
+    def _leer_indice(self):
+        try:
+            with open(self._indice_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _guardar_indice(self):
+        try:
+            os.makedirs(self.cache_path, exist_ok=True)
+            tmp_path = self._indice_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._urls, f)
+            os.replace(tmp_path, self._indice_path)
+        except OSError as e:
+            print(f"No se pudo guardar la cache de escudos: {e}")
+
+    def _vigente(self, instante):
+        return time.time() - instante < self.ttl
+
+    def url_escudo(self, club_url):
+        with self._lock:
+            entrada = self._urls.get(club_url)
+        if entrada is not None and (self.offline or self._vigente(entrada['ts'])):
+            return entrada['url']
+        if self.offline:
+            return None
+
+        with tramo('escudos.scraping'):
+            url = obtener_url_escudo(club_url, session=self.session, timeout=self.timeout)
+        if url is None:
+            # Si la web falla, mejor un escudo caducado que ninguno
+            return entrada['url'] if entrada is not None else None
+        with self._lock:
+            self._urls[club_url] = {'url': url, 'ts': time.time()}
+            self._guardar_indice()
+        return url
+
+    def _ruta_imagen(self, img_url):
+        return os.path.join(self.cache_path, hashlib.sha1(img_url.encode()).hexdigest() + '.img')
+
+    # Bytes de la imagen del escudo (None si no se puede obtener)
+    def imagen(self, club_url):
+        if not club_url:
+            return None
+        img_url = self.url_escudo(club_url)
+        if img_url is None:
+            return None
+
+        ruta = self._ruta_imagen(img_url)
+        en_cache = os.path.exists(ruta)
+        if en_cache and (self.offline or self._vigente(os.path.getmtime(ruta))):
+            with open(ruta, 'rb') as f:
+                return f.read()
+        if self.offline:
+            return None
+
+        try:
+            with tramo('escudos.descarga'):
+                response = self.session.get(img_url, timeout=self.timeout)
+                response.raise_for_status()
+            contenido = response.content
+            os.makedirs(self.cache_path, exist_ok=True)
+            tmp_path = f"{ruta}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(contenido)
+            os.replace(tmp_path, ruta)
+            return contenido
+        except Exception as e:
+            print(f"Error al descargar el escudo {img_url}: {e}")
+            if en_cache:
+                with open(ruta, 'rb') as f:
+                    return f.read()
+            return None
+
+    # Varios escudos en paralelo (p. ej. local y visitante), en el mismo orden.
+    # Cada tarea lleva una copia del contexto para que sus tiempos cuenten en la petición.
+    def imagenes(self, club_urls):
+        tareas = [self._pool.submit(contextvars.copy_context().run, self.imagen, url) for url in club_urls]
+        return [tarea.result() for tarea in tareas]
+
+    def cerrar(self):
+        self._pool.shutdown(wait=False)
+        self.session.close()
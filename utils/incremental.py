@@ -0,0 +1,132 @@
+# utils/incremental.py
+
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from utils.clustering import actualizar_agregados
+from utils.cubo_minutos import CLAVE_CUBO
+from utils.datos import COLUMNAS_FECHA, _convertir_fechas, aplicar_esquema, obtener_catalogo
+from utils.minuto import actualizar_sugerencias, clave_sugerencias, config_sugerencias
+from utils.prediccion_resultado import actualizar_artefacto_modelo, guardar_artefacto_modelo, leer_artefacto_modelo
+from utils.procesado import CLAVE_PRONOSTICOS_LOTE, config_pronostico, descartar_pronosticos
+from utils.tiempos import tramo
+
+logger = logging.getLogger(__name__)
+
+TABLAS_DELTA = ('appearances', 'game_events', 'games')
+CLAVE_PARTIDOS_APARICIONES = 'partidos_apariciones'
+
+
+# Ids de partido que ya están en appearances (para comprobar que una jornada es nueva)
+def partidos_en_apariciones(catalogo):
+    def construir():
+        if catalogo.por_bloques:
+            return np.unique(np.concatenate([bloque['game_id'].dropna().to_numpy(dtype='int64')
+                                             for bloque in catalogo.bloques('appearances', ['game_id'])] or [[]]))
+        return np.unique(catalogo.tabla('appearances', ['game_id'])['game_id'].dropna().to_numpy(dtype='int64'))
+
+    return catalogo.materializar(CLAVE_PARTIDOS_APARICIONES, ['appearances'], construir, formato='joblib')
+
+
+# Filas nuevas con los mismos tipos que la tabla leída (fechas y esquema compacto)
+def _leer_delta(valor, nombre):
+    df = pd.read_csv(valor, low_memory=False) if isinstance(valor, str) else valor.copy()
+    return aplicar_esquema(_convertir_fechas(df, COLUMNAS_FECHA.get(nombre)), nombre)
+
+
+# Añade filas nuevas (DataFrame o ruta a un .csv por tabla) a appearances, game_events y
+# games, y deja al día los derivados que ya estaban calculados sin recalcularlos enteros:
+# - agregados por jugador (cargar_datos_cluster): se suman las apariciones nuevas
+# - conteos por intervalo (sugerencias_por_intervalo): se suman los eventos nuevos
+# - cubo jugador x minuto (sugerencias_por_rango): se suman los eventos nuevos
+# - estado rolling por equipo (predecir_resultado): se extiende con los partidos nuevos
+# - pronósticos por lotes (plot_predicciones_arima): se descartan solo los de los jugadores
+#   con apariciones nuevas; sus series mensuales salen de la tabla ya anexada
+# Un derivado que no estaba calculado (o que no se puede actualizar, p. ej. apariciones de
+# partidos que ya estaban) se deja para que se reconstruya completo cuando se pida.
+# Devuelve {tabla o derivado: filas anexadas o estado}.
+def aplicar_delta(data_path='data', appearances=None, game_events=None, games=None):
+    catalogo = obtener_catalogo(data_path)
+    deltas = {nombre: _leer_delta(valor, nombre) for nombre, valor in
+              zip(TABLAS_DELTA, (appearances, game_events, games)) if valor is not None}
+    deltas = {nombre: df for nombre, df in deltas.items() if len(df)}
+    resumen = {}
+
+    # 1. Derivados al día antes de anexar
+    previos = {}
+    if 'appearances' in deltas:
+        previos['agregados_jugadores'] = catalogo.leer_derivado('agregados_jugadores', ['players', 'appearances'])
+        previos[CLAVE_PRONOSTICOS_LOTE] = catalogo.leer_derivado(CLAVE_PRONOSTICOS_LOTE, ['appearances'], extra=config_pronostico())
+        if previos['agregados_jugadores'] is not None:
+            previos[CLAVE_PARTIDOS_APARICIONES] = partidos_en_apariciones(catalogo)
+    if 'game_events' in deltas:
+        previos[CLAVE_CUBO] = catalogo.leer_derivado(CLAVE_CUBO, ['game_events'], formato='joblib')
+        for clave in catalogo.claves_derivadas(clave_sugerencias(''), formato='joblib'):
+            previos[clave] = catalogo.leer_derivado(clave, ['players', 'game_events'], formato='joblib', extra=config_sugerencias())
+    if 'games' in deltas:
+        previos['modelo_games'] = leer_artefacto_modelo(catalogo.ruta('games'), catalogo)
+
+    # 2. Filas nuevas al final de cada .csv (y de la tabla en memoria)
+    for nombre, df in deltas.items():
+        resumen[nombre] = catalogo.anexar(nombre, df)
+
+    # 3. Derivados actualizados, guardados con la firma nueva de sus tablas
+    def guardar(clave, construir, guardar_valor):
+        if previos.get(clave) is None:
+            resumen[clave] = 'sin calcular'
+            return
+        try:
+            with tramo('incremental.actualizar', clave=clave):
+                guardar_valor(construir(previos[clave]))
+            resumen[clave] = 'actualizado'
+        except ValueError as e:
+            logger.warning(f"{clave}: {e}; se reconstruirá completo")
+            resumen[clave] = 'se reconstruirá'
+
+    if 'appearances' in deltas:
+        apariciones = deltas['appearances']
+
+        def agregados_nuevos(agregados):
+            vistos = previos[CLAVE_PARTIDOS_APARICIONES]
+            partidos = apariciones['game_id'].dropna().to_numpy(dtype='int64')
+            if np.isin(partidos, vistos).any():
+                raise ValueError("hay apariciones de partidos que ya estaban en appearances")
+            catalogo.guardar_derivado(CLAVE_PARTIDOS_APARICIONES, ['appearances'], np.union1d(vistos, partidos), formato='joblib')
+            return actualizar_agregados(agregados, apariciones)
+
+        guardar('agregados_jugadores', agregados_nuevos,
+                lambda valor: catalogo.guardar_derivado('agregados_jugadores', ['players', 'appearances'], valor))
+        guardar(CLAVE_PRONOSTICOS_LOTE, lambda tabla: descartar_pronosticos(tabla, apariciones['player_id'].unique()),
+                lambda valor: catalogo.guardar_derivado(CLAVE_PRONOSTICOS_LOTE, ['appearances'], valor, extra=config_pronostico()))
+
+    if 'game_events' in deltas:
+        guardar(CLAVE_CUBO, lambda cubo: cubo.con_eventos(deltas['game_events']),
+                lambda valor: catalogo.guardar_derivado(CLAVE_CUBO, ['game_events'], valor, formato='joblib'))
+        players = catalogo.tabla('players', ['player_id', 'name', 'position'])
+        for clave in [c for c in previos if c.startswith(clave_sugerencias(''))]:
+            tam_intervalo = int(clave[len(clave_sugerencias('')):])
+            guardar(clave, lambda sugerencias: actualizar_sugerencias(sugerencias, deltas['game_events'], players, tam_intervalo),
+                    lambda valor: catalogo.guardar_derivado(clave, ['players', 'game_events'], valor, formato='joblib',
+                                                            extra=config_sugerencias()))
+
+    if 'games' in deltas:
+        guardar('modelo_games', lambda artefacto: actualizar_artefacto_modelo(artefacto, deltas['games']),
+                lambda valor: guardar_artefacto_modelo(valor, catalogo.ruta('games'), catalogo))
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Añade filas nuevas (p. ej. una jornada) y actualiza los derivados")
+    parser.add_argument('data_path', nargs='?', default='data')
+    for nombre in TABLAS_DELTA:
+        parser.add_argument(f"--{nombre.replace('_', '-')}", dest=nombre, metavar='CSV', help=f"Filas nuevas de {nombre}")
+    args = parser.parse_args(argv)
+
+    resumen = aplicar_delta(args.data_path, args.appearances, args.game_events, args.games)
+    for clave, valor in resumen.items():
+        print(f"{clave}: {valor}")
+
+
+if __name__ == '__main__':
+    main()
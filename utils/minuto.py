@@ -1,54 +1,207 @@
 # utils/minuto.py
 
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from utils.cubo_minutos import obtener_cubo_minutos, parsear_rango
+from utils.datos import obtener_catalogo, sumar_parciales
+from utils.motor_clusters import ajustar_clusters
+from utils.procesos import en_proceso
+from utils.tiempos import tramo
 
-def sugerencias_por_intervalo(intervalo: str, data_path="data"):
-    # Cargar datos
-    players = pd.read_csv(f"{data_path}/players.csv")
-    events = pd.read_csv(f"{data_path}/game_events.csv")
+TAM_INTERVALO = 10
+# Clusters por intervalo: 'auto' (el mejor k de K_CANDIDATOS_INTERVALO) o un entero fijo
+N_CLUSTERS_INTERVALO = 'auto'
+K_CANDIDATOS_INTERVALO = range(2, 7)
+FEATURES_INTERVALO = ['goals', 'cards']
+# Parciales acumulados antes de combinarlos (acota la memoria del modo por bloques)
+_MAX_PARCIALES = 16
+# Clusterings por rango de minutos guardados a la vez (se descartan los usados hace más tiempo)
+MAX_RANGOS_GUARDADOS = 32
+PREFIJO_RANGO = 'sugerencias_rango_'
 
+# Etiqueta "inicio-fin" de cada minuto con aritmética entera vectorizada
+# (minuto 0-9 -> "1-10", 10-19 -> "11-20", ...); solo se formatea un texto por intervalo distinto
+def crear_intervalos(minutos, tam_intervalo=TAM_INTERVALO):
+    inicios = (np.asarray(minutos, dtype=float) // tam_intervalo * tam_intervalo + 1).astype('int64')
+    unicos, posiciones = np.unique(inicios, return_inverse=True)
+    etiquetas = np.array([f"{inicio}-{inicio + tam_intervalo - 1}" for inicio in unicos], dtype=object)
+    return etiquetas[posiciones.reshape(-1)]
+
+# Goles y tarjetas por (jugador, intervalo) con al menos un gol o tarjeta
+def _contar_por_intervalo(events, tam_intervalo=TAM_INTERVALO):
     # Filtrar eventos relevantes
-    filtered_events = events[events['type'].isin(['Goals', 'Cards'])].copy()
-    filtered_events['minute'] = pd.to_numeric(filtered_events['minute'], errors='coerce')
-    filtered_events.dropna(subset=['minute'], inplace=True)
+    filtered_events = events.loc[events['type'].isin(['Goals', 'Cards']), ['type', 'player_id', 'minute']]
+    minutos = pd.to_numeric(filtered_events['minute'], errors='coerce')
+    filtered_events = filtered_events[minutos.notna()]
+
+    conteos = pd.DataFrame({
+        'player_id': filtered_events['player_id'].to_numpy(),
+        'minute_interval': crear_intervalos(minutos.dropna(), tam_intervalo),
+        'goals': (filtered_events['type'] == 'Goals').to_numpy(dtype='int64'),
+        'cards': (filtered_events['type'] == 'Cards').to_numpy(dtype='int64'),
+    })
+    return conteos.groupby(['player_id', 'minute_interval'])[FEATURES_INTERVALO].sum()
+
+# Los mismos conteos leyendo game_events por bloques y sumando los parciales
+def _contar_por_intervalo_por_bloques(catalogo, tam_intervalo=TAM_INTERVALO):
+    parciales = []
+    for bloque in catalogo.bloques('game_events', ['type', 'player_id', 'minute']):
+        parciales.append(_contar_por_intervalo(bloque, tam_intervalo))
+        if len(parciales) >= _MAX_PARCIALES:
+            parciales = [sumar_parciales(parciales)]
+    if not parciales:
+        return _contar_por_intervalo(pd.DataFrame(columns=['type', 'player_id', 'minute']), tam_intervalo)
+    return sumar_parciales(parciales)
+
+# Agregar info del jugador a los conteos por intervalo
+def _con_jugadores(conteos, players):
+    df_minute_stats = conteos.reset_index().merge(players[['player_id', 'name', 'position']], on='player_id', how='left')
+    return df_minute_stats.rename(columns={'name': 'player_name'})
+
+# Goles y tarjetas por jugador e intervalo, con nombre y posición del jugador
+def estadisticas_por_intervalo(players, events, tam_intervalo=TAM_INTERVALO):
+    with tramo('minuto.contar', filas=len(events)):
+        return _con_jugadores(_contar_por_intervalo(events, tam_intervalo), players)
+
+# `anterior`: KMeans del mismo intervalo en la versión previa de los datos (si la hay)
+def _agrupar_intervalo(stats_interval, anterior=None):
+    X = stats_interval[FEATURES_INTERVALO].fillna(0)
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    # k automático entre K_CANDIDATOS_INTERVALO (o el del modelo anterior si se parte de él);
+    # ajustar_clusters lo limita a los puntos distintos cuando hay pocos jugadores.
+    # En el pool de procesos si lo hay (rutas pesadas de la API)
+    with tramo('minuto.kmeans', filas=len(X_scaled)):
+        kmeans = en_proceso(ajustar_clusters, X_scaled, N_CLUSTERS_INTERVALO, K_CANDIDATOS_INTERVALO, anterior=anterior)
+    # El escalador viaja con el modelo para poder asignar filas nuevas (actualizar_sugerencias)
+    kmeans.escalador_ = scaler
+    stats_interval['cluster'] = kmeans.labels_
+    return stats_interval, X_scaled, kmeans
+
+# Estadísticas, features escaladas y KMeans de todos los intervalos, calculados una vez
+def _sugerencias_desde_estadisticas(df_minute_stats, anteriores=None):
+    anteriores = anteriores or {}
+    return {
+        intervalo: _agrupar_intervalo(stats_interval.reset_index(drop=True),
+                                      anteriores[intervalo][2] if intervalo in anteriores else None)
+        for intervalo, stats_interval in df_minute_stats.groupby('minute_interval', sort=False)
+    }
+
+def construir_sugerencias(players, events, tam_intervalo=TAM_INTERVALO, anteriores=None):
+    return _sugerencias_desde_estadisticas(estadisticas_por_intervalo(players, events, tam_intervalo), anteriores)
 
-    # Crear intervalos
-    def crear_intervalo(minuto, tam_intervalo=10):
-        start = (minuto // tam_intervalo) * tam_intervalo + 1
-        end = start + tam_intervalo - 1
-        return f"{int(start)}-{int(end)}"
+# Sugerencias al día con eventos nuevos sin recontar game_events: se suman los conteos
+# de los jugadores afectados y esas filas se reescalan con el escalador guardado y se
+# asignan al centroide más cercano (los clusters no se reajustan; se reajustan en la
+# siguiente reconstrucción completa). Coste proporcional a los eventos nuevos.
+def actualizar_sugerencias(sugerencias, events, players, tam_intervalo=TAM_INTERVALO):
+    conteos = _contar_por_intervalo(events, tam_intervalo)
+    resultado = dict(sugerencias)
+    etiquetas = conteos.index.get_level_values('minute_interval')
+    for intervalo in etiquetas.unique():
+        delta = conteos[etiquetas == intervalo]
+        if intervalo not in resultado:
+            resultado[intervalo] = _agrupar_intervalo(_con_jugadores(delta, players))
+            continue
 
-    filtered_events['minute_interval'] = filtered_events['minute'].apply(crear_intervalo)
+        stats_interval, X_scaled, kmeans = resultado[intervalo]
+        scaler = getattr(kmeans, 'escalador_', None)
+        if scaler is None:
+            raise ValueError(f"Las sugerencias del intervalo {intervalo} no guardan el escalador: hay que reconstruirlas")
+        delta = delta.droplevel('minute_interval')
+        filas = pd.Series(stats_interval.index, index=stats_interval['player_id']).reindex(delta.index)
+        conocidos = filas.notna().to_numpy()
 
-    # Agrupar eventos
-    goals = filtered_events[filtered_events['type'] == 'Goals'].groupby(
-        ['player_id', 'minute_interval']).size().reset_index(name='goals')
-    cards = filtered_events[filtered_events['type'] == 'Cards'].groupby(
-        ['player_id', 'minute_interval']).size().reset_index(name='cards')
+        stats_interval = stats_interval.copy()
+        filas_conocidas = filas[conocidos].astype('int64').to_numpy()
+        for col in FEATURES_INTERVALO:
+            stats_interval.loc[filas_conocidas, col] = stats_interval.loc[filas_conocidas, col].to_numpy() + delta.loc[conocidos, col].to_numpy()
+        nuevos = _con_jugadores(delta[~conocidos].assign(minute_interval=intervalo).set_index('minute_interval', append=True), players)
+        if len(nuevos):
+            stats_interval = pd.concat([stats_interval, nuevos], ignore_index=True)
+        tocadas = np.r_[filas_conocidas, np.arange(len(stats_interval) - len(nuevos), len(stats_interval))]
 
-    # Unir goles y tarjetas
-    df_minute_stats = pd.merge(goals, cards, how='outer', on=['player_id', 'minute_interval']).fillna(0)
-    df_minute_stats[['goals', 'cards']] = df_minute_stats[['goals', 'cards']].astype(int)
+        X_nuevo = scaler.transform(stats_interval.loc[tocadas, FEATURES_INTERVALO].fillna(0))
+        X_scaled = np.vstack([X_scaled, np.empty((len(nuevos), X_scaled.shape[1]))])
+        X_scaled[tocadas] = X_nuevo
+        stats_interval.loc[tocadas, 'cluster'] = kmeans.predict(X_nuevo)
+        stats_interval['cluster'] = stats_interval['cluster'].astype(kmeans.labels_.dtype)
+        resultado[intervalo] = (stats_interval, X_scaled, kmeans)
+    return resultado
 
-    # Agregar info del jugador
-    df_minute_stats = df_minute_stats.merge(players[['player_id', 'name', 'position']], on='player_id', how='left')
-    df_minute_stats.rename(columns={'name': 'player_name'}, inplace=True)
+# Diccionario intervalo -> (stats, X_scaled, kmeans), guardado en data/cache hasta que
+# cambien players/game_events o el tamaño de intervalo
+def clave_sugerencias(tam_intervalo=TAM_INTERVALO):
+    return f"sugerencias_intervalo_{tam_intervalo}"
 
-    # Filtrar por intervalo
-    stats_interval = df_minute_stats[df_minute_stats['minute_interval'] == intervalo].copy()
+def config_sugerencias():
+    return (N_CLUSTERS_INTERVALO, tuple(K_CANDIDATOS_INTERVALO))
 
-    if stats_interval.empty:
+def obtener_sugerencias(data_path="data", tam_intervalo=TAM_INTERVALO):
+    catalogo = obtener_catalogo(data_path)
+    clave = clave_sugerencias(tam_intervalo)
+
+    def construir():
+        players = catalogo.tabla('players', ['player_id', 'name', 'position'])
+        # Sugerencias de la versión anterior de los datos: sus centroides sirven de inicio
+        anteriores = catalogo.ultimo_derivado(clave, formato='joblib')
+        anteriores = anteriores if isinstance(anteriores, dict) else None
+        if catalogo.por_bloques:
+            conteos = _contar_por_intervalo_por_bloques(catalogo, tam_intervalo)
+            return _sugerencias_desde_estadisticas(_con_jugadores(conteos, players), anteriores)
+        events = catalogo.tabla('game_events', ['type', 'player_id', 'minute'])
+        return construir_sugerencias(players, events, tam_intervalo, anteriores)
+
+    return catalogo.materializar(clave, ['players', 'game_events'], construir, formato='joblib',
+                                 extra=config_sugerencias())
+
+# Intervalos con datos, ordenados por minuto de inicio
+def intervalos_disponibles(data_path="data", tam_intervalo=TAM_INTERVALO):
+    return sorted(obtener_sugerencias(data_path, tam_intervalo), key=lambda intervalo: int(intervalo.split('-')[0]))
+
+def sugerencias_por_intervalo(intervalo: str, data_path="data", tam_intervalo=TAM_INTERVALO):
+    sugerencias = obtener_sugerencias(data_path, tam_intervalo)
+    if intervalo.strip() not in sugerencias:
         return None, None, None
 
-    # Clustering
-    features = ['goals', 'cards']
-    X = stats_interval[features].fillna(0)
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    stats_interval, X_scaled, kmeans = sugerencias[intervalo.strip()]
+    # Copia para que quien la reciba pueda modificarla sin tocar la cache
+    return stats_interval.copy(), X_scaled, kmeans
 
-    kmeans = KMeans(n_clusters=3, random_state=42)
-    stats_interval['cluster'] = kmeans.fit_predict(X_scaled)
+# Goles y tarjetas por jugador entre los minutos desde y hasta, sacados del cubo jugador x
+# minuto (una resta por jugador); mismas columnas que estadisticas_por_intervalo
+def estadisticas_por_rango(desde, hasta, players, cubo):
+    with tramo('minuto.rango', jugadores=len(cubo)):
+        conteos = cubo.rango(desde, hasta, ['Goals', 'Cards'])
+    conteos = conteos[(conteos[FEATURES_INTERVALO] > 0).any(axis=1)]
+    conteos = conteos.assign(minute_interval=f"{desde}-{hasta}").set_index('minute_interval', append=True)
+    return _con_jugadores(conteos, players)
 
-    return stats_interval, X_scaled, kmeans
+# Clave de cache a partir del rango ya normalizado por parsear_rango: "76-90", "76' - 90'"
+# y "76 -90" comparten clave, como "segunda parte" y "47-90"
+def clave_rango(desde, hasta):
+    return f"{PREFIJO_RANGO}{desde}_{hasta}"
+
+# Como sugerencias_por_intervalo, pero con cualquier rango de minutos ("76-90",
+# "segunda parte") en lugar de los intervalos fijos; el clustering de cada rango se
+# guarda en data/cache hasta que cambien players/game_events (como mucho MAX_RANGOS_GUARDADOS)
+def sugerencias_por_rango(rango: str, data_path="data"):
+    desde, hasta = parsear_rango(rango)
+    catalogo = obtener_catalogo(data_path)
+    players = catalogo.tabla('players', ['player_id', 'name', 'position'])
+    stats_rango = estadisticas_por_rango(desde, hasta, players, obtener_cubo_minutos(catalogo))
+    if stats_rango.empty:
+        return None, None, None
+
+    clave = clave_rango(desde, hasta)
+
+    def construir():
+        anterior = catalogo.ultimo_derivado(clave, formato='joblib')
+        return _agrupar_intervalo(stats_rango, anterior[2] if isinstance(anterior, tuple) else None)
+
+    stats_rango, X_scaled, kmeans = catalogo.materializar(clave, ['players', 'game_events'], construir, formato='joblib',
+                                                          extra=config_sugerencias())
+    catalogo.recortar_derivados(PREFIJO_RANGO, MAX_RANGOS_GUARDADOS, formato='joblib')
+    return stats_rango.copy(), X_scaled, kmeans
@@ -0,0 +1,108 @@
+# utils/motor_clusters.py
+
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from utils.tiempos import tramo
+
+# A partir de estas filas se usa MiniBatchKMeans en lugar de KMeans completo (con pocas
+# features el KMeans completo sigue siendo más rápido hasta ~1M de filas; por debajo, el
+# minibatch solo compensa por memoria)
+UMBRAL_MINIBATCH = 500000
+TAM_LOTE = 4096
+# Filas de la muestra con la que se puntúa cada k candidato (silhouette es cuadrático)
+TAM_MUESTRA_K = 1000
+# Variación máxima del número de filas para reutilizar k y centroides del modelo anterior
+CAMBIO_MAXIMO_WARM = 0.1
+SEMILLA = 42
+
+
+def _puntuar_k(muestra, k, semilla):
+    with tramo('clusters.puntuar_k', k=k, filas=len(muestra)):
+        etiquetas = KMeans(n_clusters=k, random_state=semilla, n_init=1).fit_predict(muestra)
+    if len(np.unique(etiquetas)) < 2:
+        return -1.0
+    return float(silhouette_score(muestra, etiquetas))
+
+
+# Elige k entre `candidatos` por silhouette sobre una muestra; cada k se ajusta en paralelo.
+# Devuelve (k, {k: puntuación}). Con menos filas (o puntos distintos) que el menor candidato
+# no hay nada que elegir: un cluster por punto.
+def elegir_k(X, candidatos, tam_muestra=TAM_MUESTRA_K, semilla=SEMILLA, trabajadores=None):
+    k_minimo = max(min(candidatos), 2)
+    rng = np.random.default_rng(semilla)
+    muestra = X[rng.choice(len(X), tam_muestra, replace=False)] if len(X) > tam_muestra else X
+    distintos = len(np.unique(muestra, axis=0)) if len(muestra) else 0
+    candidatos = [k for k in candidatos if 2 <= k < distintos]
+    if not candidatos:
+        return min(k_minimo, distintos) if distintos > 1 else min(1, len(X)), {}
+    trabajadores = trabajadores or min(len(candidatos), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=trabajadores) as pool:
+        tareas = {k: pool.submit(contextvars.copy_context().run, _puntuar_k, muestra, k, semilla) for k in candidatos}
+        puntuaciones = {k: tarea.result() for k, tarea in tareas.items()}
+    # A igualdad de puntuación, el k menor
+    return max(puntuaciones, key=lambda k: (puntuaciones[k], -k)), puntuaciones
+
+
+# Configuración de k con la que se ajusta un modelo (se guarda en él como config_k_)
+def config_k(n_clusters, candidatos):
+    return (n_clusters, tuple(candidatos))
+
+
+# Centroides del modelo anterior si sirven para partir de ellos: misma configuración de k
+# (n_clusters y candidatos), mismo número de features y un número de filas parecido (los
+# datos cambiaron poco). Los modelos sin config_k_ (de antes de guardarla) no se reutilizan.
+def centros_reutilizables(anterior, X, config=None, cambio_maximo=CAMBIO_MAXIMO_WARM):
+    if anterior is None or not hasattr(anterior, 'cluster_centers_'):
+        return None
+    if config is not None and getattr(anterior, 'config_k_', None) != config:
+        return None
+    centros = anterior.cluster_centers_
+    n_anterior = getattr(anterior, 'n_filas_', None)
+    if centros.shape[1] != X.shape[1] or centros.shape[0] > len(X) or not n_anterior:
+        return None
+    if abs(len(X) - n_anterior) > cambio_maximo * n_anterior:
+        return None
+    return centros
+
+
+# Ajusta el modelo de clusters sobre X (ya escalado):
+# - n_clusters: entero o 'auto' (se elige entre `candidatos` con elegir_k)
+# - con `anterior` (modelo ajustado antes sobre datos parecidos y con la misma
+#   configuración de k) se reutilizan su k y sus centroides como inicio, sin volver a elegir k
+# - con muchas filas (o minibatch=True) se usa MiniBatchKMeans
+# El modelo devuelto guarda n_filas_, config_k_ y, si se eligió k, las puntuaciones en puntuaciones_k_.
+def ajustar_clusters(X, n_clusters='auto', candidatos=range(2, 11), anterior=None, minibatch=None, semilla=SEMILLA):
+    X = np.asarray(X, dtype=float)
+    config = config_k(n_clusters, candidatos)
+    centros = centros_reutilizables(anterior, X, config)
+    if centros is not None and n_clusters == 'auto' and len(centros) not in config[1]:
+        centros = None
+    if centros is not None and n_clusters != 'auto' and len(centros) != min(n_clusters, len(X)):
+        centros = None
+    puntuaciones = {}
+    if centros is not None:
+        k = len(centros)
+    elif n_clusters == 'auto':
+        k, puntuaciones = elegir_k(X, candidatos, semilla=semilla)
+    else:
+        # Con menos filas que clusters: un cluster por fila
+        k = min(n_clusters, len(X))
+
+    minibatch = len(X) >= UMBRAL_MINIBATCH if minibatch is None else minibatch
+    inicio = centros if centros is not None else 'k-means++'
+    n_init = 1 if centros is not None else 'auto'
+    if minibatch:
+        modelo = MiniBatchKMeans(n_clusters=k, init=inicio, n_init=n_init, batch_size=TAM_LOTE, random_state=semilla)
+    else:
+        modelo = KMeans(n_clusters=k, init=inicio, n_init=n_init, random_state=semilla)
+    with tramo('clusters.ajustar', filas=len(X), k=k, modo='minibatch' if minibatch else 'completo',
+               warm=centros is not None):
+        modelo.fit(X)
+    modelo.n_filas_ = len(X)
+    modelo.puntuaciones_k_ = puntuaciones
+    modelo.config_k_ = config
+    return modelo
@@ -1,95 +1,248 @@
+import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
+import argparse
 import os
+import threading
+import weakref
+from collections import OrderedDict
 import requests
+import sklearn
 from bs4 import BeautifulSoup
+from utils.datos import catalogo_desde_ruta, tabla_desde_ruta
+from utils.entidades import IndiceEntidades
+from utils.tiempos import tramo
 
-def entrenar_modelo(games_path="data/games.csv"):
+COLUMNAS_PARTIDOS = ['date', 'home_club_id', 'away_club_id', 'home_club_goals', 'away_club_goals']
+
+VENTANAS = (5,)
+CONFIG_MODELO = {'n_estimators': 100, 'random_state': 42}
+# Rating inicial, factor K y puntos extra del local al calcular la expectativa
+CONFIG_ELO = {'inicial': 1500.0, 'k': 20.0, 'ventaja_local': 60.0}
+# Subir al cambiar las features o el formato del artefacto guardado
+VERSION_MODELO = 3
+
+# (feature del modelo, columna rolling en matches) para cada equipo
+FEATURES_EQUIPO = [
+    ('goals_avg', 'goals_for_rolling'),
+    ('goals_conceded_avg', 'goals_against_rolling'),
+    ('goal_diff_avg', 'goal_diff_rolling'),
+    ('win_rate', 'win_rate_rolling'),
+]
+# Rating Elo: se entrena con el previo al partido y se predice con el posterior al
+# último partido (el previo al siguiente)
+FEATURE_ELO = 'elo'
+COLUMNAS_ELO = ['elo_pre', 'elo_post']
+_BASE_ROLLING = {
+    'goals_for_rolling': 'goals_for',
+    'goals_against_rolling': 'goals_against',
+    'goal_diff_rolling': 'goal_diff',
+    'win_rate_rolling': 'result_code',
+}
+
+def _sufijo(ventana):
+    # La ventana de 5 partidos conserva los nombres de columna originales
+    return '' if ventana == 5 else f'_{ventana}'
+
+# Columnas rolling con el partido de cada fila incluido (estado tras el partido, el que se
+# usa para predecir el siguiente) o, con previas=True, solo con los partidos anteriores
+# (features de entrenamiento: no pueden incluir el resultado que se quiere predecir)
+def columnas_rolling(ventanas=VENTANAS, previas=False):
+    return [f"{col}{_sufijo(v)}{'_pre' if previas else ''}" for v in ventanas for _, col in FEATURES_EQUIPO]
+
+# Columnas del snapshot por equipo (IndiceEquipos): estado tras el último partido
+def _columna_estado(columna):
+    return ('_rolling' in columna and not columna.endswith('_pre')) or columna == 'elo_post'
+
+# Por lado: las features rolling de cada ventana y el rating Elo (mismo orden que
+# columnas_rolling(ventanas, previas=True) + ['elo_pre'])
+def columnas_modelo(ventanas=VENTANAS):
+    return [columna for lado in ('home', 'away') for columna in
+            [f"{lado}_{feat}{_sufijo(v)}" for v in ventanas for feat, _ in FEATURES_EQUIPO] + [f"{lado}_{FEATURE_ELO}"]]
+
+# Medias móviles (min_periods=1) de varias columnas y ventanas en una sola pasada:
+# con sumas acumuladas globales y el inicio de cada grupo, la suma de la ventana
+# es cs[i+1] - cs[max(inicio, i+1-w)]. Los NaN no cuentan, como en rolling().
+# Con previas=True la ventana acaba en la fila anterior (como shift(1) por grupo):
+# la primera fila de cada grupo queda en NaN.
+def _medias_moviles(valores, grupos, ventanas, previas=False):
+    n = len(grupos)
+    pos = np.arange(n)
+    nuevo_grupo = np.ones(n, dtype=bool)
+    nuevo_grupo[1:] = grupos[1:] != grupos[:-1]
+    inicio = np.maximum.accumulate(np.where(nuevo_grupo, pos, 0))
+
+    nulos = np.isnan(valores)
+    suma = np.vstack([np.zeros((1, valores.shape[1])), np.cumsum(np.where(nulos, 0.0, valores), axis=0)])
+    cuenta = np.vstack([np.zeros((1, valores.shape[1])), np.cumsum(~nulos, axis=0)])
+
+    fin = pos if previas else pos + 1
+    resultados = {}
+    for ventana in ventanas:
+        desde = np.maximum(inicio, fin - ventana)
+        total = suma[fin] - suma[desde]
+        cantidad = cuenta[fin] - cuenta[desde]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            resultados[ventana] = np.where(cantidad > 0, total / np.maximum(cantidad, 1), np.nan)
+    return resultados
+
+# Ratings Elo por equipo, actualizados partido a partido en orden cronológico (O(n)).
+# El local juega con `ventaja_local` puntos extra al calcular el resultado esperado; los
+# partidos sin goles registrados no cambian los ratings. El estado (self.ratings) se
+# guarda con el modelo para seguir con los partidos nuevos sin repasar el historial.
+class MotorElo:
+    def __init__(self, inicial=1500.0, k=20.0, ventaja_local=60.0, ratings=None):
+        self.inicial = inicial
+        self.k = k
+        self.ventaja_local = ventaja_local
+        self.ratings = dict(ratings or {})
+
+    def rating(self, equipo):
+        return self.ratings.get(equipo, self.inicial)
+
+    # Probabilidad esperada (victoria = 1, empate = 0.5) del local
+    def esperado_local(self, home_id, away_id):
+        return 1.0 / (1.0 + 10 ** ((self.rating(away_id) - self.rating(home_id) - self.ventaja_local) / 400))
+
+    def copia(self):
+        return MotorElo(self.inicial, self.k, self.ventaja_local, self.ratings)
+
+    # Procesa los partidos en el orden dado y devuelve, por partido, el rating previo del
+    # local, el del visitante y los puntos que gana el local (los que pierde el visitante)
+    def procesar(self, home_ids, away_ids, home_goals, away_goals):
+        n = len(home_ids)
+        previo_local, previo_visitante, cambio = np.empty(n), np.empty(n), np.zeros(n)
+        ratings, inicial, k, ventaja = self.ratings, self.inicial, self.k, self.ventaja_local
+        for i, (home, away, goles_local, goles_visitante) in enumerate(zip(
+                np.asarray(home_ids).tolist(), np.asarray(away_ids).tolist(),
+                np.asarray(home_goals, dtype=float).tolist(), np.asarray(away_goals, dtype=float).tolist())):
+            rating_local = ratings.get(home, inicial)
+            rating_visitante = ratings.get(away, inicial)
+            previo_local[i] = rating_local
+            previo_visitante[i] = rating_visitante
+            if goles_local != goles_local or goles_visitante != goles_visitante:
+                continue
+            esperado = 1.0 / (1.0 + 10 ** ((rating_visitante - rating_local - ventaja) / 400))
+            real = 1.0 if goles_local > goles_visitante else 0.0 if goles_local < goles_visitante else 0.5
+            cambio[i] = k * (real - esperado)
+            ratings[home] = rating_local + cambio[i]
+            ratings[away] = rating_visitante - cambio[i]
+        return previo_local, previo_visitante, cambio
+
+# Pasa games a una fila por equipo y partido con resultado, estadísticas rolling y
+# ratings Elo (previo y posterior al partido). `motor`: MotorElo con el estado anterior
+# a estos partidos (se actualiza); sin él, se empieza con todos los ratings iniciales.
+# Devuelve también, para cada partido, la fila del local y la del visitante.
+def construir_partidos(games, ventanas=VENTANAS, motor=None):
+    n = len(games)
+    home_goals = games['home_club_goals'].to_numpy(dtype=float)
+    away_goals = games['away_club_goals'].to_numpy(dtype=float)
+
+    # Misma disposición que concat([locales, visitantes]): primero locales, luego visitantes
+    matches = pd.DataFrame({
+        'date': np.concatenate([games['date'].to_numpy(), games['date'].to_numpy()]),
+        'team_id': np.concatenate([games['home_club_id'].to_numpy(), games['away_club_id'].to_numpy()]),
+        'opponent_id': np.concatenate([games['away_club_id'].to_numpy(), games['home_club_id'].to_numpy()]),
+        'is_home': np.repeat([1, 0], n),
+        'goals_for': np.concatenate([games['home_club_goals'].to_numpy(), games['away_club_goals'].to_numpy()]),
+        'goals_against': np.concatenate([games['away_club_goals'].to_numpy(), games['home_club_goals'].to_numpy()]),
+    })
+
+    # Elo en una pasada por los partidos en orden cronológico
+    motor = motor if motor is not None else MotorElo(**CONFIG_ELO)
+    cronologico = np.argsort(games['date'].to_numpy(), kind='stable')
+    previo_local, previo_visitante, cambio = (np.empty(n), np.empty(n), np.empty(n))
+    previo_local[cronologico], previo_visitante[cronologico], cambio[cronologico] = motor.procesar(
+        games['home_club_id'].to_numpy()[cronologico], games['away_club_id'].to_numpy()[cronologico],
+        home_goals[cronologico], away_goals[cronologico])
+    matches['elo_pre'] = np.concatenate([previo_local, previo_visitante])
+    matches['elo_post'] = np.concatenate([previo_local + cambio, previo_visitante - cambio])
+
+    # Por equipo en el mismo orden cronológico (a igual fecha, el orden de games)
+    rango = np.empty(n, dtype=np.int64)
+    rango[cronologico] = np.arange(n)
+    orden = np.lexsort((np.concatenate([rango, rango]), matches['team_id'].to_numpy()))
+    matches = matches.iloc[orden]
+
+    # Resultado del partido
+    goles_favor = np.concatenate([home_goals, away_goals])[orden]
+    goles_contra = np.concatenate([away_goals, home_goals])[orden]
+    matches['result'] = np.where(goles_favor > goles_contra, 'W', np.where(goles_favor < goles_contra, 'L', 'D'))
+    matches['goal_diff'] = matches['goals_for'] - matches['goals_against']
+    matches['result_code'] = np.where(goles_favor > goles_contra, 1.0, np.where(goles_favor < goles_contra, 0.0, 0.5))
+
+    # Rolling stats de todas las columnas y ventanas a la vez
+    bases = list(_BASE_ROLLING.values())
+    valores = matches[bases].to_numpy(dtype=float)
+    for previas in (False, True):
+        medias = _medias_moviles(valores, matches['team_id'].to_numpy(), ventanas, previas)
+        for ventana, media in medias.items():
+            for j, col in enumerate(_BASE_ROLLING):
+                matches[f"{col}{_sufijo(ventana)}{'_pre' if previas else ''}"] = media[:, j]
+
+    columnas = ['date', 'team_id', 'opponent_id', 'is_home', 'goals_for', 'goals_against', 'result', 'goal_diff',
+                'goals_for_rolling', 'goals_against_rolling', 'goal_diff_rolling', 'result_code', 'win_rate_rolling']
+    columnas += [c for c in columnas_rolling(ventanas) if c not in columnas] + columnas_rolling(ventanas, previas=True) + COLUMNAS_ELO
+    matches = matches[[c for c in columnas if c in matches.columns]]
+
+    # Posición de cada partido en games: las filas 0..n-1 son locales y n..2n-1 visitantes
+    partido = np.where(orden < n, orden, orden - n)
+    return matches, partido
+
+# Tabla de features del modelo, una fila por partido (local contra visitante):
+# devuelve X, y (1/0/-1), matches (filas por equipo válidas) y, para cada fila de X,
+# su posición en games
+def construir_features(games, ventanas=VENTANAS):
+    with tramo('prediccion.features', partidos=len(games)):
+        matches, partido = construir_partidos(games, ventanas)
+
+    # Limpiar NaNs
+    validos = matches[['goals_for_rolling', 'win_rate_rolling']].notna().all(axis=1).to_numpy()
+    matches = matches[validos]
+    partido = partido[validos]
+
+    # Emparejar local y visitante por partido (sin merge), en el orden de los locales
+    es_local = matches['is_home'].to_numpy() == 1
+    fila_visitante = pd.Series(np.flatnonzero(~es_local), index=partido[~es_local])
+    fila_visitante = fila_visitante[~fila_visitante.index.duplicated()]
+    filas_local = np.flatnonzero(es_local)
+    emparejadas = fila_visitante.reindex(partido[filas_local]).to_numpy()
+    tiene_pareja = ~np.isnan(emparejadas)
+    filas_local = filas_local[tiene_pareja]
+    filas_visitante = emparejadas[tiene_pareja].astype(int)
+
+    if len(filas_local) == 0:
+        raise ValueError("Merge resulted in an empty DataFrame. Check data alignment or matches.")
+
+    # Features con los partidos anteriores de cada equipo; sin partidos previos de
+    # alguno de los dos, el partido no entra en el entrenamiento
+    rolling = columnas_rolling(ventanas, previas=True) + ['elo_pre']
+    valores = matches[rolling].to_numpy(dtype=float)
+    X = np.hstack([valores[filas_local], valores[filas_visitante]])
+    completas = ~np.isnan(X).any(axis=1)
+    if not completas.any():
+        raise ValueError("No matches with previous history for both teams.")
+    X = pd.DataFrame(X[completas], columns=columnas_modelo(ventanas))
+    y = matches['result'].to_numpy()[filas_local[completas]]
+    y = pd.Series(y).map({'W': 1, 'D': 0, 'L': -1})
+    return X, y, matches, partido[filas_local[completas]]
+
+def entrenar_modelo(games_path="data/games.csv", catalogo=None, ventanas=VENTANAS):
     try:
-        games = pd.read_csv(games_path, parse_dates=["date"])
-        if not all(col in games.columns for col in ['date', 'home_club_id', 'away_club_id', 'home_club_goals', 'away_club_goals']):
+        games = tabla_desde_ruta(games_path, COLUMNAS_PARTIDOS, parse_dates=["date"], catalogo=catalogo)
+        if not all(col in games.columns for col in COLUMNAS_PARTIDOS):
             raise ValueError("Missing required columns in games.csv")
 
-        # Crear dataframes locales y visitantes
-        home_df = games[['date', 'home_club_id', 'away_club_id', 'home_club_goals', 'away_club_goals']].copy()
-        home_df['team_id'] = home_df['home_club_id']
-        home_df['opponent_id'] = home_df['away_club_id']
-        home_df['is_home'] = 1
-        home_df['goals_for'] = home_df['home_club_goals']
-        home_df['goals_against'] = home_df['away_club_goals']
-
-        away_df = games[['date', 'away_club_id', 'home_club_id', 'away_club_goals', 'home_club_goals']].copy()
-        away_df['team_id'] = away_df['away_club_id']
-        away_df['opponent_id'] = away_df['home_club_id']
-        away_df['is_home'] = 0
-        away_df['goals_for'] = away_df['away_club_goals']
-        away_df['goals_against'] = away_df['home_club_goals']
-
-        matches = pd.concat([home_df, away_df], ignore_index=True)
-        matches = matches[['date', 'team_id', 'opponent_id', 'is_home', 'goals_for', 'goals_against']].sort_values(['team_id', 'date'])
-
-        # Resultado del partido
-        matches['result'] = matches.apply(lambda row: 'W' if row['goals_for'] > row['goals_against']
-                                          else 'L' if row['goals_for'] < row['goals_against'] else 'D', axis=1)
-        matches['goal_diff'] = matches['goals_for'] - matches['goals_against']
-
-        # Rolling stats
-        matches['goals_for_rolling'] = matches.groupby('team_id')['goals_for'].transform(lambda x: x.rolling(window=5, min_periods=1).mean())
-        matches['goals_against_rolling'] = matches.groupby('team_id')['goals_against'].transform(lambda x: x.rolling(window=5, min_periods=1).mean())
-        matches['goal_diff_rolling'] = matches.groupby('team_id')['goal_diff'].transform(lambda x: x.rolling(window=5, min_periods=1).mean())
-        result_map = {'W': 1, 'D': 0.5, 'L': 0}
-        matches['result_code'] = matches['result'].map(result_map)
-        matches['win_rate_rolling'] = matches.groupby('team_id')['result_code'].transform(lambda x: x.rolling(window=5, min_periods=1).mean())
-
-        # Limpiar NaNs
-        matches = matches.dropna(subset=['goals_for_rolling', 'win_rate_rolling'])
-
-        # Dividir local y visitante
-        home_stats = matches[matches['is_home'] == 1].copy()
-        away_stats = matches[matches['is_home'] == 0].copy()
-
-        home_stats = home_stats.rename(columns={
-            'team_id': 'home_team',
-            'opponent_id': 'away_team',
-            'goals_for_rolling': 'home_goals_avg',
-            'goals_against_rolling': 'home_goals_conceded_avg',
-            'goal_diff_rolling': 'home_goal_diff_avg',
-            'win_rate_rolling': 'home_win_rate',
-            'result': 'match_result'
-        })
-
-        away_stats = away_stats.rename(columns={
-            'team_id': 'away_team',
-            'opponent_id': 'home_team',
-            'goals_for_rolling': 'away_goals_avg',
-            'goals_against_rolling': 'away_goals_conceded_avg',
-            'goal_diff_rolling': 'away_goal_diff_avg',
-            'win_rate_rolling': 'away_win_rate',
-            'result': 'match_result_away'
-        })
-
-        df_model = pd.merge(home_stats, away_stats, on=['date', 'home_team', 'away_team'], how='inner')
-
-        if df_model.empty:
-            raise ValueError("Merge resulted in an empty DataFrame. Check data alignment or matches.")
-
-        if 'match_result' not in df_model.columns:
-            raise KeyError("match_result column not found in df_model. Check merge and column renaming.")
-        df_model['target'] = df_model['match_result'].map({'W': 1, 'D': 0, 'L': -1})
-
-        numerical_columns = [
-            'home_goals_avg', 'home_goals_conceded_avg', 'home_goal_diff_avg', 'home_win_rate',
-            'away_goals_avg', 'away_goals_conceded_avg', 'away_goal_diff_avg', 'away_win_rate'
-        ]
-        X = df_model[numerical_columns]
-        y = df_model['target']
+        X, y, matches, _ = construir_features(games, ventanas)
 
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, shuffle=False)
 
-        model = RandomForestClassifier(n_estimators=100, random_state=42)
-        model.fit(X_train, y_train)
+        model = RandomForestClassifier(**CONFIG_MODELO)
+        with tramo('prediccion.entrenar', filas=len(X_train)):
+            model.fit(X_train, y_train)
 
+        obtener_indice_equipos(matches)
         return model, matches
 
     except FileNotFoundError:
@@ -97,42 +250,301 @@ def entrenar_modelo(games_path="data/games.csv"):
     except Exception as e:
         raise Exception(f"Error in entrenar_modelo: {e}")
 
+# Modelo, features y snapshot por equipo guardados en data/cache como artefacto
+# versionado: solo se reentrena si cambia el contenido de games.csv o la configuración
+def _config_modelo(ventanas):
+    return (VERSION_MODELO, sklearn.__version__, tuple(ventanas), tuple(sorted(CONFIG_MODELO.items())),
+            tuple(sorted(CONFIG_ELO.items())))
+
+# Artefacto del modelo guardado si está al día con games (None si no hay)
+def leer_artefacto_modelo(games_path="data/games.csv", catalogo=None, ventanas=VENTANAS):
+    nombre = os.path.splitext(os.path.basename(games_path))[0]
+    catalogo = catalogo_desde_ruta(games_path, catalogo)
+    hash_partidos = catalogo.hash_contenido(nombre)
+    if hash_partidos is None:
+        return None
+    return catalogo.leer_derivado(f'modelo_{nombre}', [], formato='joblib', extra=(hash_partidos, _config_modelo(ventanas)))
+
+def guardar_artefacto_modelo(artefacto, games_path="data/games.csv", catalogo=None):
+    nombre = os.path.splitext(os.path.basename(games_path))[0]
+    catalogo = catalogo_desde_ruta(games_path, catalogo)
+    catalogo.guardar_derivado(f'modelo_{nombre}', [], artefacto, formato='joblib',
+                              extra=(catalogo.hash_contenido(nombre), _config_modelo(artefacto['ventanas'])))
+
+# Artefacto con partidos nuevos sin reentrenar: se calculan las filas por equipo de esos
+# partidos con la cola (últimos max(ventanas) partidos) de cada equipo y se añaden al
+# historial. El modelo se mantiene; las predicciones usan el estado rolling actualizado.
+# Los partidos deben ser posteriores al último registrado de cada equipo.
+def actualizar_artefacto_modelo(artefacto, games):
+    ventanas, matches, indice = artefacto['ventanas'], artefacto['matches'], artefacto['indice']
+    if not all(col in games.columns for col in COLUMNAS_PARTIDOS):
+        raise ValueError(f"Los partidos nuevos deben contener las columnas: {', '.join(COLUMNAS_PARTIDOS)}")
+    games = games.assign(date=pd.to_datetime(games['date'], errors='coerce'))
+    motor = artefacto['elo'].copia()
+    nuevas, _ = construir_partidos(games, ventanas, motor)
+
+    cola = max(ventanas)
+    filas_cola = []
+    for equipo, fecha in nuevas.groupby('team_id', sort=False)['date'].min().items():
+        ini, fin = indice.tramos.get(equipo, (0, 0))
+        if fin > ini and indice.historial['date'].iat[fin - 1] > fecha:
+            raise ValueError(f"El equipo {equipo} tiene partidos nuevos anteriores a su último partido registrado")
+        filas_cola.append(np.arange(max(ini, fin - cola), fin))
+    historial_cola = indice.historial.iloc[np.concatenate(filas_cola) if filas_cola else []]
+
+    # Medias móviles de cola + partidos nuevos; solo se conservan las de los nuevos
+    bases = list(_BASE_ROLLING.values())
+    combinado = pd.concat([historial_cola[['team_id', 'date'] + bases], nuevas[['team_id', 'date'] + bases]], ignore_index=True)
+    es_nueva = np.r_[np.zeros(len(historial_cola), dtype=bool), np.ones(len(nuevas), dtype=bool)]
+    orden = np.lexsort((combinado['date'].to_numpy(), combinado['team_id'].to_numpy()))
+    for previas in (False, True):
+        medias = _medias_moviles(combinado[bases].to_numpy(dtype=float)[orden], combinado['team_id'].to_numpy()[orden],
+                                 ventanas, previas)
+        for ventana, media in medias.items():
+            for j, col in enumerate(_BASE_ROLLING):
+                nuevas[f"{col}{_sufijo(ventana)}{'_pre' if previas else ''}"] = media[es_nueva[orden], j]
+
+    nuevas = nuevas[nuevas[['goals_for_rolling', 'win_rate_rolling']].notna().all(axis=1).to_numpy()]
+    matches = pd.concat([matches, nuevas[matches.columns]], ignore_index=True)
+    return {**artefacto, 'matches': matches, 'indice': IndiceEquipos(matches), 'elo': motor}
+
+def cargar_o_entrenar_modelo(games_path="data/games.csv", catalogo=None, ventanas=VENTANAS):
+    nombre = os.path.splitext(os.path.basename(games_path))[0]
+    catalogo = catalogo_desde_ruta(games_path, catalogo)
+    ventanas = tuple(ventanas)
+
+    def construir():
+        model, matches = entrenar_modelo(games_path, catalogo, ventanas)
+        indice = obtener_indice_equipos(matches)
+        return {
+            'version': VERSION_MODELO,
+            'model': model,
+            'columnas': list(model.feature_names_in_),
+            'ventanas': ventanas,
+            'matches': matches,
+            'indice': indice,
+            'elo': MotorElo(**CONFIG_ELO, ratings=indice.ratings_elo()),
+        }
+
+    hash_partidos = catalogo.hash_contenido(nombre)
+    if hash_partidos is None:
+        artefacto = construir()
+    else:
+        artefacto = catalogo.materializar(f'modelo_{nombre}', [], construir, formato='joblib',
+                                          extra=(hash_partidos, _config_modelo(ventanas)))
+    obtener_indice_equipos(artefacto['matches'], artefacto['indice'])
+    return artefacto['model'], artefacto['matches']
+
+# Columna de matches de la que sale cada feature del modelo (p. ej. home_goals_avg_10 -> goals_for_rolling_10)
+def _origen_features(columnas):
+    origen = {}
+    for columna in columnas:
+        lado, resto = columna.split('_', 1)
+        if resto == FEATURE_ELO:
+            origen[columna] = (lado, 'elo_post')
+            continue
+        for feat, col in FEATURES_EQUIPO:
+            if resto == feat or resto.startswith(feat + '_'):
+                origen[columna] = (lado, col + resto[len(feat):])
+                break
+    return origen
+
+RESULTADOS = {1: "Gana el local", 0: "Empate", -1: "Gana el visitante"}
+COLUMNAS_HISTORIAL = ['date', 'goals_for_rolling', 'goals_against_rolling', 'goal_diff_rolling', 'win_rate_rolling', 'elo_post']
+
+# Índice por equipo construido una vez tras el entrenamiento: último vector de features
+# de cada equipo y su historial como tramo contiguo, más una cache LRU de predicciones.
+class IndiceEquipos:
+    def __init__(self, matches, tam_cache=4096):
+        ordenado = matches.sort_values(['team_id', 'date'], kind='stable')
+        equipos = ordenado['team_id'].to_numpy()
+        inicios = np.flatnonzero(np.r_[True, equipos[1:] != equipos[:-1]]) if len(equipos) else np.array([], dtype=int)
+        fines = np.r_[inicios[1:], len(equipos)].astype(int)
+
+        self.historial = ordenado.reset_index(drop=True)
+        self.tramos = {equipo: (ini, fin) for equipo, ini, fin in zip(equipos[inicios], inicios, fines)}
+        self.columnas = [c for c in ordenado.columns if _columna_estado(c)]
+        self.ultimos = ordenado[self.columnas].to_numpy(dtype=float)[fines - 1] if len(fines) else np.empty((0, len(self.columnas)))
+        self.fila = {equipo: i for i, equipo in enumerate(equipos[inicios])}
+
+        # Claves (equipo, día) ordenadas para búsquedas "último partido antes de"
+        self._fines = fines
+        self._codigos = np.repeat(np.arange(len(inicios)), fines - inicios)
+        dias = pd.to_datetime(self.historial['date']).to_numpy().astype('datetime64[D]')
+        self._claves = self._codigos * _ESCALA_DIAS + _dias(dias)
+
+        self.tam_cache = tam_cache
+        self._cache = OrderedDict()
+        self._modelo = None
+        self._lock = threading.Lock()
+
+    # Se guarda dentro del artefacto del modelo: sin lock ni cache de predicciones
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        for clave in ('_cache', '_modelo', '_lock'):
+            estado.pop(clave)
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._cache = OrderedDict()
+        self._modelo = None
+        self._lock = threading.Lock()
+
+    def ultimo(self, team_id):
+        fila = self.fila.get(team_id)
+        if fila is None:
+            return None
+        return dict(zip(self.columnas, self.ultimos[fila]))
+
+    # Rating Elo actual de cada equipo (el posterior a su último partido)
+    def ratings_elo(self):
+        if 'elo_post' not in self.columnas:
+            return {}
+        posicion = self.columnas.index('elo_post')
+        return {int(equipo): float(self.ultimos[fila, posicion]) for equipo, fila in self.fila.items()}
+
+    def historial_equipo(self, team_id, columnas=COLUMNAS_HISTORIAL):
+        ini, fin = self.tramos.get(team_id, (0, 0))
+        return self.historial.iloc[ini:fin][[c for c in columnas if c in self.historial.columns]]
+
+    def vector_partido(self, model, home_id, away_id):
+        columnas = list(getattr(model, 'feature_names_in_', columnas_modelo()))
+        posicion = {c: j for j, c in enumerate(self.columnas)}
+        fila = {'home': self.fila[home_id], 'away': self.fila[away_id]}
+        valores = [self.ultimos[fila[lado], posicion[col]] for lado, col in _origen_features(columnas).values()]
+        return pd.DataFrame([valores], columns=columnas)
+
+    # Fila del historial con el último partido de cada equipo anterior a cada fecha
+    # (o el último disponible si la fecha es NaT); -1 si no hay ninguno
+    def filas_previas(self, team_ids, fechas=None):
+        codigos = pd.Series(self.fila).reindex(np.asarray(team_ids)).to_numpy()
+        conocido = ~np.isnan(codigos)
+        codigos = np.where(conocido, codigos, 0).astype(np.int64)
+        filas = np.where(conocido, self._fines[codigos] - 1, -1)
+        if fechas is None:
+            return filas
+
+        dias = pd.to_datetime(pd.Series(fechas)).to_numpy(dtype='datetime64[D]')
+        con_fecha = ~np.isnat(dias)
+        claves = codigos * _ESCALA_DIAS + _dias(dias)
+        previas = np.searchsorted(self._claves, claves, side='left') - 1
+        mismo_equipo = (previas >= 0) & (self._codigos[np.maximum(previas, 0)] == codigos)
+        return np.where(con_fecha, np.where(mismo_equipo & conocido, previas, -1), filas)
+
+    def predecir(self, model, home_id, away_id):
+        for equipo in (home_id, away_id):
+            if equipo not in self.fila:
+                raise KeyError(f"No hay datos del equipo {equipo}")
+        clave = (home_id, away_id)
+        with self._lock:
+            if self._modelo is not model:
+                self._cache.clear()
+                self._modelo = model
+            elif clave in self._cache:
+                self._cache.move_to_end(clave)
+                return self._cache[clave]
+
+        with tramo('prediccion.predecir'):
+            prob = model.predict_proba(self.vector_partido(model, home_id, away_id))[0]
+        resultado = (RESULTADOS[model.classes_[np.argmax(prob)]], prob)
+
+        with self._lock:
+            self._cache[clave] = resultado
+            if len(self._cache) > self.tam_cache:
+                self._cache.popitem(last=False)
+        return resultado
+
+# Claves (equipo, día) ordenables como un único entero
+_ESCALA_DIAS = 10 ** 6
+
+def _dias(dias):
+    valores = dias.astype('int64')
+    # NaT cuenta como la fecha más antigua posible
+    return np.where(np.isnat(dias), 0, np.clip(valores + _ESCALA_DIAS // 2, 1, _ESCALA_DIAS - 1))
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+# Índice asociado a un DataFrame matches concreto (se construye la primera vez,
+# salvo que se pase uno ya construido, p. ej. el guardado en el artefacto)
+def obtener_indice_equipos(matches, indice=None):
+    with _indices_lock:
+        entrada = _indices.get(id(matches))
+        if indice is None and entrada is not None and entrada[0]() is matches:
+            return entrada[1]
+    if indice is None:
+        indice = IndiceEquipos(matches)
+    clave = id(matches)
+    with _indices_lock:
+        _indices[clave] = (weakref.ref(matches, lambda _: _indices.pop(clave, None)), indice)
+    return indice
+
+def limpiar_indices_equipos():
+    with _indices_lock:
+        _indices.clear()
+
 def predecir_resultado(model, matches, home_id, away_id):
-    last_home = matches[matches['team_id'] == home_id].sort_values('date').iloc[-1]
-    last_away = matches[matches['team_id'] == away_id].sort_values('date').iloc[-1]
-
-    nuevo_input = pd.DataFrame([{
-        'home_goals_avg': last_home['goals_for_rolling'],
-        'home_goals_conceded_avg': last_home['goals_against_rolling'],
-        'home_goal_diff_avg': last_home['goal_diff_rolling'],
-        'home_win_rate': last_home['win_rate_rolling'],
-        'away_goals_avg': last_away['goals_for_rolling'],
-        'away_goals_conceded_avg': last_away['goals_against_rolling'],
-        'away_goal_diff_avg': last_away['goal_diff_rolling'],
-        'away_win_rate': last_away['win_rate_rolling']
-    }])
-
-    pred = model.predict(nuevo_input)[0]
-    prob = model.predict_proba(nuevo_input)[0]
-    resultado = {1: "Gana el local", 0: "Empate", -1: "Gana el visitante"}
-    return resultado[pred], prob
+    return obtener_indice_equipos(matches).predecir(model, home_id, away_id)
+
+# Predicción de muchos partidos a la vez. fixtures: DataFrame con home_id, away_id y,
+# opcionalmente, date (se usan las estadísticas de antes de esa fecha).
+def predecir_lote(model, matches, fixtures):
+    indice = obtener_indice_equipos(matches)
+    fechas = fixtures['date'] if 'date' in fixtures.columns else None
+    filas = {
+        'home': indice.filas_previas(fixtures['home_id'].to_numpy(), fechas),
+        'away': indice.filas_previas(fixtures['away_id'].to_numpy(), fechas),
+    }
+    validas = (filas['home'] >= 0) & (filas['away'] >= 0)
+
+    # Matriz de features en un solo paso y una única llamada a predict_proba
+    columnas = list(getattr(model, 'feature_names_in_', columnas_modelo()))
+    valores = indice.historial[indice.columnas].to_numpy(dtype=float)
+    posicion = {c: j for j, c in enumerate(indice.columnas)}
+    X = np.empty((int(validas.sum()), len(columnas)))
+    for j, (lado, col) in enumerate(_origen_features(columnas).values()):
+        X[:, j] = valores[filas[lado][validas], posicion[col]]
+
+    prob = np.full((len(fixtures), 3), np.nan)
+    if len(X):
+        with tramo('prediccion.lote', partidos=len(X)):
+            proba = model.predict_proba(pd.DataFrame(X, columns=columnas))
+        orden = {clase: j for j, clase in enumerate(model.classes_)}
+        for k, clase in enumerate([1, 0, -1]):
+            if clase in orden:
+                prob[validas, k] = proba[:, orden[clase]]
+            else:
+                prob[validas, k] = 0.0
+
+    salida = fixtures.copy()
+    salida['prob_local'] = prob[:, 0]
+    salida['prob_empate'] = prob[:, 1]
+    salida['prob_visitante'] = prob[:, 2]
+    prediccion = np.array([RESULTADOS[1], RESULTADOS[0], RESULTADOS[-1]], dtype=object)[np.argmax(np.nan_to_num(prob, nan=-1), axis=1)]
+    salida['prediccion'] = np.where(validas, prediccion, None)
+    return salida
 
 def obtener_rolling_stats_equipo(matches, team_id):
-    equipo = matches[matches['team_id'] == team_id].sort_values('date').copy()
-    return equipo[['date', 'goals_for_rolling', 'goals_against_rolling', 'goal_diff_rolling', 'win_rate_rolling']]
+    return obtener_indice_equipos(matches).historial_equipo(team_id)
 
+# clubs_df: DataFrame de clubs o su IndiceEntidades (búsqueda directa por id)
 def obtener_nombre_equipo(club_id, clubs_df):
+    if isinstance(clubs_df, IndiceEntidades):
+        return clubs_df.nombre(club_id, f"Equipo {club_id}")
     fila = clubs_df[clubs_df["club_id"] == club_id]
     if not fila.empty:
         return fila.iloc[0]["name"]
     else:
         return f"Equipo {club_id}"
 
-def obtener_url_escudo(club_url):
+HEADERS_HTTP = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+def obtener_url_escudo(club_url, session=None, timeout=10):
     try:
-        # Hacer una solicitud HTTP a la página del club
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(club_url, headers=headers)
+        # Hacer una solicitud HTTP a la página del club (con la sesión compartida si se pasa)
+        cliente = session if session is not None else requests
+        response = cliente.get(club_url, headers=HEADERS_HTTP, timeout=timeout)
         response.raise_for_status()  # Lanzar excepción si hay error en la solicitud
 
         # Analizar el HTML con BeautifulSoup
@@ -156,4 +568,24 @@ def obtener_url_escudo(club_url):
             return None
     except Exception as e:
         print(f"Error al obtener la URL del escudo desde {club_url}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Predicción por lotes de partidos (home_id, away_id, date)")
+    parser.add_argument('fixtures', help="CSV con las columnas home_id, away_id y opcionalmente date")
+    parser.add_argument('-o', '--salida', default='predicciones.csv', help="CSV de salida con probabilidades")
+    parser.add_argument('--games', default='data/games.csv', help="Histórico de partidos (se reutiliza el modelo guardado si no cambió)")
+    args = parser.parse_args(argv)
+
+    fixtures = pd.read_csv(args.fixtures)
+    if not {'home_id', 'away_id'} <= set(fixtures.columns):
+        parser.error("El archivo de partidos debe contener las columnas: home_id, away_id")
+
+    model, matches = cargar_o_entrenar_modelo(args.games)
+    resultado = predecir_lote(model, matches, fixtures)
+    resultado.to_csv(args.salida, index=False)
+    sin_datos = int(resultado['prediccion'].isna().sum())
+    print(f"{len(resultado)} partidos predichos en {args.salida}" + (f" ({sin_datos} sin datos de algún equipo)" if sin_datos else ""))
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,176 @@
+import contextvars
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from statsmodels.tsa.arima.model import ARIMA
 import streamlit as st
+from utils.datos import catalogo_desde_ruta, nombre_tabla, sumar_parciales, tabla_desde_ruta
+from utils.procesos import en_proceso
+from utils.tiempos import tramo
 
-def plot_predicciones_arima(player_id, years_back=2, appearances_path="data/appearances.csv"):
-    # Cargar datos
-    try:
-        df = pd.read_csv(appearances_path, parse_dates=["date"])
-    except FileNotFoundError:
-        st.error("No se encontró el archivo 'data/appearances.csv'.")
+PASOS_PRONOSTICO = 12
+# Órdenes baratos entre los que se elige por AIC (antes siempre (10, 1, 10))
+ORDENES_CANDIDATOS = [(0, 0, 0), (1, 0, 0), (0, 1, 1), (1, 1, 0), (1, 1, 1), (2, 1, 2)]
+
+# Tabla de pronósticos que escribe el trabajo por lotes (utils/pronostico_lote.py)
+CLAVE_PRONOSTICOS_LOTE = 'pronosticos'
+
+def config_pronostico():
+    return (PASOS_PRONOSTICO, tuple(ORDENES_CANDIDATOS))
+
+_cache_pronosticos = OrderedDict()
+_TAM_CACHE_PRONOSTICOS = 1024
+_cache_lock = threading.Lock()
+# Hilos para ajustar goles y asistencias a la vez; se crea con el primer pronóstico en vivo,
+# no al importar el módulo
+_pool_arima = None
+_pool_lock = threading.Lock()
+
+# Ajusta cada orden candidato y se queda con el de menor AIC (None si ninguno converge)
+def _mejor_arima(valores, ordenes):
+    mejor = None
+    for orden in ordenes:
+        p, d, q = orden
+        if len(valores) < p + d + q + 3:  # Pocos puntos para este orden
+            continue
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                resultado = ARIMA(valores, order=orden).fit()
+        except Exception:
+            continue
+        if np.isfinite(resultado.aic) and (mejor is None or resultado.aic < mejor[1].aic):
+            mejor = (orden, resultado)
+    return mejor
+
+def ajustar_pronostico(serie, pasos=PASOS_PRONOSTICO, ordenes=ORDENES_CANDIDATOS):
+    valores = np.asarray(serie, dtype=float)
+    with tramo('procesado.arima', meses=len(valores)):
+        mejor = _mejor_arima(valores, ordenes)
+    if mejor is None:
+        raise ValueError(f"No se pudo ajustar ningún modelo ARIMA a una serie de {len(valores)} meses")
+    orden, resultado = mejor
+    return orden, np.asarray(resultado.forecast(steps=pasos))
+
+# Pronóstico cacheado por (jugador, serie, último mes con datos, contenido de la serie).
+# El ajuste va al pool de procesos si lo hay (rutas pesadas de la API); la cache, aquí.
+def pronosticar_serie(player_id, nombre_serie, serie, pasos=PASOS_PRONOSTICO):
+    valores = np.asarray(serie, dtype=float)
+    clave = (player_id, nombre_serie, serie.index.max(), pasos, hash(valores.tobytes()))
+    with _cache_lock:
+        if clave in _cache_pronosticos:
+            _cache_pronosticos.move_to_end(clave)
+            return _cache_pronosticos[clave]
+
+    resultado = en_proceso(ajustar_pronostico, valores, pasos)
+    with _cache_lock:
+        _cache_pronosticos[clave] = resultado
+        if len(_cache_pronosticos) > _TAM_CACHE_PRONOSTICOS:
+            _cache_pronosticos.popitem(last=False)
+    return resultado
+
+def limpiar_cache_pronosticos():
+    with _cache_lock:
+        _cache_pronosticos.clear()
+
+# Parciales acumulados antes de combinarlos (acota la memoria del modo por bloques)
+_MAX_PARCIALES = 16
+COLUMNAS_SERIES = ['player_id', 'date', 'goals', 'assists']
+
+# Goles y asistencias por (jugador, mes como año * 12 + mes - 1)
+def _sumas_mensuales(appearances):
+    df = appearances[COLUMNAS_SERIES].dropna(subset=['date'])
+    mes = (df['date'].dt.year * 12 + df['date'].dt.month - 1).rename('mes')
+    return df.groupby([df['player_id'], mes])[['goals', 'assists']].sum()
+
+# Como resample('ME'), se rellenan con 0 los meses sin partidos entre el primero y el último
+def _completar_meses(sumas):
+    if sumas.empty:
+        return pd.DataFrame(columns=['goals', 'assists'], index=pd.MultiIndex.from_arrays([[], []], names=['player_id', 'date']))
+
+    limites = sumas.index.to_frame(index=False).groupby('player_id')['mes'].agg(['min', 'max'])
+    largos = (limites['max'] - limites['min'] + 1).to_numpy()
+    desplazamiento = np.arange(largos.sum()) - np.repeat(np.cumsum(largos) - largos, largos)
+    meses = np.repeat(limites['min'].to_numpy(), largos) + desplazamiento
+    jugadores = np.repeat(limites.index.to_numpy(), largos)
+
+    completo = sumas.reindex(pd.MultiIndex.from_arrays([jugadores, meses], names=['player_id', 'mes']), fill_value=0)
+    fechas = pd.to_datetime(pd.DataFrame({'year': meses // 12, 'month': meses % 12 + 1, 'day': 1})) + pd.offsets.MonthEnd(0)
+    completo.index = pd.MultiIndex.from_arrays([jugadores, fechas], names=['player_id', 'date'])
+    return completo
+
+# Goles y asistencias mensuales de todos los jugadores en una sola agrupación
+def series_mensuales(appearances):
+    return _completar_meses(_sumas_mensuales(appearances))
+
+# Igual que series_mensuales(appearances), leyendo appearances por bloques si el
+# catálogo tiene presupuesto de memoria
+def cargar_series_mensuales(catalogo):
+    if not catalogo.por_bloques:
+        return series_mensuales(catalogo.tabla('appearances', COLUMNAS_SERIES, parse_dates=['date']))
+    parciales = []
+    for bloque in catalogo.bloques('appearances', COLUMNAS_SERIES, parse_dates=['date']):
+        parciales.append(_sumas_mensuales(bloque))
+        if len(parciales) >= _MAX_PARCIALES:
+            parciales = [sumar_parciales(parciales)]
+    return _completar_meses(sumar_parciales(parciales) if parciales else pd.DataFrame())
+
+# Pronóstico del trabajo por lotes si la tabla está al día con appearances
+def pronostico_precalculado(player_id, catalogo):
+    tabla = catalogo.leer_derivado(CLAVE_PRONOSTICOS_LOTE, ['appearances'], extra=config_pronostico())
+    if tabla is None or player_id not in tabla.index:
+        return None
+    filas = tabla.loc[[player_id]]
+    if filas['error'].notna().any() or len(filas) != PASOS_PRONOSTICO:
         return None
+    return filas
+
+# Tabla del trabajo por lotes sin los jugadores con apariciones nuevas: los demás
+# conservan su pronóstico y los afectados se recalculan en vivo al pedirlos
+def descartar_pronosticos(tabla, player_ids):
+    return tabla[~tabla.index.isin(list(player_ids))]
+
+def _obtener_pool_arima():
+    global _pool_arima
+    with _pool_lock:
+        if _pool_arima is None:
+            _pool_arima = ThreadPoolExecutor(max_workers=2, thread_name_prefix='arima')
+        return _pool_arima
+
+def _pronosticar_en_vivo(player_id, monthly_goals, monthly_assists, future_dates):
+    pool = _obtener_pool_arima()
+    # Con copia del contexto para que los tiempos de cada ajuste cuenten en la petición
+    tarea_goals = pool.submit(contextvars.copy_context().run, pronosticar_serie, player_id, 'goals', monthly_goals)
+    tarea_assists = pool.submit(contextvars.copy_context().run, pronosticar_serie, player_id, 'assists', monthly_assists)
+    return (pd.Series(tarea_goals.result()[1], index=future_dates),
+            pd.Series(tarea_assists.result()[1], index=future_dates))
+
+# Sin datos del jugador (o no en el periodo pedido)
+class SinDatosJugador(LookupError):
+    pass
+
+class ErrorPronostico(Exception):
+    pass
+
+# Datos de la predicción, sin gráficos (los usan la app y la API): nombre, estadísticas,
+# histórico mensual de los últimos years_back años y pronóstico de los próximos meses
+def predicciones_arima(player_id, years_back=2, appearances_path="data/appearances.csv", catalogo=None):
+    # Cargar datos (solo las filas del jugador); FileNotFoundError si no existe appearances
+    catalogo = catalogo_desde_ruta(appearances_path, catalogo)
+    player_df = catalogo.filas(nombre_tabla(appearances_path), 'player_id', player_id, COLUMNAS_SERIES, parse_dates=["date"]).copy()
 
     # Filtrar por jugador
-    player_df = df[df['player_id'] == player_id].copy()
     if player_df.empty:
-        st.warning(f"No hay datos para el jugador con ID {player_id}.")
-        return None
+        raise SinDatosJugador(f"No hay datos para el jugador con ID {player_id}.")
 
     # Obtener nombre del jugador (si players.csv existe)
     try:
-        players_df = pd.read_csv("data/players.csv")
+        players_df = tabla_desde_ruta(os.path.join(os.path.dirname(appearances_path), "players.csv"), ['player_id', 'name'], catalogo=catalogo)
         player_name = players_df[players_df['player_id'] == player_id]['name'].iloc[0] if not players_df[players_df['player_id'] == player_id].empty else f"Jugador {player_id}"
     except FileNotFoundError:
         player_name = f"Jugador {player_id}"
@@ -30,8 +181,9 @@ def plot_predicciones_arima(player_id, years_back=2, appearances_path="data/appe
     ts_df = player_df[['goals', 'assists']]
 
     # Reagrupar por mes
-    monthly_goals = ts_df['goals'].resample('M').sum()
-    monthly_assists = ts_df['assists'].resample('M').sum()
+    with tramo('procesado.series', filas=len(ts_df)):
+        monthly_goals = ts_df['goals'].resample('ME').sum()
+        monthly_assists = ts_df['assists'].resample('ME').sum()
 
     # Filtrar datos históricos según years_back
     last_date = monthly_goals.index.max()
@@ -40,24 +192,20 @@ def plot_predicciones_arima(player_id, years_back=2, appearances_path="data/appe
     monthly_assists_recent = monthly_assists[monthly_assists.index >= start_date]
 
     if monthly_goals_recent.empty or monthly_assists_recent.empty:
-        st.warning(f"No hay datos suficientes en los últimos {years_back} años para el jugador {player_name}.")
-        return None
+        raise SinDatosJugador(f"No hay datos suficientes en los últimos {years_back} años para el jugador {player_name}.")
 
-    # ARIMA y predicción
+    # ARIMA y predicción: tabla del trabajo por lotes si está al día; si no, ajuste en vivo
+    # (goles y asistencias en paralelo, con cache por jugador; years_back solo recorta lo que se dibuja)
     try:
-        model_goals = ARIMA(monthly_goals, order=(10, 1, 10))
-        result_goals = model_goals.fit()
-        forecast_goals = result_goals.forecast(steps=12)
-        future_dates = pd.date_range(start=last_date + pd.offsets.MonthEnd(1), periods=12, freq='M')
-        forecast_goals.index = future_dates
-
-        model_assists = ARIMA(monthly_assists, order=(10, 1, 10))
-        result_assists = model_assists.fit()
-        forecast_assists = result_assists.forecast(steps=12)
-        forecast_assists.index = future_dates
+        future_dates = pd.date_range(start=last_date + pd.offsets.MonthEnd(1), periods=PASOS_PRONOSTICO, freq='ME')
+        precalculado = pronostico_precalculado(player_id, catalogo)
+        if precalculado is not None:
+            forecast_goals = pd.Series(precalculado['goals'].to_numpy(), index=future_dates)
+            forecast_assists = pd.Series(precalculado['assists'].to_numpy(), index=future_dates)
+        else:
+            forecast_goals, forecast_assists = _pronosticar_en_vivo(player_id, monthly_goals, monthly_assists, future_dates)
     except Exception as e:
-        st.error(f"Error al entrenar el modelo ARIMA: {e}")
-        return None
+        raise ErrorPronostico(f"Error al entrenar el modelo ARIMA: {e}") from e
 
     # Calcular estadísticas
     stats = {
@@ -68,6 +216,33 @@ def plot_predicciones_arima(player_id, years_back=2, appearances_path="data/appe
         'avg_assists_per_month': round(monthly_assists.mean(), 2)
     }
 
+    return {
+        'player_name': player_name,
+        'stats': stats,
+        'last_date': last_date,
+        'goals': monthly_goals_recent,
+        'assists': monthly_assists_recent,
+        'forecast_goals': forecast_goals,
+        'forecast_assists': forecast_assists,
+    }
+
+def plot_predicciones_arima(player_id, years_back=2, appearances_path="data/appearances.csv", catalogo=None):
+    try:
+        datos = predicciones_arima(player_id, years_back, appearances_path, catalogo)
+    except FileNotFoundError:
+        st.error("No se encontró el archivo 'data/appearances.csv'.")
+        return None
+    except SinDatosJugador as e:
+        st.warning(str(e))
+        return None
+    except ErrorPronostico as e:
+        st.error(str(e))
+        return None
+
+    player_name, stats, last_date = datos['player_name'], datos['stats'], datos['last_date']
+    monthly_goals_recent, monthly_assists_recent = datos['goals'], datos['assists']
+    forecast_goals, forecast_assists = datos['forecast_goals'], datos['forecast_assists']
+
     # Gráfico de goles con Plotly
     fig_goals = go.Figure()
     fig_goals.add_trace(go.Scatter(
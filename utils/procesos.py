@@ -0,0 +1,37 @@
+# utils/procesos.py
+
+import contextlib
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Pool de procesos para el trabajo de CPU (ajustes ARIMA y de clusters) de quien lo active
+# con usar_procesos, p. ej. las rutas pesadas de la API: en hilos, ese trabajo tiene el GIL y
+# no avanza en paralelo. Sin pool activo se ejecuta en el hilo que llama (app, CLI, tests).
+# Los tramos medidos dentro del proceso no llegan al registro de tiempos de la petición;
+# sí el tramo que envuelve la llamada.
+_pool_actual = contextvars.ContextVar('pool_procesos', default=None)
+
+
+# Con 'spawn' (como en benchmark.py): el proceso que lo crea tiene hilos y un fork podría
+# copiar locks tomados por otros
+def crear_pool_procesos(procesos):
+    return ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+
+
+@contextlib.contextmanager
+def usar_procesos(pool):
+    token = _pool_actual.set(pool)
+    try:
+        yield pool
+    finally:
+        _pool_actual.reset(token)
+
+
+# funcion(*args, **kwargs) en el pool activo (funcion y argumentos deben poder serializarse)
+# o, sin pool, aquí mismo
+def en_proceso(funcion, *args, **kwargs):
+    pool = _pool_actual.get()
+    if pool is None:
+        return funcion(*args, **kwargs)
+    return pool.submit(funcion, *args, **kwargs).result()
@@ -0,0 +1,93 @@
+# utils/pronostico_lote.py
+
+import argparse
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from utils.datos import obtener_catalogo
+from utils.procesado import (CLAVE_PRONOSTICOS_LOTE, PASOS_PRONOSTICO, ajustar_pronostico,
+                             config_pronostico, cargar_series_mensuales)
+
+COLUMNAS_PRONOSTICOS = ['player_id', 'date', 'goals', 'assists', 'orden_goals', 'orden_assists', 'error']
+
+class TiempoAgotado(Exception):
+    pass
+
+def _alarma(signum, frame):
+    raise TiempoAgotado()
+
+def _fila_error(player_id, mensaje):
+    return (player_id, pd.NaT, np.nan, np.nan, None, None, mensaje)
+
+# Se ejecuta en un proceso del pool: ajusta un bloque de jugadores. El límite de tiempo
+# por jugador usa SIGALRM (solo en sistemas que lo tienen); cada fallo queda aislado.
+def _pronosticar_bloque(bloque, timeout_jugador):
+    usar_alarma = bool(timeout_jugador) and hasattr(signal, 'SIGALRM')
+    if usar_alarma:
+        signal.signal(signal.SIGALRM, _alarma)
+
+    filas = []
+    for player_id, ultima_fecha, goals, assists in bloque:
+        try:
+            if usar_alarma:
+                signal.setitimer(signal.ITIMER_REAL, timeout_jugador)
+            orden_goals, pred_goals = ajustar_pronostico(goals)
+            orden_assists, pred_assists = ajustar_pronostico(assists)
+            if usar_alarma:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            fechas = pd.date_range(start=ultima_fecha + pd.offsets.MonthEnd(1), periods=PASOS_PRONOSTICO, freq='ME')
+            filas.extend(zip([player_id] * PASOS_PRONOSTICO, fechas, pred_goals, pred_assists,
+                             [str(orden_goals)] * PASOS_PRONOSTICO, [str(orden_assists)] * PASOS_PRONOSTICO,
+                             [None] * PASOS_PRONOSTICO))
+        except TiempoAgotado:
+            filas.append(_fila_error(player_id, f"Tiempo agotado (>{timeout_jugador}s)"))
+        except Exception as e:
+            filas.append(_fila_error(player_id, str(e)))
+        finally:
+            if usar_alarma:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    return filas
+
+# Pronostica goles y asistencias de todos los jugadores con un pool de procesos y
+# guarda la tabla en data/cache; plot_predicciones_arima la usa mientras esté al día
+def ejecutar_lote(data_path='data', procesos=None, timeout_jugador=60, tam_bloque=25):
+    catalogo = obtener_catalogo(data_path)
+    series = cargar_series_mensuales(catalogo)
+
+    jugadores = []
+    for player_id, serie in series.groupby(level='player_id', sort=True):
+        fechas = serie.index.get_level_values('date')
+        jugadores.append((player_id, fechas.max(), serie['goals'].to_numpy(dtype=float), serie['assists'].to_numpy(dtype=float)))
+    bloques = [jugadores[i:i + tam_bloque] for i in range(0, len(jugadores), tam_bloque)]
+
+    filas = []
+    with ProcessPoolExecutor(max_workers=procesos or os.cpu_count()) as pool:
+        futuros = {pool.submit(_pronosticar_bloque, bloque, timeout_jugador): bloque for bloque in bloques}
+        for futuro in as_completed(futuros):
+            try:
+                filas.extend(futuro.result())
+            except Exception as e:
+                # Un proceso caído solo invalida su bloque
+                filas.extend(_fila_error(player_id, f"Fallo del proceso: {e}") for player_id, *_ in futuros[futuro])
+
+    tabla = pd.DataFrame(filas, columns=COLUMNAS_PRONOSTICOS)
+    tabla['date'] = pd.to_datetime(tabla['date'])
+    tabla = tabla.sort_values(['player_id', 'date']).set_index('player_id')
+    catalogo.guardar_derivado(CLAVE_PRONOSTICOS_LOTE, ['appearances'], tabla, extra=config_pronostico())
+    return tabla
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pronósticos ARIMA de todos los jugadores en paralelo")
+    parser.add_argument('data_path', nargs='?', default='data')
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos del pool (por defecto, todos los núcleos)")
+    parser.add_argument('--timeout', type=float, default=60, help="Segundos máximos por jugador")
+    args = parser.parse_args(argv)
+
+    tabla = ejecutar_lote(args.data_path, procesos=args.procesos, timeout_jugador=args.timeout)
+    errores = tabla['error'].notna()
+    print(f"Pronósticos de {tabla.index[~errores].nunique()} jugadores guardados; {tabla.index[errores].nunique()} con error")
+
+if __name__ == '__main__':
+    main()
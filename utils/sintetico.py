@@ -0,0 +1,199 @@
+# utils/sintetico.py
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Tamaño aproximado del dataset completo de Transfermarkt (escala 1.0)
+TAMANO_COMPLETO = {
+    'clubs': 450,
+    'players': 32000,
+    'games': 70000,
+}
+JUGADORES_POR_LADO = 14
+PARTIDOS_POR_BLOQUE = 20000
+COMPETICIONES = ['GB1', 'ES1', 'IT1', 'L1', 'FR1', 'PO1', 'NL1', 'TR1', 'BE1', 'SC1', 'RU1', 'UKR1', 'GR1', 'DK1']
+POSICIONES = ['Attack', 'Midfield', 'Defender', 'Goalkeeper', 'Missing']
+PROB_POSICIONES = [0.27, 0.32, 0.32, 0.08, 0.01]
+SUB_POSICIONES = {
+    'Attack': ['Centre-Forward', 'Left Winger', 'Right Winger', 'Second Striker'],
+    'Midfield': ['Central Midfield', 'Defensive Midfield', 'Attacking Midfield', 'Left Midfield', 'Right Midfield'],
+    'Defender': ['Centre-Back', 'Left-Back', 'Right-Back'],
+    'Goalkeeper': ['Goalkeeper'],
+    'Missing': ['Missing'],
+}
+# Goles y asistencias por partido según posición (Attack, Midfield, Defender, Goalkeeper, Missing)
+TASA_GOLES = np.array([0.30, 0.10, 0.04, 0.0, 0.05])
+TASA_ASISTENCIAS = np.array([0.15, 0.12, 0.05, 0.005, 0.05])
+NOMBRES = ['Lucas', 'Mateo', 'Hugo', 'Leo', 'Martin', 'Daniel', 'Pablo', 'Alex', 'Adrian', 'Diego',
+           'Marco', 'Luca', 'Noah', 'Liam', 'Jonas', 'Felix', 'Omar', 'Yusuf', 'Kenji', 'Andrei']
+APELLIDOS = ['Garcia', 'Silva', 'Muller', 'Rossi', 'Martin', 'Dubois', 'Smith', 'Jansen', 'Kowalski', 'Novak',
+             'Costa', 'Santos', 'Ivanov', 'Yilmaz', 'Larsen', 'Moreau', 'Bianchi', 'Fernandez', 'Kim', 'Okafor']
+FECHA_INICIO = pd.Timestamp('2012-07-01')
+DIAS = 12 * 365
+
+def tamanos(escala=1.0):
+    return {tabla: max(4, int(round(n * escala))) for tabla, n in TAMANO_COMPLETO.items()}
+
+def _nombres(rng, n):
+    return (pd.Series(np.array(NOMBRES, dtype=object)[rng.integers(0, len(NOMBRES), n)]) + ' '
+            + pd.Series(np.array(APELLIDOS, dtype=object)[rng.integers(0, len(APELLIDOS), n)])).to_numpy()
+
+def generar_clubs(rng, n):
+    club_id = np.sort(rng.choice(np.arange(1, 100 * n + 1), n, replace=False))
+    nombres = [f"FC {apellido} {i}" for i, apellido in enumerate(np.array(APELLIDOS)[rng.integers(0, len(APELLIDOS), n)])]
+    return pd.DataFrame({
+        'club_id': club_id,
+        'club_code': [f"club-{i}" for i in club_id],
+        'name': nombres,
+        'domestic_competition_id': np.array(COMPETICIONES)[rng.integers(0, len(COMPETICIONES), n)],
+        'squad_size': rng.integers(22, 36, n),
+        'stadium_seats': rng.integers(5000, 80000, n),
+        'url': [f"https://www.transfermarkt.co.uk/club-{i}/startseite/verein/{i}" for i in club_id],
+    })
+
+def generar_players(rng, n, clubs):
+    posicion = rng.choice(len(POSICIONES), n, p=PROB_POSICIONES)
+    sub_posicion = [SUB_POSICIONES[POSICIONES[p]][i % len(SUB_POSICIONES[POSICIONES[p]])]
+                    for p, i in zip(posicion, rng.integers(0, 5, n))]
+    club = rng.integers(0, len(clubs), n)
+    return pd.DataFrame({
+        'player_id': np.sort(rng.choice(np.arange(1, 20 * n + 1), n, replace=False)),
+        'name': _nombres(rng, n),
+        'current_club_id': clubs['club_id'].to_numpy()[club],
+        'current_club_name': clubs['name'].to_numpy()[club],
+        'country_of_citizenship': np.array(APELLIDOS)[rng.integers(0, len(APELLIDOS), n)],
+        'date_of_birth': (pd.Timestamp('1980-01-01') + pd.to_timedelta(rng.integers(0, 25 * 365, n), unit='D')).strftime('%Y-%m-%d'),
+        'position': np.array(POSICIONES)[posicion],
+        'sub_position': sub_posicion,
+        'foot': rng.choice(['right', 'left', 'both'], n, p=[0.7, 0.25, 0.05]),
+        'height_in_cm': rng.integers(165, 200, n),
+    })
+
+def generar_games(rng, n, clubs):
+    # Local y visitante siempre distintos
+    club_ids = clubs['club_id'].to_numpy()
+    local = rng.integers(0, len(clubs), n)
+    visitante = (local + rng.integers(1, len(clubs), n)) % len(clubs)
+    fechas = FECHA_INICIO + pd.to_timedelta(np.sort(rng.integers(0, DIAS, n)), unit='D')
+    nombres = clubs['name'].to_numpy()
+    return pd.DataFrame({
+        'game_id': np.arange(2_000_000, 2_000_000 + n),
+        'competition_id': clubs['domestic_competition_id'].to_numpy()[local],
+        'season': np.where(fechas.month >= 7, fechas.year, fechas.year - 1),
+        'date': fechas.strftime('%Y-%m-%d'),
+        'home_club_id': club_ids[local],
+        'away_club_id': club_ids[visitante],
+        'home_club_goals': rng.poisson(1.55, n),
+        'away_club_goals': rng.poisson(1.2, n),
+        'home_club_name': nombres[local],
+        'away_club_name': nombres[visitante],
+        'attendance': rng.integers(1000, 80000, n),
+    })
+
+# Alineaciones: JUGADORES_POR_LADO jugadores de la plantilla de cada club por partido
+def generar_appearances(rng, games, players):
+    jugadores = players.sort_values('current_club_id', kind='stable')
+    plantillas = pd.Series(np.arange(len(jugadores))).groupby(jugadores['current_club_id'].to_numpy()).agg(['min', 'size'])
+    clubs_partido = np.concatenate([games['home_club_id'].to_numpy(), games['away_club_id'].to_numpy()])
+    partidos = np.concatenate([np.arange(len(games))] * 2)
+
+    inicio = plantillas['min'].reindex(clubs_partido).fillna(-1).to_numpy(dtype=int)
+    tamano = plantillas['size'].reindex(clubs_partido).fillna(0).to_numpy(dtype=int)
+    con_plantilla = tamano > 0
+    inicio, tamano = inicio[con_plantilla], tamano[con_plantilla]
+    partidos, clubs_partido = partidos[con_plantilla], clubs_partido[con_plantilla]
+
+    filas = np.repeat(inicio, JUGADORES_POR_LADO) + (rng.random(len(inicio) * JUGADORES_POR_LADO) * np.repeat(tamano, JUGADORES_POR_LADO)).astype(int)
+    partido = np.repeat(partidos, JUGADORES_POR_LADO)
+    club = np.repeat(clubs_partido, JUGADORES_POR_LADO)
+    unico = ~pd.DataFrame({'p': partido, 'f': filas}).duplicated().to_numpy()
+    filas, partido, club = filas[unico], partido[unico], club[unico]
+
+    n = len(filas)
+    posicion = pd.Categorical(jugadores['position'].to_numpy()[filas], categories=POSICIONES).codes
+    titular = rng.random(n) < 0.8
+    game_id = games['game_id'].to_numpy()[partido]
+    player_id = jugadores['player_id'].to_numpy()[filas]
+    return pd.DataFrame({
+        'appearance_id': pd.Series(game_id).astype(str).to_numpy() + '_' + pd.Series(player_id).astype(str).to_numpy(),
+        'game_id': game_id,
+        'player_id': player_id,
+        'player_club_id': club,
+        'player_current_club_id': jugadores['current_club_id'].to_numpy()[filas],
+        'date': games['date'].to_numpy()[partido],
+        'player_name': jugadores['name'].to_numpy()[filas],
+        'competition_id': games['competition_id'].to_numpy()[partido],
+        'yellow_cards': (rng.random(n) < 0.12).astype(int),
+        'red_cards': (rng.random(n) < 0.005).astype(int),
+        'goals': rng.poisson(TASA_GOLES[posicion] * np.where(titular, 1.0, 0.4)),
+        'assists': rng.poisson(TASA_ASISTENCIAS[posicion] * np.where(titular, 1.0, 0.4)),
+        'minutes_played': np.where(titular, rng.choice([90, 90, 90, 75, 60, 85], n), rng.integers(1, 45, n)),
+    })
+
+def _minutos(rng, n):
+    # Algunos eventos en el descuento o la prórroga
+    return np.where(rng.random(n) < 0.05, rng.integers(91, 121, n), rng.integers(1, 91, n))
+
+# Eventos coherentes con las alineaciones: un gol por cada gol marcado, una tarjeta por
+# cada tarjeta y cambios para algunos suplentes
+def generar_game_events(rng, appearances, games):
+    fecha = dict(zip(games['game_id'], games['date']))
+    tipos = []
+    for tipo, veces in [('Goals', appearances['goals'].to_numpy()),
+                        ('Cards', appearances['yellow_cards'].to_numpy() + appearances['red_cards'].to_numpy()),
+                        ('Substitutions', (appearances['minutes_played'].to_numpy() < 45).astype(int))]:
+        filas = np.repeat(np.arange(len(appearances)), veces)
+        tipos.append(pd.DataFrame({
+            'game_id': appearances['game_id'].to_numpy()[filas],
+            'minute': _minutos(rng, len(filas)),
+            'type': tipo,
+            'club_id': appearances['player_club_id'].to_numpy()[filas],
+            'player_id': appearances['player_id'].to_numpy()[filas],
+        }))
+    eventos = pd.concat(tipos, ignore_index=True).sort_values(['game_id', 'minute'], kind='stable')
+    eventos.insert(1, 'date', eventos['game_id'].map(fecha).to_numpy())
+    eventos.insert(0, 'game_event_id', eventos['game_id'].astype(str) + '_' + eventos.groupby('game_id').cumcount().astype(str))
+    return eventos
+
+# Escribe players, clubs, games, appearances y game_events en destino.
+# appearances y game_events se generan y escriben por bloques de partidos, así
+# que escalas grandes (p. ej. 10x) no necesitan tenerlas enteras en memoria.
+def generar_dataset(destino, escala=1.0, semilla=42):
+    rng = np.random.default_rng(semilla)
+    n = tamanos(escala)
+    os.makedirs(destino, exist_ok=True)
+
+    clubs = generar_clubs(rng, n['clubs'])
+    players = generar_players(rng, n['players'], clubs)
+    games = generar_games(rng, n['games'], clubs)
+    clubs.to_csv(os.path.join(destino, 'clubs.csv'), index=False)
+    players.to_csv(os.path.join(destino, 'players.csv'), index=False)
+    games.to_csv(os.path.join(destino, 'games.csv'), index=False)
+
+    filas = {'clubs': len(clubs), 'players': len(players), 'games': len(games), 'appearances': 0, 'game_events': 0}
+    for inicio in range(0, len(games), PARTIDOS_POR_BLOQUE):
+        bloque = games.iloc[inicio:inicio + PARTIDOS_POR_BLOQUE]
+        appearances = generar_appearances(rng, bloque, players)
+        eventos = generar_game_events(rng, appearances, bloque)
+        primero = inicio == 0
+        appearances.to_csv(os.path.join(destino, 'appearances.csv'), index=False, mode='w' if primero else 'a', header=primero)
+        eventos.to_csv(os.path.join(destino, 'game_events.csv'), index=False, mode='w' if primero else 'a', header=primero)
+        filas['appearances'] += len(appearances)
+        filas['game_events'] += len(eventos)
+    return filas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera CSV sintéticos con la forma de los de Transfermarkt")
+    parser.add_argument('destino', help="Carpeta donde escribir los .csv")
+    parser.add_argument('--escala', type=float, default=1.0, help="1.0 = tamaño del dataset completo, 10 = diez veces más")
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    filas = generar_dataset(args.destino, args.escala, args.semilla)
+    for tabla, n in filas.items():
+        print(f"{tabla}: {n} filas")
+
+if __name__ == '__main__':
+    main()
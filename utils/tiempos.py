@@ -0,0 +1,106 @@
+# utils/tiempos.py
+
+import contextlib
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Con TIEMPOS_ACTIVOS=1 se miden todos los tramos del proceso; si no, solo los de las
+# peticiones que abren un registro (p. ej. el panel de tiempos de la app)
+_activo_global = os.environ.get('TIEMPOS_ACTIVOS') == '1'
+_registro_actual = contextvars.ContextVar('registro_tiempos', default=None)
+_tramo_actual = contextvars.ContextVar('tramo_actual', default=None)
+_ids = itertools.count(1)
+
+
+def activar(activo=True):
+    global _activo_global
+    _activo_global = activo
+
+
+# Tramos medidos durante una petición (una ejecución del script de la app, una llamada a la API...)
+class RegistroTiempos:
+    def __init__(self):
+        self.id = next(_ids)
+        self.inicio = time.perf_counter()
+        self.tramos = []
+        self._lock = threading.Lock()
+
+    def agregar(self, fila):
+        with self._lock:
+            self.tramos.append(fila)
+
+    # Tramos en orden de inicio (se registran al terminar, así que los internos llegan antes)
+    def tabla(self):
+        with self._lock:
+            if not self.tramos:
+                return pd.DataFrame(columns=['tramo', 'padre', 'nivel', 'inicio_ms', 'ms', 'error'])
+            return pd.DataFrame(self.tramos).sort_values(['inicio_ms', 'nivel'], kind='stable').reset_index(drop=True)
+
+
+class _Tramo:
+    __slots__ = ('nombre', 'campos', 'registro', 'padre', 'nivel', 'inicio', '_token')
+
+    def __init__(self, nombre, registro, campos):
+        self.nombre = nombre
+        self.registro = registro
+        self.campos = campos
+
+    def __enter__(self):
+        padre = _tramo_actual.get()
+        self.padre = padre.nombre if padre is not None else None
+        self.nivel = padre.nivel + 1 if padre is not None else 0
+        self._token = _tramo_actual.set(self)
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        ms = (time.perf_counter() - self.inicio) * 1000
+        _tramo_actual.reset(self._token)
+        inicio_ms = (self.inicio - self.registro.inicio) * 1000 if self.registro is not None else None
+        fila = {'tramo': self.nombre, 'padre': self.padre, 'nivel': self.nivel, 'inicio_ms': inicio_ms, 'ms': ms,
+                'error': tipo.__name__ if tipo is not None else None, **self.campos}
+        if self.registro is not None:
+            self.registro.agregar(fila)
+        # Línea estructurada: clave=valor, una por tramo
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(' '.join([f"peticion={self.registro.id if self.registro is not None else '-'}"]
+                                 + [f"{clave}={valor:.2f}" if clave in ('ms', 'inicio_ms') else f"{clave}={valor}"
+                                    for clave, valor in fila.items() if valor is not None]))
+        return False
+
+
+_SIN_MEDIR = contextlib.nullcontext()
+
+
+# with tramo('clustering.kmeans', filas=len(X)): ...
+# Sin registro abierto ni TIEMPOS_ACTIVOS no mide nada (devuelve un contexto vacío compartido)
+def tramo(nombre, **campos):
+    registro = _registro_actual.get()
+    if registro is None and not _activo_global:
+        return _SIN_MEDIR
+    return _Tramo(nombre, registro, campos)
+
+
+# Abre un registro para lo que queda de la ejecución actual (el script de Streamlit se
+# vuelve a ejecutar en cada interacción); con activo=False deja de medir
+def nueva_peticion(activo=True):
+    registro = RegistroTiempos() if activo else None
+    _registro_actual.set(registro)
+    return registro
+
+
+@contextlib.contextmanager
+def peticion():
+    registro = RegistroTiempos()
+    token = _registro_actual.set(registro)
+    try:
+        yield registro
+    finally:
+        _registro_actual.reset(token)